@@ -0,0 +1,145 @@
+"""
+HID report framing benchmark.
+
+Compares the list based framing DeviceHid used before with the current preallocated one
+for a 4 KB message, without a reader attached.
+
+    python benchmarks/bench_hid.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pysisoulnfc import speedups
+from pysisoulnfc.device import DeviceHid
+
+CID = [0x11, 0x22, 0x33, 0x44]
+PAYLOAD_SIZE = 4096
+NUMBER = 200
+
+
+class _LoopbackHid:
+    """
+    Stand-in for hid.device: keeps the reports written and plays them back on read.
+    """
+    
+    def __init__(self):
+        self.reports = []
+        self._pos = 0
+    
+    def open(self, vid, pid, serial):
+        pass
+    
+    def close(self):
+        pass
+    
+    def write(self, buf):
+        buf = bytes(buf)
+        if buf[4] == 0x86:  # channel init
+            self.reports.append(list(bytes(15) + bytes(CID)))
+        else:
+            self.reports.append(list(buf))
+        return len(buf)
+    
+    def read(self, size, timeout=0):
+        r = self.reports[self._pos]
+        self._pos += 1
+        return r
+    
+    def rewind(self):
+        self._pos = 0
+
+
+def legacy_write(device, cid, data):
+    length = len(data)
+    hid_msg = [0xD0, ] + list(length.to_bytes(2, 'big')) + list(data)
+    seq = 0
+    while len(hid_msg) > 0:
+        hid_msg = cid + hid_msg
+        if len(hid_msg) > 64:
+            send_msg = hid_msg[:64]
+            hid_msg = [seq, ] + hid_msg[64:]
+            seq += 1
+            if seq > 127:
+                seq = 0
+        else:
+            send_msg = hid_msg[:]
+            hid_msg.clear()
+        if sys.platform.startswith('win'):
+            send_msg = [0x00, ] + send_msg
+        device.write(send_msg)
+
+
+class LegacyReader:
+    def __init__(self, device, cid):
+        self._device = device
+        self._cid = cid
+        self._buf = bytes()
+        self._length = 0
+    
+    def read(self):
+        r = self._device.read(64, 30)
+        if r[:4] != self._cid:
+            return
+        if self._length == 0:
+            if r[4] != 0xD0:
+                return
+            self._length = int.from_bytes(bytes(r[5:7]), 'big')
+            self._buf = bytes(r[7:])
+        else:
+            self._buf += bytes(r[5:])
+        if len(self._buf) < self._length:
+            return
+        buf = self._buf[:self._length]
+        self._buf = []
+        self._length = 0
+        return buf
+
+
+def _report(name, seconds):
+    per_call = seconds / NUMBER * 1e6
+    print('{:<22}{:>10.1f} us/message{:>10.1f} MB/s'.format(name, per_call, PAYLOAD_SIZE / per_call))
+    return per_call
+
+
+def main():
+    data = os.urandom(PAYLOAD_SIZE)
+    
+    fake = _LoopbackHid()
+    legacy_write(fake, CID, data)
+    legacy_reports = len(fake.reports)
+    legacy_reader = LegacyReader(fake, CID)
+    
+    def legacy_read():
+        fake.rewind()
+        for _ in range(legacy_reports - 1):
+            legacy_reader.read()
+        assert legacy_reader.read() == data
+    
+    dev = DeviceHid('bench', 0, 0)
+    dev._device = loop = _LoopbackHid()
+    dev.open()
+    loop.reports.clear()
+    dev.write(data)
+    reports = len(loop.reports)
+    
+    def current_read():
+        loop.rewind()
+        for _ in range(reports - 1):
+            dev.read()
+        assert dev.read() == data
+    
+    print('speedups: ' + speedups.IMPLEMENTATION)
+    print('payload: {} bytes, {} reports'.format(PAYLOAD_SIZE, reports))
+    old = _report('legacy write', timeit.timeit(lambda: legacy_write(_LoopbackHid(), CID, data), number=NUMBER))
+    new = _report('DeviceHid.write', timeit.timeit(lambda: dev.write(data), number=NUMBER))
+    print('{:<22}{:>10.1f}x'.format('gain', old / new))
+    old = _report('legacy read', timeit.timeit(legacy_read, number=NUMBER))
+    new = _report('DeviceHid.read', timeit.timeit(current_read, number=NUMBER))
+    print('{:<22}{:>10.1f}x'.format('gain', old / new))
+
+
+if __name__ == '__main__':
+    main()
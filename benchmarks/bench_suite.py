@@ -0,0 +1,187 @@
+"""
+Microbenchmarks of the protocol codec and the HID framing, without a reader attached.
+
+Every case is timed for payloads from 0 bytes up to large APDUs. The best of several repeats is kept,
+in nanoseconds per operation. Results can be written as JSON and compared with a baseline written by an
+earlier run, cases slower than the baseline by more than the threshold are flagged and the exit status is 1.
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --save-baseline baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --threshold 0.1
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bench_hid import _LoopbackHid
+from pysisoulnfc import speedups, __version__
+from pysisoulnfc.device import DeviceHid
+from pysisoulnfc.nfc import Command, FrameDecoder, FrameTemplate, Message
+
+# 0: no payload, 128: firmware page, 261: longest short APDU, then extended APDUs.
+SIZES = (0, 16, 128, 261, 1024, 4096, 32768)
+MIN_TIME = 0.02  #: Shortest time(s) of one repeat.
+REPEAT = 5
+
+
+def _payload(size):
+    return bytes(i & 0xFF for i in range(size))
+
+
+def _hid_device():
+    dev = DeviceHid('bench', 0, 0)
+    dev._device = loop = _LoopbackHid()
+    dev.open()
+    loop.reports.clear()
+    return dev, loop
+
+
+def cases(sizes=SIZES):
+    """
+    :return: list of (name, size, function to time)
+    """
+    result = list()
+    for size in sizes:
+        payload = _payload(size)
+        frame = Message.response('nfc', 'apdu_transfer', 0, payload).encode()
+        
+        result.append(('message_encode', size,
+                       lambda p=payload: Message.command('nfc', 'apdu_transfer', payload=p).encode()))
+        # the payload changes on every call, as for the APDUs of a transaction.
+        tpl = FrameTemplate('nfc', 'apdu_transfer')
+        payloads = itertools.cycle((payload, bytes(b ^ 0xFF for b in payload)))
+        result.append(('template_encode', size, lambda t=tpl, p=payloads: (t.set_payload(next(p)), t.frame())))
+        result.append(('message_decode', size, lambda f=frame: Message.from_bytes(f).decode()))
+        result.append(('check_complete_bytes', size, lambda f=frame: Message.from_bytes(f).check_complete_bytes()))
+        result.append(('make_bcc', size, lambda f=frame: Message._make_bcc(f)))
+        
+        decoder = FrameDecoder()
+        result.append(('frame_decoder', size, lambda f=frame, d=decoder: [bytes(m) for m in d.feed(f)]))
+        
+        dev, loop = _hid_device()
+        result.append(('hid_fragment', size, lambda d=dev, lp=loop, f=frame: (d.write(f), lp.reports.clear())))
+        
+        dev, loop = _hid_device()
+        dev.write(frame)
+        count = len(loop.reports)
+        
+        def reassemble(d=dev, lp=loop, n=count):
+            lp.rewind()
+            for i in range(n):
+                d.read()
+        
+        result.append(('hid_reassemble', size, reassemble))
+    
+    # a Mifare Classic dump, the block number changes on every call.
+    blocks = range(64)
+    result.append(('message_params', 0, lambda: [Message.command('nfc', 'mfc_read', blk.to_bytes(1, 'little'),
+                                                                 b'\x00').encode() for blk in blocks]))
+    tpl = FrameTemplate('nfc', 'mfc_read')
+    result.append(('template_params', 0, lambda t=tpl: [(t.set_param1(blk), t.frame()) for blk in blocks]))
+    
+    uid = b'\x04\x11\x22\x33\x44\x55\x66'
+    disc = bytes((0x21, 0x10, 0x02, 0x00, len(uid))) + uid
+    result.append(('nfc_discovery_decode', len(disc), lambda: Command.NfcDiscovery(disc).decode()))
+    return result
+
+
+def measure(func, min_time=MIN_TIME, repeat=REPEAT) -> dict:
+    """
+    :return: ns_per_op(best repeat), number(calls per repeat) and repeat.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    best = min(timer.repeat(repeat, number))
+    return dict(ns_per_op=best / number * 1e9, number=number, repeat=repeat)
+
+
+def run(sizes=SIZES, name_filter=None, min_time=MIN_TIME, repeat=REPEAT) -> dict:
+    results = dict()
+    for name, size, func in cases(sizes):
+        key = '%s[%d]' % (name, size)
+        if name_filter and name_filter not in key:
+            continue
+        results[key] = measure(func, min_time, repeat)
+    return dict(meta=dict(version=__version__, speedups=speedups.IMPLEMENTATION,
+                          python=platform.python_version(), implementation=platform.python_implementation(),
+                          machine=platform.machine(), platform=platform.platform(), time=time.time()),
+                results=results)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    :return: list of (key, baseline ns, current ns, ratio, flag) where flag is 'REGRESSION', 'faster' or ''.
+    """
+    rows = list()
+    base = baseline.get('results', {})
+    for key, r in sorted(results['results'].items()):
+        b = base.get(key)
+        if b is None:
+            rows.append((key, None, r['ns_per_op'], None, 'new'))
+            continue
+        ratio = r['ns_per_op'] / b['ns_per_op']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        rows.append((key, b['ns_per_op'], r['ns_per_op'], ratio, flag))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pysisoulnfc microbenchmarks')
+    parser.add_argument('--output', help='write the results as JSON to this file, - for stdout')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--save-baseline', help='write the results as a new baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown flagged as a regression(0.1 = 10%%)')
+    parser.add_argument('--filter', help='only the cases whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='shorter runs, for a smoke test')
+    args = parser.parse_args(argv)
+    
+    min_time, repeat = (0.002, 2) if args.quick else (MIN_TIME, REPEAT)
+    results = run(name_filter=args.filter, min_time=min_time, repeat=repeat)
+    out = sys.stderr if args.output == '-' else sys.stdout
+    
+    out.write('speedups: %s, python %s\n' % (results['meta']['speedups'], results['meta']['python']))
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        out.write('%-30s %12s %12s %8s\n' % ('case', 'baseline ns', 'ns', 'ratio'))
+        for key, b, ns, ratio, flag in rows:
+            out.write('%-30s %12s %12.0f %8s %s\n' % (key, '-' if b is None else '%.0f' % b, ns,
+                                                      '-' if ratio is None else '%.2f' % ratio, flag))
+            if flag == 'REGRESSION':
+                status = 1
+    else:
+        out.write('%-30s %12s\n' % ('case', 'ns'))
+        for key, r in sorted(results['results'].items()):
+            out.write('%-30s %12.0f\n' % (key, r['ns_per_op']))
+    
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
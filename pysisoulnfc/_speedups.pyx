@@ -0,0 +1,170 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""
+Compiled versions of the helpers in :mod:`pysisoulnfc.speedups`.
+"""
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from libc.string cimport memcpy, memset
+
+DEF HID_CMD = 0xD0
+DEF HID_SEQ_MAX = 0x7F
+
+
+def bcc(data, unsigned char initial=0):
+    cdef const unsigned char[:] d
+    cdef list items
+    cdef Py_ssize_t i
+    cdef unsigned char r = initial
+    if data is None:
+        raise TypeError('data is None')
+    # a list of ints is XORed item by item, as the pure Python version does.
+    if type(data) is list:
+        items = <list>data
+        for i in range(len(items)):
+            r ^= <unsigned char>items[i]
+        return r
+    d = data
+    for i in range(d.shape[0]):
+        r ^= d[i]
+    return r
+
+
+def pack_header(unsigned char t, unsigned char gid, unsigned char cid, unsigned int length,
+                unsigned char param1=0, unsigned char param2=0):
+    cdef unsigned char buf[9]
+    cdef Py_ssize_t n = 4
+    buf[0] = t
+    buf[1] = gid
+    buf[2] = cid
+    buf[3] = param1
+    if t == 0x01:
+        buf[4] = param2
+        n = 5
+    buf[n] = length & 0xFF
+    buf[n + 1] = (length >> 8) & 0xFF
+    buf[n + 2] = (length >> 16) & 0xFF
+    buf[n + 3] = (length >> 24) & 0xFF
+    return PyBytes_FromStringAndSize(<char *> buf, n + 4)
+
+
+cdef inline unsigned int _le32(const unsigned char[:] b, Py_ssize_t pos):
+    return b[pos] | (b[pos + 1] << 8) | (b[pos + 2] << 16) | (<unsigned int> b[pos + 3] << 24)
+
+
+def unpack_header(const unsigned char[:] b not None):
+    cdef Py_ssize_t size = b.shape[0]
+    if size < 8 or (b[0] == 0x01 and size < 9):
+        raise ValueError('Header is too short')
+    if b[0] == 0x01:
+        return b[0], b[1], b[2], b[3], b[4], _le32(b, 5), 9
+    return b[0], b[1], b[2], b[3], None, _le32(b, 4), 8
+
+
+cpdef Py_ssize_t hid_report_count(Py_ssize_t length, Py_ssize_t report_size=64):
+    cdef Py_ssize_t first = report_size - 7
+    cdef Py_ssize_t rest = report_size - 5
+    if length <= first:
+        return 1
+    return 1 + (length - first + rest - 1) // rest
+
+
+def hid_fragment(unsigned char[:] out not None, const unsigned char[:] cid not None,
+                 const unsigned char[:] data not None, Py_ssize_t report_size=64, Py_ssize_t prefix=0):
+    cdef Py_ssize_t length = data.shape[0]
+    cdef Py_ssize_t count = hid_report_count(length, report_size)
+    cdef Py_ssize_t stride = prefix + report_size
+    cdef Py_ssize_t pos = prefix
+    cdef Py_ssize_t sent, n
+    cdef unsigned char seq = 0
+
+    if cid.shape[0] != 4:
+        raise ValueError('cid must be 4 bytes')
+    if out.shape[0] < count * stride:
+        raise ValueError('out is too small')
+
+    memset(&out[0], 0, count * stride)
+    memcpy(&out[pos], &cid[0], 4)
+    out[pos + 4] = HID_CMD
+    out[pos + 5] = (length >> 8) & 0xFF
+    out[pos + 6] = length & 0xFF
+    n = min(length, report_size - 7)
+    if n > 0:
+        memcpy(&out[pos + 7], &data[0], n)
+    sent = n
+    while sent < length:
+        pos += stride
+        memcpy(&out[pos], &cid[0], 4)
+        out[pos + 4] = seq
+        n = min(length - sent, report_size - 5)
+        memcpy(&out[pos + 5], &data[sent], n)
+        sent += n
+        seq = (seq + 1) & HID_SEQ_MAX
+    return count
+
+
+cdef inline int _byte(list items, const unsigned char[:] r, Py_ssize_t i):
+    if items is not None:
+        return items[i]
+    return r[i]
+
+
+cdef class HidReassembler:
+    cdef bytes _cid
+    cdef bytearray _buf
+    cdef Py_ssize_t _pos
+    cdef unsigned char _seq
+
+    def __init__(self, cid):
+        self._cid = bytes(cid)
+        self._buf = None
+        self._pos = 0
+        self._seq = 0
+
+    def reset(self):
+        self._buf = None
+        self._pos = 0
+        self._seq = 0
+
+    def feed(self, report):
+        cdef const unsigned char[:] r = None
+        cdef const unsigned char[:] c = self._cid
+        cdef unsigned char[:] buf
+        cdef Py_ssize_t start, n, i, length, size = len(report)
+        cdef list items = None
+
+        # hidapi reads a report as a list of ints, it's copied item by item rather than converted to bytes first.
+        if type(report) is list:
+            items = <list>report
+        else:
+            r = report
+        if size < 5 or _byte(items, r, 0) != c[0] or _byte(items, r, 1) != c[1] or _byte(items, r, 2) != c[2] \
+                or _byte(items, r, 3) != c[3]:
+            raise ValueError('cid invalid')
+
+        if self._buf is None:
+            if size < 7 or _byte(items, r, 4) != HID_CMD:
+                raise ValueError('command invalid')
+            length = (_byte(items, r, 5) << 8) | _byte(items, r, 6)
+            self._buf = bytearray(length)
+            start = 7
+        else:
+            if _byte(items, r, 4) != self._seq:
+                self.reset()
+                raise ValueError('sequence invalid')
+            self._seq = (self._seq + 1) & HID_SEQ_MAX
+            start = 5
+
+        buf = self._buf
+        n = min(size - start, buf.shape[0] - self._pos)
+        if n > 0:
+            if items is None:
+                memcpy(&buf[self._pos], &r[start], n)
+            else:
+                for i in range(n):
+                    buf[self._pos + i] = items[start + i]
+            self._pos += n
+        if self._pos < buf.shape[0]:
+            return None
+
+        data = self._buf
+        self.reset()
+        return data
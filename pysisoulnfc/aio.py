@@ -0,0 +1,258 @@
+"""
+asyncio API of SMCP-IV.
+
+:class:`AsyncCommand` has the commands of :class:`pysisoulnfc.nfc.Command`, completed on the event loop::
+
+    cmd = AsyncCommand()
+    await cmd.open(AsyncCommand.get_ports()[0])
+    await cmd.discovery()
+    async for event in cmd.events():
+        if event.name == 'discovery' and event.status == Command.STATUS.SUCCESS:
+            r = await cmd.apdu_tranceive(b'\\x00\\xA4\\x04\\x00\\x07\\xA0\\x00\\x00\\x00\\x03\\x10\\x10')
+
+A command is handed to the writer thread of the reader as soon as the method is called, so the loop never blocks on
+a write to the port, and its response is handed to the loop by the receive thread, no thread waits for it. The reader
+costs its receive thread and its writer thread, the callbacks run on the receive thread instead of a dispatcher thread.
+"""
+import asyncio
+import functools
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pysisoulnfc.dispatch import Dispatcher
+from pysisoulnfc.nfc import Command, Message
+
+#: An event of a reader. name is 'discovery'(data: dict of the card, empty when it is lost), 'error' or
+#: 'reconnect'(see the reconnect parameter of :class:`Command`), data is None for both.
+Event = namedtuple('Event', ('reader', 'name', 'status', 'data'))
+
+try:
+    _running_loop = asyncio.get_running_loop
+except AttributeError:  # Python < 3.7
+    _running_loop = asyncio.get_event_loop
+
+
+class EventStream:
+    """
+    Async iterator of the events of a reader, from :func:`AsyncCommand.events`. It ends when the reader is closed.
+
+    A stream holds maxsize events, a consumer that falls behind loses the oldest ones, counted in :attr:`dropped`.
+    One task reads a stream, call :func:`AsyncCommand.events` again for another.
+    """
+    
+    def __init__(self, maxsize=64, on_close=None):
+        if maxsize < 1:
+            raise ValueError('Size is invalid')
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._waiter = None
+        self._closed = False
+        self._on_close = on_close
+    
+    # called on the loop.
+    def put(self, event: Event) -> None:
+        if self._closed:
+            return
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+        self._items.append(event)
+        self._wake()
+    
+    def end(self) -> None:
+        """
+        Stop the stream once the queued events are read.
+        """
+        self._closed = True
+        self._wake()
+    
+    def close(self) -> None:
+        """
+        Stop the stream now, the queued events are dropped.
+        """
+        self._items.clear()
+        self.end()
+        if self._on_close is not None:
+            self._on_close(self)
+    
+    def _wake(self):
+        w = self._waiter
+        if w is not None and not w.done():
+            w.set_result(None)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self) -> Event:
+        while len(self._items) == 0:
+            if self._closed:
+                raise StopAsyncIteration
+            self._waiter = _running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self._items.popleft()
+
+
+def _chain(source: Future, dest: Future) -> None:
+    e = source.exception()
+    if e is not None:
+        dest.set_exception(e)
+    else:
+        dest.set_result(source.result())
+
+
+def _command(name, method):
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        return self._handoff(self.command.submit, name, *args, **kwargs)
+    return call
+
+
+class AsyncCommand:
+    """
+    The commands of :class:`Command` as awaitables: ``await cmd.mifare_read(4)`` returns what ``mifare_read(4)``
+    returns. A command is sent when the method is called, and keeps running if the awaitable is cancelled.
+
+    The commands are written by a writer thread, in the order the methods are called: a write to a HID, I2C or SPI
+    port is a blocking transfer that would stall the loop.
+    """
+    get_ports = staticmethod(Command.get_ports)
+    
+    def __init__(self, command: Command = None, loop=None, **kwargs):
+        """
+        :param command: The :class:`Command` used, its callbacks are replaced by :func:`open`.
+            If None, one is made with kwargs and callbacks run on the receive thread.
+        :type command: Command
+        :param loop: event loop the commands complete on. If None, the loop running :func:`open`.
+        :param kwargs: parameters of :class:`Command`.
+        """
+        if command is None:
+            kwargs.setdefault('dispatcher', Dispatcher(Dispatcher.INLINE))
+            command = Command(**kwargs)
+        self.command = command
+        self._loop = loop
+        self._streams = list()
+        self._writer = ThreadPoolExecutor(max_workers=1)
+    
+    @property
+    def port(self) -> str:
+        return self.command.port
+    
+    @property
+    def metrics(self):
+        return self.command.metrics
+    
+    def is_connected(self) -> bool:
+        return self.command.is_connected()
+    
+    def priority(self, priority):
+        """
+        Context manager giving a priority to the commands called inside it, see :func:`Command.priority`.
+        Keep the awaits out of it, other tasks would get the priority meanwhile::
+
+            with cmd.priority(Priority.BULK):
+                reads = [cmd.mifare_read(block) for block in range(64)]
+            blocks = await asyncio.gather(*reads)
+        """
+        return self.command.priority(priority)
+    
+    def events(self, maxsize=64) -> EventStream:
+        """
+        :param maxsize: number of events held for a consumer that falls behind.
+        :return: async iterator of the :class:`Event` of the reader, until it's closed.
+        :rtype: EventStream
+        """
+        stream = EventStream(maxsize, self._remove)
+        self._streams.append(stream)
+        return stream
+    
+    def _remove(self, stream):
+        if stream in self._streams:
+            self._streams.remove(stream)
+    
+    def _publish(self, name, status, data=None):
+        # on the receive thread.
+        event = Event(self.command.port, name, status, data)
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # the loop is closed.
+    
+    def _handoff(self, func, *args, **kwargs):
+        # func writes its first command if the reader is free, on the writer thread with the priority of the caller.
+        # Awaitable of the result of the Future returned by func.
+        priority = self.command.scheduler.current()
+        result = Future()
+        
+        def run():
+            try:
+                if priority is None:
+                    f = func(*args, **kwargs)
+                else:
+                    with self.command.priority(priority):
+                        f = func(*args, **kwargs)
+            except Exception as e:
+                result.set_exception(e)
+                return
+            f.add_done_callback(lambda f: _chain(f, result))
+        
+        self._writer.submit(run)
+        return asyncio.wrap_future(result, loop=self._loop)
+    
+    def _put(self, event):
+        for stream in list(self._streams):
+            stream.put(event)
+    
+    async def open(self, port) -> None:
+        """
+        Open the SMCP-IV, see :func:`Command.open`.
+
+        :raise: :class:`IOError`
+        """
+        if self._loop is None:
+            self._loop = _running_loop()
+        self.command.set_callbacks(discovery=lambda status, card: self._publish('discovery', status, card),
+                                   error=lambda status: self._publish('error', status),
+                                   reconnect=lambda serial: self._publish('reconnect', Command.STATUS.SUCCESS))
+        await self._loop.run_in_executor(None, self.command.open, port)
+    
+    async def close(self) -> None:
+        """
+        Close the SMCP-IV, the event streams end.
+        """
+        await self._loop.run_in_executor(None, self.command.close)
+        streams, self._streams = self._streams, list()
+        for stream in streams:
+            stream.end()
+    
+    async def do_download(self, stream, fwdn_callback, timeout=None) -> bool:
+        """
+        Send the firmware to the boot loader, see :func:`Command.do_download`. fwdn_callback is called on the loop.
+        """
+        loop = self._loop
+        forward = None
+        if fwdn_callback is not None:
+            def forward(size):
+                loop.call_soon_threadsafe(fwdn_callback, size)
+        return await self._handoff(self.command.submit, 'do_download', stream, forward, timeout)
+    
+    async def firmware_download(self, stream, fwdn_callback) -> bool:
+        """
+        Download the firmware, see :func:`Command.firmware_download`. fwdn_callback is called on the loop.
+        """
+        r, retries = await self._handoff(self.command._call_async, Message.command('system', 'download'))
+        if r.status != Command.STATUS.GOING_TO_RESET:
+            return False
+        self.command.mode = 0
+        # waiting for the reset and opening the boot loader take a thread for a few seconds.
+        if not await self._loop.run_in_executor(None, self.command._reopen):
+            return False
+        return await self.do_download(stream, fwdn_callback)
+
+
+for _name, _method in list(vars(Command).items()):
+    if getattr(_method, 'operation', None) is not None and _name not in vars(AsyncCommand):
+        setattr(AsyncCommand, _name, _command(_name, _method))
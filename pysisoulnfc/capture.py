@@ -0,0 +1,301 @@
+"""
+Capture everything that crosses a :class:`Device` and play it back without a reader.
+
+A capture file is a 16 byte header followed by records::
+
+    header: magic(4) 'SNFC', version(1), reserved(1), serial length(2), start time(8)
+            followed by the serial number(utf-8)
+    record: time(8), direction(1), transport(1), length(4), followed by the data
+
+All numbers are little endian, times are float64 seconds(start time since the epoch, record time since the
+start of the capture).
+
+:class:`RecordingDevice` wraps a device and writes a capture, :class:`ReplayDevice` plays a capture back
+into :class:`pysisoulnfc.nfc.Command`.
+"""
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from pysisoulnfc.device import Device, DeviceHid, DeviceI2C, DeviceSPI, Error
+
+MAGIC = b'SNFC'
+VERSION = 1
+
+OPEN = 0  #: The device was opened.
+CLOSE = 1  #: The device was closed.
+WRITE = 2  #: Data written to the device.
+READ = 3  #: Data read from the device.
+ERROR = 4  #: The device raised an error, the data is the message.
+WRITE_ERROR = 5  #: The write recorded just before raised an error, the data is the message.
+
+TRANSPORT_OTHER = 0
+TRANSPORT_HID = 1
+TRANSPORT_I2C = 2
+TRANSPORT_SPI = 3
+
+_HEADER = struct.Struct('<4sBxHd')
+_RECORD = struct.Struct('<dBBI')
+
+Record = namedtuple('Record', 'time direction transport data')
+
+
+def transport_of(device: Device) -> int:
+    if isinstance(device, DeviceHid):
+        return TRANSPORT_HID
+    if isinstance(device, DeviceI2C):
+        return TRANSPORT_I2C
+    if isinstance(device, DeviceSPI):
+        return TRANSPORT_SPI
+    return TRANSPORT_OTHER
+
+
+class CaptureWriter:
+    def __init__(self, file, serial=''):
+        """
+        :param file: path or binary stream. A stream isn't closed by :func:`close`.
+        :param serial: serial number of the captured device.
+        :type serial: str
+        """
+        if isinstance(file, str):
+            self._file = open(file, 'wb')
+            self._owner = True
+        else:
+            self._file = file
+            self._owner = False
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        b = serial.encode('utf-8')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, len(b), time.time()) + b)
+        self.count = 0
+    
+    def write(self, direction: int, transport: int, data=b'') -> None:
+        """
+        Append a record.
+
+        :param direction: :data:`OPEN`, :data:`CLOSE`, :data:`WRITE`, :data:`READ`, :data:`ERROR` or
+            :data:`WRITE_ERROR`
+        :param transport: ``TRANSPORT_*``
+        :param data: bytes-like object.
+        :return: None
+        """
+        head = _RECORD.pack(time.perf_counter() - self._start, direction, transport, len(data))
+        with self._lock:
+            self._file.write(head)
+            if len(data) > 0:
+                self._file.write(data)
+            self.count += 1
+    
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._owner:
+                self._file.close()
+            else:
+                self._file.flush()
+
+
+def read_capture(file) -> tuple:
+    """
+    Read a capture.
+
+    :param file: path or binary stream.
+    :return: (serial, start time, list of :class:`Record`)
+    :rtype: tuple
+    :raise: :class:`ValueError` if the file isn't a capture.
+    """
+    if isinstance(file, str):
+        with open(file, 'rb') as f:
+            return read_capture(f)
+    
+    head = file.read(_HEADER.size)
+    if len(head) < _HEADER.size:
+        raise ValueError('Capture is too short')
+    magic, version, serial_len, start = _HEADER.unpack(head)
+    if magic != MAGIC:
+        raise ValueError('Not a capture')
+    if version != VERSION:
+        raise ValueError('Capture version(%d) is not supported' % version)
+    serial = file.read(serial_len).decode('utf-8')
+    
+    records = list()
+    while True:
+        head = file.read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            break
+        t, direction, transport, length = _RECORD.unpack(head)
+        data = file.read(length)
+        if len(data) < length:
+            break  # capture cut short, the last record is dropped.
+        records.append(Record(t, direction, transport, data))
+    return serial, start, records
+
+
+class RecordingDevice(Device):
+    """
+    Wrap a device and capture everything written to and read from it.
+    A recording device can be given to :func:`pysisoulnfc.nfc.Command.open` in place of the wrapped device.
+    """
+    
+    def __init__(self, device: Device, file):
+        """
+        :param device: device to capture.
+        :param file: path or binary stream of the capture.
+        """
+        self.device = device
+        self.serial = device.serial
+        self.transport = transport_of(device)
+        self.writer = CaptureWriter(file, device.serial)
+    
+    def open(self):
+        try:
+            self.device.open()
+        except (Error, IOError) as e:
+            self.writer.write(ERROR, self.transport, str(e).encode('utf-8'))
+            raise
+        self.writer.write(OPEN, self.transport)
+    
+    def close(self):
+        self.device.close()
+        self.writer.write(CLOSE, self.transport)
+        self.writer.close()
+    
+    def write(self, data: bytes):
+        self.writer.write(WRITE, self.transport, data)
+        try:
+            return self.device.write(data)
+        except (Error, IOError) as e:
+            self.writer.write(WRITE_ERROR, self.transport, str(e).encode('utf-8'))
+            raise
+    
+    def read(self):
+        try:
+            buf = self.device.read()
+        except (Error, IOError) as e:
+            self.writer.write(ERROR, self.transport, str(e).encode('utf-8'))
+            raise
+        if buf is not None and len(buf) > 0:
+            self.writer.write(READ, self.transport, buf)
+        return buf
+    
+    def expect(self, seconds) -> None:
+        self.device.expect(seconds)
+    
+    def reset_pending(self) -> None:
+        self.device.reset_pending()
+
+
+class ReplayDevice(Device):
+    """
+    Play a capture back as a device.
+
+    Reads return the captured data in order. The data that was read after the n-th write of the capture is
+    only returned after the n-th write to the replay device, so responses never come before their
+    command. An error in the capture is raised again as :class:`IOError`, from :func:`write` if that write
+    failed, otherwise from :func:`read`.
+    """
+    READ_TIMEOUT = 0.05  #: Longest time(s) :func:`read` blocks before it returns None.
+    
+    def __init__(self, file, realtime=False, speed=1.0, strict=False, read_timeout=READ_TIMEOUT):
+        """
+        :param file: path or binary stream of a capture.
+        :param realtime: If True, the time between records is kept, otherwise they are played as fast as possible.
+        :type realtime: bool
+        :param speed: With realtime, 2.0 plays twice as fast.
+        :type speed: float
+        :param strict: If True, writes that differ from the capture raise :class:`Error`,
+            otherwise they are counted in :attr:`mismatches`.
+        :type strict: bool
+        :param read_timeout: Longest time(s) :func:`read` blocks before it returns None.
+        :type read_timeout: float
+        """
+        if speed <= 0:
+            raise ValueError('Speed is invalid')
+        self.serial, self.start_time, records = read_capture(file)
+        self.realtime = realtime
+        self.speed = speed
+        self.strict = strict
+        self.read_timeout = read_timeout
+        self.mismatches = 0
+        
+        # (record, writes needed before it is played, time of the write it follows)
+        self._writes = [r for r in records if r.direction == WRITE]
+        self._write_errors = dict()  # number of writes -> message of the error raised by the last of them
+        self._reads = list()
+        writes = 0
+        anchor = records[0].time if len(records) > 0 else 0.0
+        for r in records:
+            if r.direction == WRITE:
+                writes += 1
+                anchor = r.time
+            elif r.direction == WRITE_ERROR:
+                self._write_errors[writes] = bytes(r.data).decode('utf-8', 'replace')
+            elif r.direction in (READ, ERROR):
+                self._reads.append((r, writes, anchor))
+        
+        self._cond = threading.Condition()
+        self._reset()
+    
+    def _reset(self):
+        self._write_pos = 0
+        self._read_pos = 0
+        self._gate_time = time.perf_counter()  # when the last write arrived.
+    
+    @property
+    def finished(self) -> bool:
+        """
+        True once every captured read was returned.
+        """
+        return self._read_pos >= len(self._reads)
+    
+    def open(self):
+        with self._cond:
+            self._reset()
+    
+    def close(self):
+        with self._cond:
+            self._read_pos = len(self._reads)
+            self._cond.notify_all()
+    
+    def write(self, data: bytes):
+        with self._cond:
+            pos = self._write_pos
+            if pos < len(self._writes) and bytes(self._writes[pos].data) != bytes(data):
+                if self.strict:
+                    raise Error('Write %d differs from the capture' % pos)
+                self.mismatches += 1
+            self._write_pos = pos + 1
+            self._gate_time = time.perf_counter()
+            self._cond.notify_all()
+        error = self._write_errors.get(pos + 1)
+        if error is not None:
+            raise IOError(error)
+    
+    def read(self):
+        deadline = time.perf_counter() + self.read_timeout
+        with self._cond:
+            while True:
+                if self._read_pos >= len(self._reads):
+                    self._cond.wait(max(0.0, deadline - time.perf_counter()))
+                    return None
+                record, writes, anchor = self._reads[self._read_pos]
+                now = time.perf_counter()
+                if self._write_pos >= writes:
+                    due = self._gate_time + (record.time - anchor) / self.speed if self.realtime else now
+                    if due <= now:
+                        break
+                    wait = min(due, deadline) - now
+                else:
+                    wait = deadline - now
+                if wait <= 0:
+                    return None
+                self._cond.wait(wait)
+            self._read_pos += 1
+        
+        if record.direction == ERROR:
+            raise IOError(bytes(record.data).decode('utf-8', 'replace'))
+        return record.data
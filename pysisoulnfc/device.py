@@ -1,12 +1,18 @@
 import sys
 import random
+import time
 import hid
 
+from collections import deque
+
 from abc import ABCMeta, abstractmethod
 from pyftdi.ftdi import Ftdi, FtdiError
 from pyftdi.i2c import I2cController, I2cPort, I2cGpioPort, I2cNackError, I2cIOError
+from pyftdi.spi import SpiController, SpiIOError
 from usb.core import USBError
 
+from pysisoulnfc.speedups import hid_report_count, hid_fragment, HidReassembler
+
 
 class Error(Exception):
     pass
@@ -14,6 +20,7 @@ class Error(Exception):
 
 class Device(metaclass=ABCMeta):
     serial = ''
+    spans = None  #: :class:`pysisoulnfc.spans.SpanTracer` set by :func:`Command.open`, None if not tracing.
     
     @abstractmethod
     def open(self):
@@ -31,91 +38,182 @@ class Device(metaclass=ABCMeta):
     def read(self):
         pass
     
+    def expect(self, seconds) -> None:
+        """
+        Time(s) the response to the next write should take, called by :class:`Command` before it writes.
+        A port polling for the response polls less often for a slow command.
+
+        :param seconds: expected latency, None if unknown.
+        """
+        self._expected = seconds
+    
+    def reset_pending(self) -> None:
+        """
+        Stop expecting the response of the last write, called by :class:`Command` when it timed out.
+        Reads wait as when idle until the next write.
+        """
+        self._pending = False
+    
     @staticmethod
-    def get_ports(serial=None) -> list:
+    def get_ports(serial=None, spi=False) -> list:
+        """
+        :param serial: serial number of the port to find.
+        :param spi: An FTDI adapter is wired either for I2C or for SPI.
+            If True, FTDI adapters are returned as :class:`DeviceSPI` instead of :class:`DeviceI2C`.
+            A serial ending with '(SPI)' always finds a :class:`DeviceSPI`.
+        :rtype: list
+        """
+        if spi or (serial is not None and serial.endswith(DeviceSPI.SUFFIX)):
+            return DeviceHid.get_ports(serial) + DeviceSPI.get_ports(serial)
         return DeviceHid.get_ports(serial) + DeviceI2C.get_ports(serial)
+    
+    @staticmethod
+    def _find_ftdi(serial, suffix) -> list:
+        """
+        Serial numbers of the FT232H adapters, or only the one for serial if given.
+        """
+        if serial is not None:
+            if not serial.endswith(suffix):
+                return []
+            serial = serial[:-len(suffix)]
+        try:
+            found = Ftdi.find_all([(Ftdi.DEFAULT_VENDOR, 0x6014)], nocache=True)
+        except USBError:
+            return []
+        except ValueError:
+            return []
+        
+        if serial is not None:
+            return [d[2] for d in found if d[2] == serial][:1]
+        return [d[2] for d in found]
 
 
 class DeviceHid(Device):
     _USB_VID = 0x31CB
     _USB_PID = [0x00A1, 0x00A2]
-    _buf = bytes()
-    _length = 0
+    _REPORT_SIZE = 64
+    
+    READ_TIMEOUT = 30  #: Read timeout(ms) while a response is expected.
+    IDLE_TIMEOUT = 250  #: Longest read timeout(ms) while idle.
     
-    def __init__(self, serial, vid, pid):
+    def __init__(self, serial, vid, pid, report_size=_REPORT_SIZE, read_timeout=READ_TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, adaptive=True):
         self.serial = serial
         self._vid = vid
         self._pid = pid
         self._device = hid.device()
         
         self._cid = None
+        self._reassembler = None
+        
+        self._report_size = report_size
+        self._prefix = 0
+        self._stride = report_size
+        self._reports = bytearray()
+        
+        self._pending = False
+        self._report_errors = dict()
+        self.set_read_timeout(read_timeout, idle_timeout, adaptive)
+    
+    def set_read_timeout(self, read_timeout=READ_TIMEOUT, idle_timeout=IDLE_TIMEOUT, adaptive=True):
+        """
+        Set how long :func:`read` waits for a report.
+        A blocking read returns as soon as a report arrives, so the timeouts only decide how often an
+        empty read comes back to the caller.
+
+        :param read_timeout: Timeout(ms) while a response is expected and right after a report was received.
+        :type read_timeout: int
+        :param idle_timeout: Timeout(ms) while idle.
+        :type idle_timeout: int
+        :param adaptive: If True, the timeout doubles from read_timeout up to idle_timeout on every empty read
+            while idle. If False, idle_timeout is used as soon as nothing is expected.
+        :type adaptive: bool
+        :return: None
+        """
+        if read_timeout < 1 or idle_timeout < read_timeout:
+            raise ValueError('Timeout is invalid')
+        self._read_timeout = read_timeout
+        self._idle_timeout = idle_timeout
+        self._adaptive = adaptive
+        self._timeout = read_timeout
     
     def open(self):
         self._device.open(self._vid, self._pid, self.serial)
         
-        init_cmds = [0xFF, 0xFF, 0xFF, 0xFF, 0x86, 0x00, 0x08]
+        # hidapi on Windows expects the report id in front of every report.
+        self._prefix = 1 if sys.platform.startswith('win') else 0
+        self._stride = self._prefix + self._report_size
+        self._reports = bytearray(self._stride * 8)
+        
+        init_cmds = [0x00, ] * self._prefix + [0xFF, 0xFF, 0xFF, 0xFF, 0x86, 0x00, 0x08]
         for i in range(8):
             init_cmds.append(random.randint(0, 255))
-        if sys.platform.startswith('win'):
-            init_cmds = [0x00, ] + init_cmds
         
         self._device.write(init_cmds)
-        r = self._device.read(64, 30)
+        r = self._device.read(self._report_size, 30)
         if len(r) == 0:
             raise IOError('Open Fail')
         
-        self._cid = r[15:19]
+        self._cid = bytes(r[15:19])
+        self._reassembler = HidReassembler(self._cid)
     
     def close(self):
         self._device.close()
     
     def write(self, data: bytes):
-        length = len(data)
-        hid_msg = [0xD0, ] + list(length.to_bytes(2, 'big')) + list(data)
-        seq = 0
-        while len(hid_msg) > 0:
-            hid_msg = self._cid + hid_msg
-            if len(hid_msg) > 64:
-                send_msg = hid_msg[:64]
-                hid_msg = [seq, ] + hid_msg[64:]
-                seq += 1
-                if seq > 127:
-                    seq = 0
-            else:
-                send_msg = hid_msg[:]
-                hid_msg.clear()
-            if sys.platform.startswith('win'):
-                send_msg = [0x00, ] + send_msg
-            self._device.write(send_msg)
+        self._pending = True
+        self._timeout = self._read_timeout
+        stride = self._stride
+        spans = self.spans
+        if spans is not None:
+            start = spans.now()
+        size = hid_report_count(len(data), self._report_size) * stride
+        if size > len(self._reports):
+            self._reports = bytearray(size)
+        hid_fragment(self._reports, self._cid, data, self._report_size, self._prefix)
+        if spans is not None:
+            fragmented = spans.now()
+            spans.add('hid.fragment', start, fragmented, 'device', dict(reports=size // stride))
+        with memoryview(self._reports) as reports:
+            for pos in range(0, size, stride):
+                self._device.write(reports[pos:pos + stride])
+        if spans is not None:
+            spans.add('hid.write', fragmented, spans.now(), 'device')
     
     def read(self):
-        r = self._device.read(64, 30)
+        r = self._device.read(self._report_size, self._timeout)
         if len(r) <= 0:
+            if not self._pending and self._timeout < self._idle_timeout:
+                if self._adaptive:
+                    self._timeout = min(self._timeout * 2, self._idle_timeout)
+                else:
+                    self._timeout = self._idle_timeout
             return
         
-        # hex_str = [hex(i) for i in r]
-        # print(hex_str)
-        if r[:4] != self._cid:
-            print('cid invalid')
-            return
-        
-        if self._length == 0:
-            if r[4] != 0xD0:
-                print('command invalid')
-                return
-            self._length = int.from_bytes(bytes(r[5:7]), 'big')
-            self._buf = bytes(r[7:])
-        else:
-            self._buf += bytes(r[5:])
-        if len(self._buf) < self._length:
+        self._timeout = self._read_timeout
+        try:
+            buf = self._reassembler.feed(r)
+        except ValueError as e:
+            key = str(e).replace(' ', '_')
+            self._report_errors[key] = self._report_errors.get(key, 0) + 1
             return
-        
-        buf = self._buf[:self._length]
-        self._buf = []
-        self._length = 0
-        
+        if buf is not None:
+            self._pending = False
         return buf
     
+    def stats(self) -> dict:
+        """
+        Reports dropped by :func:`read`.
+
+        :return: cid_invalid: reports of another channel\n
+            command_invalid: first reports that don't start a message\n
+            sequence_invalid: reports out of sequence, the message is dropped
+        :rtype: dict
+        """
+        stats = dict(cid_invalid=0, command_invalid=0, sequence_invalid=0)
+        stats.update(self._report_errors)
+        return stats
+    
     @classmethod
     def get_ports(cls, serial=None):
         
@@ -132,55 +230,149 @@ class DeviceHid(Device):
         return found_ports
 
 
-class DeviceSPI(Device):
+class IrqWait:
+    """
+    Wait for an interrupt line that can only be polled.
+
+    The line is polled back to back ``spin`` times first, then the wait sleeps between polls starting at
+    ``min_sleep`` and doubling up to a cap. While a response is expected the cap is ``fraction`` of its expected
+    latency, kept between ``min_sleep`` and ``idle_sleep``, so a response is read at most about that fraction
+    late. It is ``max_sleep`` when the latency isn't known, and ``idle_sleep`` while idle.
+    Times are in seconds.
+    """
     
-    def __init__(self, vid, pid, serial, iface, desc):
-        self._vid = vid
-        self._pid = pid
-        self._serial = serial
-        self._iface = iface
-        self._desc = desc
+    _cpu_time = getattr(time, 'thread_time', time.process_time)
     
-    def open(self):
-        pass
+    def __init__(self, spin=20, min_sleep=0.0001, max_sleep=0.002, idle_sleep=0.02, fraction=0.1):
+        self.spin = spin
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+        self.idle_sleep = idle_sleep
+        self.fraction = fraction
+        self.reset_stats()
     
-    def close(self):
-        pass
+    def reset_stats(self):
+        self._waits = 0
+        self._timeouts = 0
+        self._polls = 0
+        self._wakeups = 0
+        self._cpu = 0.0
+        self._elapsed = 0.0
     
-    def write(self, data: bytes):
-        pass
+    def stats(self) -> dict:
+        """
+        :return: waits: calls of :func:`wait`\n
+            timeouts: waits that ended without the line asserted\n
+            polls: times the line was read\n
+            wakeups: times the wait slept and woke up again\n
+            cpu_time: CPU time(s) of the waiting threads spent in :func:`wait`\n
+            elapsed: wall time(s) spent in :func:`wait`
+        :rtype: dict
+        """
+        return dict(waits=self._waits, timeouts=self._timeouts, polls=self._polls, wakeups=self._wakeups,
+                    cpu_time=self._cpu, elapsed=self._elapsed)
     
-    def read(self):
-        pass
+    def cap(self, busy=True, expected=None) -> float:
+        """
+        :return: longest sleep(s) between two polls.
+        :rtype: float
+        """
+        if not busy:
+            return self.idle_sleep
+        if expected is None:
+            return self.max_sleep
+        return min(max(expected * self.fraction, self.min_sleep), self.idle_sleep)
     
-    @classmethod
-    def get_ports(cls, serial=None):
-        found_devices = list()
-        
-        found = Ftdi.find_all([(Ftdi.DEFAULT_VENDOR, 0x6014)])
-        for d in found:
-            if serial is not None:
-                if d[2] == serial:
-                    return cls(d[0], d[1], d[2], d[3], d[4])
-                else:
-                    found_devices.append(cls(d[0], d[1], d[2], d[3], d[4]))
-        
-        return found_devices
+    def wait(self, poll, timeout=None, busy=True, expected=None) -> bool:
+        """
+        Wait until poll() returns True.
+
+        :param poll: function that reads the line.
+        :param timeout: longest time to wait. None waits until the line is asserted.
+        :param busy: True while a response is expected.
+        :param expected: time(s) the response is expected to take while busy, None if unknown.
+        :return: True if the line was asserted, False on timeout.
+        :rtype: bool
+        """
+        start = time.monotonic()
+        cpu = self._cpu_time()
+        deadline = None if timeout is None else start + timeout
+        cap = self.cap(busy, expected)
+        sleep = self.min_sleep
+        polls = 0
+        wakeups = 0
+        try:
+            while True:
+                polls += 1
+                if poll():
+                    return True
+                if polls <= self.spin:
+                    continue
+                now = time.monotonic()
+                if deadline is not None:
+                    if now >= deadline:
+                        self._timeouts += 1
+                        return False
+                    sleep = min(sleep, deadline - now)
+                time.sleep(sleep)
+                wakeups += 1
+                sleep = min(sleep * 2, cap)
+        finally:
+            self._waits += 1
+            self._polls += polls
+            self._wakeups += wakeups
+            self._cpu += self._cpu_time() - cpu
+            self._elapsed += time.monotonic() - start
 
 
 class DeviceI2C(Device):
+    SUFFIX = '(I2C)'
     _SLAVE = 0x28
     _IRQ = 6
     
-    def __init__(self, serial):
-        self.serial = serial + '(I2C)'
+    IRQ_TIMEOUT = 0.1  #: Longest time(s) :func:`read` waits for the IRQ before it returns None.
+    FREQUENCY = 1000000  #: Default I2C bus clock(Hz).
+    
+    _HEADER_SIZE = 8
+    _MIN_READ = _HEADER_SIZE + 1
+    _ADAPTIVE_READ = 64
+    
+    def __init__(self, serial, irq_wait: IrqWait = None, irq_timeout=IRQ_TIMEOUT, frequency=FREQUENCY,
+                 read_size: int = None, adaptive=False):
+        """
+        :param serial: serial number of the FTDI device.
+        :param frequency: I2C bus clock(Hz).
+        :param read_size: bytes read in the first transaction of a frame.
+            None reads the header first and the rest in a second transaction.
+        :param adaptive: If True, the first transaction reads the largest of the recent frames, up to read_size
+            (64 bytes if read_size is None).
+            A second transaction is only made when the frame is longer than what was read, the bytes read past
+            the end of a shorter frame are dropped.
+        """
+        self.serial = serial + self.SUFFIX
+        self.frequency = frequency
+        self._url = 'ftdi://::' + serial + '/1'
         self._i2c = I2cController()
-        self._i2c.configure('ftdi://::' + serial + '/1', frequency=1000000)
         
         self._device = None  # type: I2cPort
         self._gpio = None  # type: I2cGpioPort
+        
+        self.irq_wait = irq_wait if irq_wait is not None else IrqWait()
+        self.irq_timeout = irq_timeout
+        self._pending = False
+        self._expected = None
+        
+        if read_size is not None and read_size < self._MIN_READ:
+            raise ValueError('read_size is too small')
+        self._read_size = read_size
+        self._adaptive = adaptive
+        self._recent = deque([self._MIN_READ], maxlen=16)
+        self._reads = 0
+        self._second_reads = 0
     
     def open(self):
+        # configured here and not when the port is listed, so get_ports() doesn't claim the adapter.
+        self._i2c.configure(self._url, frequency=self.frequency)
         self._device = self._i2c.get_port(self._SLAVE)
         self._gpio = self._i2c.get_gpio()
         self._gpio.set_direction((1 << self._IRQ), 0)
@@ -192,6 +384,7 @@ class DeviceI2C(Device):
             pass
     
     def write(self, data: bytes):
+        self._pending = True
         try:
             self._device.write(list(data))
         except FtdiError as e:
@@ -199,35 +392,125 @@ class DeviceI2C(Device):
         except I2cIOError as e:
             raise Error(str(e))
     
+    def _irq(self):
+        return (self._gpio.read() >> self._IRQ) & 1 == 1
+    
+    def _first_read_size(self):
+        if self._adaptive:
+            return min(max(self._recent), self._read_size or self._ADAPTIVE_READ)
+        if self._read_size is not None:
+            return self._read_size
+        return self._HEADER_SIZE
+    
     def read(self):
-        if (self._gpio.read() >> self._IRQ) == 1:
-            r = self._device.read(8)
-            length = int.from_bytes(r[4:8], 'little')
-            r += self._device.read(length + 1)
-            return r.tobytes()
+        if not self.irq_wait.wait(self._irq, self.irq_timeout, self._pending, self._expected):
+            return None
+        
+        r = bytes(self._device.read(self._first_read_size()))
+        length = self._HEADER_SIZE + int.from_bytes(r[4:8], 'little') + 1
+        self._reads += 1
+        if length > len(r):
+            r += bytes(self._device.read(length - len(r)))
+            self._second_reads += 1
+        self._recent.append(length)
+        self._pending = False
+        return r[:length]
+    
+    def stats(self) -> dict:
+        """
+        IRQ wait and read statistics.
+
+        :return: reads: frames read\n
+            second_reads: frames that needed a second transaction\n
+            and the values of :func:`IrqWait.stats`
+        :rtype: dict
+        """
+        stats = self.irq_wait.stats()
+        stats.update(reads=self._reads, second_reads=self._second_reads)
+        return stats
     
     @classmethod
-    def get_ports(cls, serial: str = None):
-        found_devices = []
+    def get_ports(cls, serial: str = None, **kwargs):
+        return [cls(d, **kwargs) for d in Device._find_ftdi(serial, cls.SUFFIX)]
+
+
+class DeviceSPI(Device):
+    """
+    SMCP-IV on the SPI bus of an FTDI FT232H.
+
+    Frames are exchanged the same way as on I2C: the IRQ line tells that a frame is ready, then the header
+    and the rest of the frame are clocked out in a single chip-select cycle. Writes are streamed in one
+    chip-select cycle as well, pyftdi splits them to the size of the FTDI buffer.
+    Transfers are half duplex: SMCP-IV only sends a frame after raising the IRQ line, the bytes clocked in
+    while a command is written carry nothing and aren't read back.
+    """
+    SUFFIX = '(SPI)'
+    _IRQ = 6
+    _HEADER_SIZE = 8
+    
+    IRQ_TIMEOUT = 0.1  #: Longest time(s) :func:`read` waits for the IRQ before it returns None.
+    FREQUENCY = 6000000  #: Default SPI clock(Hz).
+    
+    def __init__(self, serial, irq_wait: IrqWait = None, irq_timeout=IRQ_TIMEOUT, frequency=FREQUENCY, mode=0):
+        self.serial = serial + self.SUFFIX
+        self.frequency = frequency
+        self._url = 'ftdi://::' + serial + '/1'
+        self._mode = mode
+        self._spi = SpiController()
         
-        if serial is not None:
-            if not serial.endswith('(I2C)'):
-                return found_devices
-            serial = serial[:-5]
+        self._port = None  # type: SpiPort
+        self._gpio = None  # type: SpiGpioPort
+        
+        self.irq_wait = irq_wait if irq_wait is not None else IrqWait()
+        self.irq_timeout = irq_timeout
+        self._pending = False
+        self._expected = None
+    
+    def open(self):
         try:
-            found = Ftdi.find_all([(Ftdi.DEFAULT_VENDOR, 0x6014)], nocache=True)
-        except USBError:
-            return found_devices
-        except ValueError:
-            return found_devices
-        
-        for d in found:
-            if serial is not None:
-                if d[2] == serial:
-                    found_devices.append(cls(d[2]))
-                    return found_devices
-            
-            else:
-                found_devices.append(cls(d[2]))
-        
-        return found_devices
+            self._spi.configure(self._url, frequency=self.frequency)
+            self._port = self._spi.get_port(0, freq=self.frequency, mode=self._mode)
+            self._gpio = self._spi.get_gpio()
+            self._gpio.set_direction((1 << self._IRQ), 0)
+        except (FtdiError, USBError, ValueError) as e:
+            raise IOError('Open Fail: ' + str(e))
+    
+    def close(self):
+        try:
+            self._spi.terminate()
+        except FtdiError:
+            pass
+    
+    def write(self, data: bytes):
+        self._pending = True
+        try:
+            self._port.write(data)
+        except SpiIOError as e:
+            raise Error(str(e))
+        except FtdiError as e:
+            raise Error(str(e))
+    
+    def _irq(self):
+        return (self._gpio.read() >> self._IRQ) & 1 == 1
+    
+    def read(self):
+        if not self.irq_wait.wait(self._irq, self.irq_timeout, self._pending, self._expected):
+            return None
+        
+        r = bytes(self._port.read(self._HEADER_SIZE, stop=False))
+        length = int.from_bytes(r[4:8], 'little')
+        r += bytes(self._port.read(length + 1, start=False))
+        self._pending = False
+        return r
+    
+    def stats(self) -> dict:
+        """
+        IRQ wait statistics.
+
+        .. seealso:: :func:`IrqWait.stats`
+        """
+        return self.irq_wait.stats()
+    
+    @classmethod
+    def get_ports(cls, serial: str = None, **kwargs):
+        return [cls(d, **kwargs) for d in Device._find_ftdi(serial, cls.SUFFIX)]
@@ -0,0 +1,222 @@
+"""
+Run the event callbacks away from the thread that reads the SMCP-IV.
+
+Every callback has its own bounded queue(channel), so a slow discovery callback never delays the error
+callback and a consumer that falls behind loses old events instead of memory.
+"""
+import logging
+import threading
+from collections import deque
+
+_logger = logging.getLogger(__name__)
+
+
+class _Channel:
+    __slots__ = ('items', 'running', 'max_depth', 'submitted', 'executed', 'dropped', 'coalesced', 'errors')
+    
+    def __init__(self):
+        self.items = deque()
+        self.running = 0
+        self.max_depth = 0
+        self.submitted = 0
+        self.executed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+
+
+class Dispatcher:
+    INLINE = 'inline'  #: Callbacks run on the thread that submits them.
+    THREAD = 'thread'  #: Callbacks run one at a time on a single worker thread.
+    POOL = 'pool'  #: Callbacks run on a pool of worker threads.
+    
+    DROP_OLDEST = 'drop_oldest'  #: A full channel drops its oldest event.
+    DROP_NEWEST = 'drop_newest'  #: A full channel drops the new event.
+    COALESCE = 'coalesce'  #: An event removes the queued event with the same key, otherwise like DROP_OLDEST.
+    
+    def __init__(self, mode=THREAD, workers=4, maxsize=64, policy=DROP_OLDEST, ordered=True):
+        """
+        :param mode: :attr:`INLINE`, :attr:`THREAD` or :attr:`POOL`.
+        :type mode: str
+        :param workers: Number of worker threads for :attr:`POOL`.
+        :type workers: int
+        :param maxsize: Number of events a channel holds.
+        :type maxsize: int
+        :param policy: What a full channel does: :attr:`DROP_OLDEST`, :attr:`DROP_NEWEST` or :attr:`COALESCE`.
+        :type policy: str
+        :param ordered: If True, the events of a channel are run one at a time in order.
+            If False, they can run in parallel on the pool, so a slow call doesn't hold back the next event.
+        :type ordered: bool
+        """
+        if mode not in (self.INLINE, self.THREAD, self.POOL):
+            raise ValueError('Mode is invalid')
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.COALESCE):
+            raise ValueError('Policy is invalid')
+        if workers < 1 or maxsize < 1:
+            raise ValueError('Size is invalid')
+        self.mode = mode
+        self.workers = workers if mode == self.POOL else 1
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ordered = ordered
+        
+        self._channels = dict()
+        self._names = list()  # round robin order of the channels.
+        self._next = 0
+        self._cond = threading.Condition()
+        self._threads = list()
+        self._closed = True
+    
+    def _channel(self, name) -> _Channel:
+        ch = self._channels.get(name)
+        if ch is None:
+            ch = self._channels[name] = _Channel()
+            self._names.append(name)
+        return ch
+    
+    def start(self) -> None:
+        """
+        Start the worker threads.
+
+        :return: None
+        """
+        with self._cond:
+            if not self._closed:
+                return
+            self._closed = False
+        if self.mode == self.INLINE:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_thread)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+    
+    def close(self, drain=False, timeout=None) -> None:
+        """
+        Stop the worker threads. Workers waiting for events wake up at once,
+        a callback already running is waited for.
+
+        :param drain: If True, the queued events are run before the workers stop, otherwise they are dropped.
+        :type drain: bool
+        :param timeout: Time(s) to wait for each worker.
+        :type timeout: float
+        :return: None
+        """
+        with self._cond:
+            self._closed = True
+            if not drain:
+                for ch in self._channels.values():
+                    ch.dropped += len(ch.items)
+                    ch.items.clear()
+            self._cond.notify_all()
+        current = threading.current_thread()
+        for t in self._threads:
+            if t is not current:
+                t.join(timeout)
+        self._threads = list()
+    
+    def submit(self, name, func, *args, key=None, replaces=None) -> bool:
+        """
+        Queue a call of func in the channel name.
+
+        :param name: channel, usually the name of the callback.
+        :param func: callable. Nothing is queued if func isn't callable.
+        :param args: arguments of func.
+        :param key: with :attr:`COALESCE`, only the latest event of a key stays queued.
+        :param replaces: key of the queued events this one makes stale, whatever the policy. They are removed
+            and counted as coalesced, so the event runs ahead of them, ex. a card lost ahead of its discoveries.
+        :return: False if the event was dropped.
+        :rtype: bool
+        """
+        if not callable(func):
+            return False
+        if self.mode == self.INLINE:
+            with self._cond:
+                ch = self._channel(name)
+                ch.submitted += 1
+            self._run(ch, func, args)
+            return True
+        
+        with self._cond:
+            if self._closed:
+                return False
+            ch = self._channel(name)
+            ch.submitted += 1
+            items = ch.items
+            if replaces is not None and len(items) > 0:
+                kept = [item for item in items if item[0] != replaces]
+                ch.coalesced += len(items) - len(kept)
+                items.clear()
+                items.extend(kept)
+            if self.policy == self.COALESCE and key is not None:
+                # the newer event goes to the end, so the order of the remaining events is kept.
+                for i, item in enumerate(items):
+                    if item[0] == key:
+                        del items[i]
+                        ch.coalesced += 1
+                        break
+            if len(items) >= self.maxsize:
+                ch.dropped += 1
+                if self.policy == self.DROP_NEWEST:
+                    return False
+                items.popleft()
+            items.append((key, func, args))
+            if len(items) > ch.max_depth:
+                ch.max_depth = len(items)
+            self._cond.notify()
+        return True
+    
+    def _take(self):
+        # next channel in round robin order that has an event and may run one more, called with the lock held.
+        limit = 1 if self.ordered else self.workers
+        count = len(self._names)
+        for i in range(count):
+            pos = (self._next + i) % count
+            ch = self._channels[self._names[pos]]
+            if len(ch.items) > 0 and ch.running < limit:
+                self._next = pos + 1
+                ch.running += 1
+                return ch, ch.items.popleft()
+        return None, None
+    
+    def _worker_thread(self):
+        while True:
+            with self._cond:
+                ch, item = self._take()
+                while ch is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    ch, item = self._take()
+            try:
+                self._run(ch, item[1], item[2])
+            finally:
+                with self._cond:
+                    ch.running -= 1
+                    # a channel that was held back by ordered can run again.
+                    self._cond.notify()
+    
+    def _run(self, ch, func, args):
+        try:
+            func(*args)
+        except Exception:
+            _logger.exception('Callback %r failed', func)
+            with self._cond:
+                ch.errors += 1
+        else:
+            with self._cond:
+                ch.executed += 1
+    
+    def stats(self) -> dict:
+        """
+        Queue metrics by channel.
+
+        :return: {name: dict(depth, max_depth, running, submitted, executed, dropped, coalesced, errors)}
+        :rtype: dict
+        """
+        with self._cond:
+            return {name: dict(depth=len(ch.items), max_depth=ch.max_depth, running=ch.running,
+                               submitted=ch.submitted, executed=ch.executed, dropped=ch.dropped,
+                               coalesced=ch.coalesced, errors=ch.errors)
+                    for name, ch in self._channels.items()}
@@ -0,0 +1,116 @@
+"""
+Find the fastest reliable I2C bus clock for a SMCP-IV wired to an FTDI adapter.
+
+Every clock is tried from the fastest down by sending the ``system`` ``info`` command a number of times.
+The first clock where every response arrives complete and with a correct BCC is the fastest reliable one.
+
+    python -m pysisoulnfc.i2cprobe [serial]
+"""
+import sys
+import time
+
+from pysisoulnfc.device import DeviceI2C, Error
+from pysisoulnfc.nfc import Message
+
+FREQUENCIES = (3400000, 3000000, 2000000, 1500000, 1000000, 400000, 100000)
+
+
+def probe_frequency(serial: str, frequency: int, count=20) -> dict:
+    """
+    Send ``count`` info commands at the given clock.
+
+    :param serial: serial number of the FTDI device, with or without the '(I2C)' suffix.
+    :param frequency: I2C bus clock(Hz).
+    :param count: number of commands.
+    :return: frequency, ok(number of good responses), count, and rtt(mean round trip time in seconds) or None
+    :rtype: dict
+    """
+    if serial.endswith(DeviceI2C.SUFFIX):
+        serial = serial[:-len(DeviceI2C.SUFFIX)]
+    
+    result = dict(frequency=frequency, ok=0, count=count, rtt=None)
+    dev = DeviceI2C(serial, frequency=frequency)
+    try:
+        dev.open()
+    except (Error, IOError, ValueError):
+        # the adapter may be configured already, release it for the next clock.
+        dev.close()
+        return result
+    
+    cmd = Message.command('system', 'info').encode()
+    elapsed = 0.0
+    try:
+        for i in range(count):
+            start = time.perf_counter()
+            dev.write(cmd)
+            buf = dev.read()
+            elapsed += time.perf_counter() - start
+            if buf is None:
+                continue
+            smp = Message.from_bytes(buf)
+            try:
+                if not smp.check_complete_bytes():
+                    continue
+            except ValueError:
+                continue
+            if smp.gid == 'system' and smp.cid == 'info':
+                result['ok'] += 1
+    except (Error, IOError):
+        pass
+    finally:
+        dev.close()
+    
+    if result['ok'] > 0:
+        result['rtt'] = elapsed / count
+    return result
+
+
+def probe(serial: str, frequencies=FREQUENCIES, count=20, report=None) -> int:
+    """
+    Find the fastest clock where all commands succeed.
+
+    :param serial: serial number of the FTDI device.
+    :param frequencies: clocks(Hz) to try.
+    :param count: commands sent at each clock.
+    :param report: called with the result of :func:`probe_frequency` for each clock tried.
+    :return: the fastest reliable clock(Hz), or None if no clock worked.
+    :rtype: int
+    """
+    for frequency in sorted(frequencies, reverse=True):
+        result = probe_frequency(serial, frequency, count)
+        if callable(report):
+            report(result)
+        if result['ok'] == count:
+            return frequency
+    return None
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) > 0:
+        serials = [argv[0]]
+    else:
+        serials = []
+        for port in DeviceI2C.get_ports():
+            serials.append(port.serial)
+            port.close()
+    if len(serials) == 0:
+        print('No I2C port')
+        return 1
+    
+    def report(r):
+        rtt = '-' if r['rtt'] is None else '%.2f ms' % (r['rtt'] * 1000)
+        print('  %8d Hz: %d/%d %s' % (r['frequency'], r['ok'], r['count'], rtt))
+    
+    for serial in serials:
+        print(serial)
+        frequency = probe(serial, report=report)
+        if frequency is None:
+            print('  no reliable clock')
+        else:
+            print('  fastest reliable clock: %d Hz' % frequency)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Cached view of the attached SMCP-IV.
+
+Enumerating USB devices is slow, so :class:`Inventory` keeps the ports found by :func:`Device.get_ports`
+in a dictionary by serial number and only updates it when a scan finds a difference.
+A background thread can keep the view up to date and report arrivals and removals.
+"""
+import logging
+import threading
+import time
+
+from pysisoulnfc.device import Device
+
+_logger = logging.getLogger(__name__)
+
+
+def _identity(port: Device) -> tuple:
+    # a SMCP-IV can come back with another product id after a reset, in which case the port is replaced.
+    return type(port), getattr(port, '_pid', None)
+
+
+class Inventory:
+    INTERVAL = 0.5  #: Time(s) between two scans of the watcher thread.
+    
+    def __init__(self, interval=INTERVAL, spi=False):
+        """
+        :param interval: Time(s) between two scans while watching.
+        :type interval: float
+        :param spi: If True, FTDI adapters are listed as SPI ports instead of I2C ports.
+        :type spi: bool
+        """
+        if interval <= 0:
+            raise ValueError('Interval is invalid')
+        self.interval = interval
+        self.spi = spi
+        
+        self._ports = dict()
+        self._listeners = list()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._scanned = False
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+    
+    def _watch_thread(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                _logger.exception('Scan of the SMCP-IV failed')
+            self._stop.wait(self.interval)
+    
+    def start(self) -> None:
+        """
+        Scan now and keep scanning in a background thread until :func:`stop`.
+
+        :return: None
+        """
+        if self.is_watching():
+            return
+        self._stop.clear()
+        self.refresh()
+        self._thread = threading.Thread(target=self._watch_thread)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """
+        Stop the background thread.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def is_watching(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def add_listener(self, arrival=None, removal=None) -> None:
+        """
+        Register callbacks for changes found by a scan.
+        The callbacks are called from the thread that scanned, outside of the inventory lock.
+
+        :param arrival: Called with the :class:`Device` of a new SMCP-IV.
+        :type arrival: Callable[[Device], None]
+        :param removal: Called with the :class:`Device` of a SMCP-IV that is gone.
+        :type removal: Callable[[Device], None]
+        :return: None
+        """
+        with self._lock:
+            self._listeners.append((arrival, removal))
+    
+    def remove_listener(self, arrival=None, removal=None) -> None:
+        with self._lock:
+            try:
+                self._listeners.remove((arrival, removal))
+            except ValueError:
+                pass
+    
+    def refresh(self) -> tuple:
+        """
+        Enumerate the devices once and update the inventory.
+        Ports that are still attached are kept as they are, so an opened port is never replaced.
+
+        :return: (arrived, removed) lists of :class:`Device`
+        :rtype: tuple
+        """
+        found = {port.serial: port for port in Device.get_ports(spi=self.spi)}
+        arrived = list()
+        removed = list()
+        with self._lock:
+            for serial, port in list(self._ports.items()):
+                new = found.get(serial)
+                if new is None or _identity(new) != _identity(port):
+                    del self._ports[serial]
+                    removed.append(port)
+            for serial, port in found.items():
+                if serial not in self._ports:
+                    self._ports[serial] = port
+                    arrived.append(port)
+            self._scanned = True
+            listeners = list(self._listeners)
+            if len(arrived) > 0 or len(removed) > 0:
+                self._changed.notify_all()
+        
+        for arrival, removal in listeners:
+            if callable(removal):
+                for port in removed:
+                    removal(port)
+            if callable(arrival):
+                for port in arrived:
+                    arrival(port)
+        return arrived, removed
+    
+    def _scan_if_stale(self) -> None:
+        if not self._scanned or not self.is_watching():
+            self.refresh()
+    
+    def get(self, serial: str) -> Device:
+        """
+        :param serial: serial number of SMCP-IV.
+        :return: the port for serial, or None if it isn't attached.
+        :rtype: Device
+        """
+        self._scan_if_stale()
+        with self._lock:
+            return self._ports.get(serial)
+    
+    def ports(self) -> list:
+        """
+        :return: all attached ports.
+        :rtype: list
+        """
+        self._scan_if_stale()
+        with self._lock:
+            return list(self._ports.values())
+    
+    def get_ports(self, serial=None) -> list:
+        """
+        Same as :func:`Device.get_ports`, from the inventory.
+
+        :param serial: serial number of the port to find.
+        :rtype: list
+        """
+        if serial is None:
+            return self.ports()
+        port = self.get(serial)
+        return [] if port is None else [port]
+    
+    def wait_for(self, serial: str, timeout=None) -> Device:
+        """
+        Wait until the SMCP-IV for serial is attached.
+        If the watcher isn't running, the devices are enumerated every :attr:`interval` while waiting.
+
+        :param serial: serial number of SMCP-IV.
+        :param timeout: Time(s) to wait. None waits forever.
+        :type timeout: float
+        :return: the port, or None on timeout.
+        :rtype: Device
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if not self.is_watching():
+                self.refresh()
+            with self._lock:
+                port = self._ports.get(serial)
+                if port is not None:
+                    return port
+                wait = self.interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = min(wait, remaining)
+                if self.is_watching():
+                    self._changed.wait(wait)
+            if not self.is_watching():
+                time.sleep(wait)
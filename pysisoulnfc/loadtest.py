@@ -0,0 +1,294 @@
+"""
+Load generator: drive one or more :class:`Command` with a mix of operations and report throughput and latency.
+
+Runs against the readers found by :func:`Command.get_ports`, against :class:`SimulatedDevice` or against any
+:class:`Device` given as ``module:factory``::
+
+    python -m pysisoulnfc.loadtest --simulate 4 --concurrency 8 --duration 10 --mix apdu=4,mifare=2,ndef=1
+    python -m pysisoulnfc.loadtest --mix mifare=1 --duration 60
+    python -m pysisoulnfc.loadtest --device mypackage.devices:make_device --count 10000
+
+A card must be presented to real readers, the test starts once every reader found one.
+"""
+import argparse
+import importlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+
+from pysisoulnfc.nfc import Command
+
+STATUS = Command.STATUS
+
+SELECT_PPSE = b'\x00\xA4\x04\x00\x0E2PAY.SYS.DDF01\x00'
+MIFARE_KEY = b'\xFF' * 6
+
+
+def _apdu(cmd, i):
+    return cmd.apdu_tranceive(SELECT_PPSE)['status']
+
+
+def _mifare(cmd, i):
+    # sweep the data blocks of a Mifare Classic 1K, sector trailers are skipped.
+    block = 4 + i % 60
+    if block % 4 == 3:
+        block -= 1
+    status = cmd.mifare_auth(block, 1, MIFARE_KEY)
+    if status != STATUS.SUCCESS:
+        return status
+    return cmd.mifare_read(block)['status']
+
+
+def _ndef(cmd, i):
+    return cmd.ndef_read()['status']
+
+
+def _read(cmd, i):
+    return cmd.read(4 + i % 16)['status']
+
+
+def _info(cmd, i):
+    return cmd.get_dev_info()['status']
+
+
+#: name -> function(command, iteration) returning the :class:`Command.STATUS` of the operation.
+OPERATIONS = dict(apdu=_apdu, mifare=_mifare, ndef=_ndef, read=_read, info=_info)
+
+
+def parse_mix(text: str) -> dict:
+    """
+    :param text: 'name=weight,...', ex. 'apdu=4,mifare=1'. A name without weight has weight 1.
+    :return: {name: weight}
+    :rtype: dict
+    :raise: :class:`ValueError` if an operation is unknown.
+    """
+    mix = dict()
+    for item in text.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError('Operation(%s) is unknown, one of %s' % (name, ', '.join(sorted(OPERATIONS))))
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Nearest rank percentile of sorted values.
+    """
+    if len(values) == 0:
+        return None
+    k = max(0, min(len(values) - 1, int(math.ceil(p / 100.0 * len(values))) - 1))
+    return values[k]
+
+
+class _Stats:
+    def __init__(self):
+        self.latencies = list()
+        self.timeouts = 0
+        self.errors = 0
+    
+    def add(self, latency, status):
+        self.latencies.append(latency)
+        if status == STATUS.TIMED_OUT:
+            self.timeouts += 1
+        elif status != STATUS.SUCCESS:
+            self.errors += 1
+    
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.timeouts += other.timeouts
+        self.errors += other.errors
+    
+    def summary(self, elapsed) -> dict:
+        values = sorted(self.latencies)
+        
+        def ms(v):
+            return None if v is None else v * 1000.0
+        
+        return dict(count=len(values), throughput=len(values) / elapsed if elapsed > 0 else 0.0,
+                    p50=ms(percentile(values, 50)), p95=ms(percentile(values, 95)), p99=ms(percentile(values, 99)),
+                    max=ms(values[-1] if values else None), timeouts=self.timeouts, errors=self.errors)
+
+
+def _choice(rnd, names, weights):
+    # random.choices() is Python 3.6+.
+    x = rnd.uniform(0, sum(weights))
+    for n, w in zip(names, weights):
+        x -= w
+        if x <= 0:
+            return n
+    return names[-1]
+
+
+def run(commands: list, mix: dict, concurrency=1, duration=None, count=None, seed=None) -> dict:
+    """
+    Run the load test.
+
+    :param commands: opened :class:`Command`, shared round robin by the workers.
+    :param mix: {operation name: weight}
+    :param concurrency: number of worker threads.
+    :param duration: time(s) to run.
+    :param count: number of operations to run, if duration is None.
+    :param seed: seed of the operation choice.
+    :return: elapsed(s), total and by operation summary: count, throughput(op/s), p50, p95, p99, max(ms),
+        timeouts and errors.
+    :rtype: dict
+    """
+    if duration is None and count is None:
+        raise ValueError('Duration or count is needed')
+    names = sorted(mix)
+    weights = [mix[n] for n in names]
+    # an operation can take several commands(auth then read), workers sharing a reader take turns.
+    locks = [threading.Lock() for c in commands]
+    remaining = [count]
+    counter_lock = threading.Lock()
+    results = list()
+    
+    def worker(index):
+        rnd = random.Random(None if seed is None else seed + index)
+        stats = dict((n, _Stats()) for n in names)
+        pos = index % len(commands)
+        cmd, lock = commands[pos], locks[pos]
+        i = 0
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if count is not None:
+                with counter_lock:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+            name = _choice(rnd, names, weights)
+            with lock:
+                start = time.perf_counter()
+                status = OPERATIONS[name](cmd, i)
+                stats[name].add(time.perf_counter() - start, status)
+            i += 1
+        results.append(stats)
+    
+    start = time.perf_counter()
+    deadline = None if duration is None else start + duration
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    
+    total = _Stats()
+    by_op = dict()
+    for n in names:
+        s = _Stats()
+        for r in results:
+            s.merge(r[n])
+        total.merge(s)
+        by_op[n] = s.summary(elapsed)
+    return dict(elapsed=elapsed, readers=len(commands), concurrency=concurrency, total=total.summary(elapsed),
+                operations=by_op)
+
+
+def _simulated(index, args):
+    from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+    dev = SimulatedDevice('SIM%05d' % index, latency=args.latency, jitter=args.jitter,
+                          timeout_rate=args.error_rate, hid=args.hid)
+    # one tag that answers every operation of the mix.
+    tag = VirtualTag(b'\x04\x10\x20\x30\x40\x50\x60', Command.NfcTech.ISO14443A, Command.NfcTagType.TYPE4,
+                     Command.NfcTagAppTypeMiFareClassic.MIFARE_1K, block_size=16, ndef=b'\xD1\x01\x04T\x02enA',
+                     apdu=lambda c: b'\x6F\x00\x90\x00')
+    dev.place(tag)
+    return dev
+
+
+def _load_factory(path: str):
+    module, _, name = path.partition(':')
+    if not name:
+        raise ValueError('Device must be module:factory')
+    return getattr(importlib.import_module(module), name)
+
+
+def _open(args) -> list:
+    if args.simulate:
+        devices = [_simulated(i, args) for i in range(args.simulate)]
+    elif args.device:
+        factory = _load_factory(args.device)
+        devices = [factory() for i in range(args.readers)]
+    else:
+        devices = Command.get_ports(args.serial, args.spi)
+    
+    commands = list()
+    for dev in devices:
+        cmd = Command()
+        cmd.TIME_OUT = args.timeout
+        found = threading.Event()
+        cmd.set_callbacks(discovery=lambda status, d, e=found: e.set() if status == STATUS.SUCCESS else None)
+        cmd.open(dev)
+        commands.append(cmd)
+        if cmd.discovery() != STATUS.SUCCESS:
+            print('%s: discovery failed' % dev.serial)
+        elif not found.wait(args.wait_tag):
+            print('%s: no card' % dev.serial)
+    return commands
+
+
+def _print(result):
+    print('%d readers, %d workers, %.1f s' % (result['readers'], result['concurrency'], result['elapsed']))
+    print('%-8s %8s %10s %8s %8s %8s %8s %8s %8s' % ('op', 'count', 'op/s', 'p50 ms', 'p95 ms', 'p99 ms',
+                                                     'max ms', 'timeout', 'error'))
+    rows = sorted(result['operations'].items()) + [('total', result['total'])]
+    for name, s in rows:
+        if s['count'] == 0:
+            print('%-8s %8d' % (name, 0))
+            continue
+        print('%-8s %8d %10.1f %8.2f %8.2f %8.2f %8.2f %8d %8d' % (name, s['count'], s['throughput'], s['p50'],
+                                                                  s['p95'], s['p99'], s['max'], s['timeouts'],
+                                                                  s['errors']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pysisoulnfc.loadtest', description='SMCP-IV load generator')
+    parser.add_argument('--mix', default='apdu', help='operations and weights, ex. apdu=4,mifare=1 (%s)'
+                                                     % ', '.join(sorted(OPERATIONS)))
+    parser.add_argument('--concurrency', type=int, default=1, help='worker threads')
+    parser.add_argument('--duration', type=float, help='time(s) to run')
+    parser.add_argument('--count', type=int, help='operations to run')
+    parser.add_argument('--timeout', type=float, default=Command.TIME_OUT, help='response timeout(s)')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    parser.add_argument('--serial', help='only the reader with this serial number')
+    parser.add_argument('--spi', action='store_true', help='FTDI adapters are wired for SPI')
+    parser.add_argument('--wait-tag', type=float, default=10.0, help='time(s) to wait for a card on each reader')
+    parser.add_argument('--device', help='module:factory returning a Device to use instead of readers')
+    parser.add_argument('--readers', type=int, default=1, help='devices made by --device')
+    parser.add_argument('--simulate', type=int, default=0, help='use this many simulated readers')
+    parser.add_argument('--latency', type=float, default=0.0005, help='latency(s) of simulated readers')
+    parser.add_argument('--jitter', type=float, default=0.0, help='jitter(s) of simulated readers')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='lost responses of simulated readers')
+    parser.add_argument('--hid', action='store_true', help='simulated readers split frames into HID reports')
+    args = parser.parse_args(argv)
+    
+    if args.duration is None and args.count is None:
+        args.duration = 10.0
+    mix = parse_mix(args.mix)
+    commands = _open(args)
+    if len(commands) == 0:
+        print('No reader')
+        return 1
+    try:
+        result = run(commands, mix, args.concurrency, args.duration, args.count, args.seed)
+    finally:
+        for cmd in commands:
+            cmd.close()
+    
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+    else:
+        _print(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Command latency histograms and protocol counters, readable as a snapshot or in the Prometheus text format.
+
+Every :class:`pysisoulnfc.nfc.Command` has a :class:`Metrics` in ``Command.metrics``::
+
+    cmd.metrics.snapshot()
+    prometheus_text([cmd.metrics for cmd in commands])
+"""
+import threading
+
+_SUB = 16  # linear sub-buckets per power of 2, about 6% precision.
+_SUB_BITS = 4
+
+#: Upper bounds(s) of the buckets exported to Prometheus.
+PROMETHEUS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                      2.5, 5.0, 10.0, 20.0)
+
+
+def _index(v: int) -> int:
+    if v < 2 * _SUB:
+        return v
+    shift = v.bit_length() - _SUB_BITS - 1
+    return 2 * _SUB + (shift - 1) * _SUB + (v >> shift) - _SUB
+
+
+def _upper(index: int) -> int:
+    # largest value counted in the bucket.
+    if index < 2 * _SUB:
+        return index
+    shift = (index - 2 * _SUB) // _SUB + 1
+    m = (index - 2 * _SUB) % _SUB + _SUB
+    return ((m + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    HDR style histogram of integer values: exact up to 31, then 16 linear buckets for every power of 2.
+    """
+    
+    def __init__(self):
+        self.counts = list()
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+    
+    def record(self, value: int) -> None:
+        i = _index(value)
+        counts = self.counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    def percentile(self, p: float) -> int:
+        """
+        :return: upper bound of the bucket holding the p-th percentile, at most the largest value recorded.
+        :rtype: int
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(p / 100.0 * self.count + 0.999999))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_upper(i), self.max)
+        return self.max
+    
+    def count_le(self, value: int) -> int:
+        """
+        :return: number of values in the buckets entirely below or at value.
+        """
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if _upper(i) > value:
+                break
+            seen += n
+        return seen
+
+
+def _name(status) -> str:
+    from pysisoulnfc.nfc import Command
+    try:
+        return Command.STATUS(status).name
+    except ValueError:
+        return '0x%02X' % status
+
+
+def _summary(h: Histogram) -> dict:
+    return dict(count=h.count, sum=h.sum, min=h.min, max=h.max, mean=h.sum / h.count, p50=h.percentile(50),
+                p90=h.percentile(90), p99=h.percentile(99), p999=h.percentile(99.9))
+
+
+class Metrics:
+    """
+    Latency of the commands by gid/cid in microseconds, results by status, counters and gauges.
+
+    Counters used by :class:`pysisoulnfc.nfc.Command`: bytes_out, bytes_in, frames_out, frames_in, events,
+    frame_errors(times the frame decoder lost sync), bytes_discarded and transport_errors.
+    """
+    
+    def __init__(self, labels: dict = None):
+        """
+        :param labels: labels added to every exported sample, ex. dict(reader='SN0001').
+        """
+        self.labels = dict(labels) if labels is not None else dict()
+        self._lock = threading.Lock()
+        self._latency = dict()  # (gid, cid) -> Histogram(us)
+        self._status = dict()  # (gid, cid, status) -> count
+        self._wait = dict()  # priority -> Histogram(us) of the time spent waiting for the reader
+        self._counters = dict()
+        self._gauges = dict()  # name -> (function, label name)
+    
+    def observe(self, gid: str, cid: str, status: int, seconds: float) -> None:
+        """
+        Record the result of a command.
+        """
+        key = (gid, cid)
+        with self._lock:
+            h = self._latency.get(key)
+            if h is None:
+                h = self._latency[key] = Histogram()
+            h.record(int(seconds * 1000000))
+            key = (gid, cid, status)
+            self._status[key] = self._status.get(key, 0) + 1
+    
+    def observe_wait(self, priority: str, seconds: float) -> None:
+        """
+        Record the time a command waited for its turn before it was written.
+        """
+        with self._lock:
+            h = self._wait.get(priority)
+            if h is None:
+                h = self._wait[priority] = Histogram()
+            h.record(int(seconds * 1000000))
+    
+    def count(self, name: str, n=1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+    
+    def add_gauge(self, name: str, func, label: str = None) -> None:
+        """
+        Add a value read when a snapshot is taken.
+
+        :param name: gauge name.
+        :param func: returns a number, or {label value: number} if label is given.
+        :param label: name of the label of the values returned by func.
+        """
+        with self._lock:
+            self._gauges[name] = (func, label)
+    
+    def remove_gauge(self, name: str) -> None:
+        with self._lock:
+            self._gauges.pop(name, None)
+    
+    def reset(self) -> None:
+        """
+        Clear the histograms and counters, gauges are kept.
+        """
+        with self._lock:
+            self._latency.clear()
+            self._status.clear()
+            self._wait.clear()
+            self._counters.clear()
+    
+    def _gauge_values(self) -> dict:
+        values = dict()
+        for name, (func, label) in list(self._gauges.items()):
+            try:
+                v = func()
+            except Exception:
+                continue
+            if label is None:
+                values[name] = v
+            else:
+                values[name] = {k: x for k, x in v.items() if isinstance(x, (int, float))}
+        return values
+    
+    def snapshot(self) -> dict:
+        """
+        :return: latency: {'gid.cid': dict(count, sum, min, max, mean, p50, p90, p99, p999)} in microseconds\n
+            status: {'gid.cid': {status name: count}}\n
+            queue_wait: {priority: dict(count, sum, ...)} in microseconds, like latency\n
+            counters: {name: count}\n
+            gauges: {name: value or {label value: value}}
+        :rtype: dict
+        """
+        with self._lock:
+            latency = {'%s.%s' % k: _summary(h) for k, h in self._latency.items()}
+            status = dict()
+            for (gid, cid, s), n in self._status.items():
+                status.setdefault('%s.%s' % (gid, cid), dict())[_name(s)] = n
+            wait = {k: _summary(h) for k, h in self._wait.items()}
+            counters = dict(self._counters)
+        return dict(latency=latency, status=status, queue_wait=wait, counters=counters,
+                    gauges=self._gauge_values())
+    
+    def prometheus(self) -> str:
+        return prometheus_text([self])
+
+
+def _labels(*items) -> str:
+    parts = list()
+    for d in items:
+        for k, v in d.items():
+            parts.append('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')))
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _histogram(lines: list, name: str, labels: dict, h: Histogram, extra: dict) -> None:
+    for le in PROMETHEUS_BUCKETS:
+        lines.append('%s_bucket%s %d'
+                     % (name, _labels(labels, extra, dict(le=repr(le))), h.count_le(int(le * 1000000))))
+    lines.append('%s_bucket%s %d' % (name, _labels(labels, extra, dict(le='+Inf')), h.count))
+    lines.append('%s_sum%s %r' % (name, _labels(labels, extra), h.sum / 1e6))
+    lines.append('%s_count%s %d' % (name, _labels(labels, extra), h.count))
+
+
+def prometheus_text(metrics: list, prefix='sisoulnfc') -> str:
+    """
+    Export in the Prometheus text format.
+
+    :param metrics: :class:`Metrics` of one or more readers, told apart by their labels.
+    :param prefix: prefix of the metric names.
+    :rtype: str
+    """
+    latency = list()
+    status = list()
+    wait = list()
+    counters = dict()
+    gauges = dict()
+    for m in metrics:
+        with m._lock:
+            for (gid, cid), h in m._latency.items():
+                _histogram(latency, prefix + '_command_latency_seconds', m.labels, h, dict(gid=gid, cid=cid))
+            for (gid, cid, s), n in m._status.items():
+                status.append('%s_command_status_total%s %d'
+                              % (prefix, _labels(m.labels, dict(gid=gid, cid=cid, status=_name(s))), n))
+            for priority, h in m._wait.items():
+                _histogram(wait, prefix + '_queue_wait_seconds', m.labels, h, dict(priority=priority))
+            for name, n in m._counters.items():
+                counters.setdefault(name, list()).append('%s_%s_total%s %d' % (prefix, name, _labels(m.labels), n))
+        for name, v in m._gauge_values().items():
+            label = m._gauges[name][1]
+            lines = gauges.setdefault(name, list())
+            if label is None:
+                lines.append('%s_%s%s %r' % (prefix, name, _labels(m.labels), v))
+            else:
+                for k, x in sorted(v.items()):
+                    lines.append('%s_%s%s %r' % (prefix, name, _labels(m.labels, {label: k}), x))
+    
+    out = list()
+    if latency:
+        out.append('# HELP %s_command_latency_seconds Time from sending a command to its response.' % prefix)
+        out.append('# TYPE %s_command_latency_seconds histogram' % prefix)
+        out.extend(latency)
+    if status:
+        out.append('# HELP %s_command_status_total Command results by status.' % prefix)
+        out.append('# TYPE %s_command_status_total counter' % prefix)
+        out.extend(status)
+    if wait:
+        out.append('# HELP %s_queue_wait_seconds Time a command waited for the reader before it was written.' % prefix)
+        out.append('# TYPE %s_queue_wait_seconds histogram' % prefix)
+        out.extend(wait)
+    for name, lines in sorted(counters.items()):
+        out.append('# TYPE %s_%s_total counter' % (prefix, name))
+        out.extend(lines)
+    for name, lines in sorted(gauges.items()):
+        out.append('# TYPE %s_%s gauge' % (prefix, name))
+        out.extend(lines)
+    return '\n'.join(out) + '\n'
@@ -1,16 +1,24 @@
 from typing import Dict, Optional, Any, Union, Callable
 
+import functools
 import hid
 import random
 import sys
 import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from enum import IntEnum
-from queue import Queue, Empty
-from time import sleep
-
-from multipledispatch import dispatch
+from time import sleep, perf_counter
 
 from pysisoulnfc.device import Device, Error
+from pysisoulnfc.dispatch import Dispatcher
+from pysisoulnfc.inventory import Inventory
+from pysisoulnfc.metrics import Metrics
+from pysisoulnfc.retry import RetryPolicy
+from pysisoulnfc.scheduler import Scheduler
+from pysisoulnfc.spans import SpanTracer
+from pysisoulnfc.timeouts import Timeouts
+from pysisoulnfc.trace import Tracer, TX, RX, LOCAL
+from pysisoulnfc.speedups import bcc, unpack_header
 
 """
 SISOUL NFC API
@@ -32,44 +40,54 @@ class Message:
                          mfc_restore=b'\x36', mfc_transfer=b'\x37',
                          apdu_transfer=b'\x41', raw=b'\x42', emv=b'\x51', conf_reactive=b'\xC0'))
     
-    _type = None
-    _gid = None
-    _cid = None
-    _param1 = None
-    _param2 = None
-    _length = 0
-    _payload = None
-    _bcc = None
-    _bytes = None
-    _status = None
-    
-    @dispatch()
-    def __init__(self):
-        self._bytes = None
+    # reverse lookups by byte value.
+    _TYPE_KEYS = {v[0]: k for k, v in _TYPES.items()}
+    _GID_KEYS = {v[0]: k for k, v in _GID.items()}
+    _CID_KEYS = {g: {v[0]: k for k, v in cids.items()} for g, cids in _CID.items()}
+    _PREFIX = dict()  # (type, gid, cid) -> the first three bytes of the frame, filled in below the class.
     
-    @dispatch(bytes)
-    def __init__(self, byte):
-        self._bytes = byte
+    __slots__ = ('_type', '_gid', '_cid', '_param1', '_param2', '_status', '_length', '_payload', '_bytes',
+                 '_decoded')
     
-    @dispatch(str, str, str)
-    def __init__(self, t, gid, cid):
-        self._init_cmd(t, gid, cid)
+    def __init__(self, *args):
+        """
+        Kept for the positional forms used before the classmethod constructors:
+        ``Message(bytes)``, ``Message(t, gid, cid[, param1, param2[, payload]])`` and
+        ``Message(t, gid, cid, status[, payload])``.
+        """
+        if len(args) > 3:
+            if isinstance(args[3], int):
+                self._init_rsp(*args)
+            else:
+                self._init_cmd(*args)
+        elif len(args) == 3:
+            self._init_cmd(*args)
+        else:
+            self._init_bytes(args[0] if args else None)
     
-    @dispatch(str, str, str, bytes, bytes)
-    def __init__(self, t, gid, cid, param1, param2):
-        self._init_cmd(t, gid, cid, param1, param2)
+    @classmethod
+    def command(cls, gid, cid, param1=b'\x00', param2=b'\x00', payload=None):
+        self = cls.__new__(cls)
+        self._init_cmd('cmd', gid, cid, param1, param2, payload)
+        return self
     
-    @dispatch(str, str, str, bytes, bytes, bytes)
-    def __init__(self, t, gid, cid, param1, param2, payload):
-        self._init_cmd(t, gid, cid, param1, param2, payload)
+    @classmethod
+    def response(cls, gid, cid, status, payload=None):
+        self = cls.__new__(cls)
+        self._init_rsp('rsp', gid, cid, status, payload)
+        return self
     
-    @dispatch(str, str, str, int)
-    def __init__(self, t, gid, cid, status):
-        self._init_rsp(t, gid, cid, status)
+    @classmethod
+    def event(cls, gid, cid, status, payload=None):
+        self = cls.__new__(cls)
+        self._init_rsp('evt', gid, cid, status, payload)
+        return self
     
-    @dispatch(str, str, str, int, bytes)
-    def __init__(self, t, gid, cid, status, payload):
-        self._init_rsp(t, gid, cid, status, payload)
+    @classmethod
+    def from_bytes(cls, b):
+        self = cls.__new__(cls)
+        self._init_bytes(b)
+        return self
     
     def __add__(self, other):
         if self._bytes is None:
@@ -81,147 +99,203 @@ class Message:
         if self._bytes is None:
             self._bytes = b''
         self._bytes += other
+        self._type = None
+        self._decoded = None
         return self
     
+    def _init_bytes(self, b):
+        self._type = None
+        self._gid = None
+        self._cid = None
+        self._param1 = None
+        self._param2 = None
+        self._status = None
+        self._length = 0
+        self._payload = None
+        self._bytes = b
+        self._decoded = None
+    
     def _init_cmd(self, t, gid, cid, param1=b'\x00', param2=b'\x00', payload=None):
         self._type = t
         self._gid = gid
         self._cid = cid
         self._param1 = param1
         self._param2 = param2
+        self._status = None
         self._payload = payload
-        if payload is not None:
-            self._length = len(payload)
-        else:
-            self._length = 0
+        self._length = len(payload) if payload is not None else 0
+        self._bytes = None
+        self._decoded = None
     
     def _init_rsp(self, t, gid, cid, status, payload=None):
         self._type = t
         self._gid = gid
         self._cid = cid
+        self._param1 = None
+        self._param2 = None
         self._status = status
         self._payload = payload
-        if payload is not None:
-            self._length = len(payload)
-        else:
-            self._length = 0
+        self._length = len(payload) if payload is not None else 0
+        self._bytes = None
+        self._decoded = None
+    
+    def _modify(self):
+        if self._type is None:
+            self._parse()
+        self._bytes = None
+        self._decoded = None
     
     def set_type(self, t):
+        self._modify()
         self._type = t
     
     def set_gid(self, gid):
+        self._modify()
         self._gid = gid
     
     def set_cid(self, cid):
+        self._modify()
         self._cid = cid
     
     def set_param1(self, param1):
+        self._modify()
         self._param1 = param1
     
     def set_param2(self, param2):
+        self._modify()
         self._param2 = param2
     
     def set_status(self, status):
+        self._modify()
         self._status = status
     
     def set_payload(self, payload):
+        self._modify()
         self._payload = payload
-        if payload is not None:
-            self._length = len(payload)
-        else:
-            self._length = 0
+        self._length = len(payload) if payload is not None else 0
+    
+    @property
+    def type(self):
+        if self._type is None:
+            self._parse()
+        return self._type
+    
+    @property
+    def gid(self):
+        if self._type is None:
+            self._parse()
+        return self._gid
+    
+    @property
+    def cid(self):
+        if self._type is None:
+            self._parse()
+        return self._cid
+    
+    @property
+    def param1(self):
+        if self._type is None:
+            self._parse()
+        return self._param1
+    
+    @property
+    def param2(self):
+        if self._type is None:
+            self._parse()
+        return self._param2
+    
+    @property
+    def status(self):
+        if self._type is None:
+            self._parse()
+        return self._status
+    
+    @property
+    def payload(self):
+        if self._type is None:
+            self._parse()
+        return self._payload
     
     def check_complete_bytes(self):
-        if self._bytes is None:
+        b = self._bytes
+        if b is None:
             return False
         
-        t = self._get_key(self._bytes[0:1], self._TYPES)
+        t = self._TYPE_KEYS.get(b[0])
         if t is None:
-            raise ValueError('Type(0x%02X) is Invalid'.format(self._bytes[0:1]))
-        
-        length = len(self._bytes)
-        if t == 'cmd':
-            header_size = self.CMD_HEADER_SIZE
-        else:
-            header_size = self.RSP_HEADER_SIZE
+            raise ValueError('Type(0x%02X) is Invalid' % b[0])
         
+        length = len(b)
+        header_size = self.CMD_HEADER_SIZE if t == 'cmd' else self.RSP_HEADER_SIZE
         if length < header_size + 1:
             return False
         
-        gid = self._get_key(self._bytes[1:2], self._GID)
+        gid = self._GID_KEYS.get(b[1])
         if gid is None:
-            raise ValueError('Gid(0x%02X) is Invalid'.format(self._bytes[1:2]))
+            raise ValueError('Gid(0x%02X) is Invalid' % b[1])
         
-        cid = self._get_key(self._bytes[2:3], self._CID[gid])
-        if cid is None:
-            raise ValueError('Cid(0x%02X) is Invalid'.format(self._bytes[2:3]))
-        
-        if t == 'cmd':
-            lc = int.from_bytes(self._bytes[5:9], 'little')
-        else:
-            lc = int.from_bytes(self._bytes[4:8], 'little')
+        if b[2] not in self._CID_KEYS[gid]:
+            raise ValueError('Cid(0x%02X) is Invalid' % b[2])
         
+        lc = int.from_bytes(b[header_size - 4:header_size], 'little')
         if length < (lc + header_size + 1):
             return False
         
-        if self._make_bcc(self._bytes[0:-1]).to_bytes(1, 'little') != self._bytes[-1:]:
+        if self._make_bcc(b[:-1]) != b[-1]:
             raise ValueError('BCC is incorrect')
         
         return True
     
-    @dispatch(bytes, dict)
-    def _get_key(self, b, d):
-        for k, v in d.items():
-            if v == b:
-                return k
-        return None
-    
     @staticmethod
     def _make_bcc(b: bytes) -> int:
-        bcc = 0
-        for i in b:
-            bcc ^= i
-        return bcc
+        return bcc(b)
     
     def encode(self):
         if self._bytes is None:
-            lc = self._length.to_bytes(4, 'little')
-            self._bytes = self._TYPES[self._type] + self._GID[self._gid] + self._CID[self._gid][self._cid]
+            payload = self._payload
             if self._type == 'cmd':
-                self._bytes += self._param1 + self._param2
+                head = self._PREFIX['cmd', self._gid, self._cid] + self._param1 + self._param2
             else:
-                self._bytes += self._status.to_bytes(1, 'little')
-            self._bytes += lc
-            if self._payload is not None:
-                self._bytes += self._payload
-            
-            self._bytes += self._make_bcc(self._bytes).to_bytes(1, 'little')
+                head = self._PREFIX[self._type, self._gid, self._cid] + bytes((self._status,))
+            if payload:
+                frame = b''.join((head, len(payload).to_bytes(4, 'little'), payload))
+            else:
+                frame = head + b'\x00\x00\x00\x00'
+            self._bytes = frame + bytes((self._make_bcc(frame),))
         
         return self._bytes
     
+    def _parse(self):
+        b = self._bytes
+        if not b:
+            return  # built field by field with the setters, nothing to parse.
+        t, gid, cid, param1, _, self._length, header_size = unpack_header(b)
+        self._type = self._TYPE_KEYS.get(t)
+        self._gid = self._GID_KEYS.get(gid)
+        self._cid = self._CID_KEYS.get(self._gid, {}).get(cid)
+        if self._type == 'cmd':
+            self._param1 = b[3:4]
+            self._param2 = b[4:5]
+        else:
+            self._status = param1
+        if self._length > 0:
+            self._payload = b[header_size:header_size + self._length]
+    
     def decode(self):
-        if self._type is None:
-            self._type = self._get_key(self._bytes[0:1], self._TYPES)
-            self._gid = self._get_key(self._bytes[1:2], self._GID)
-            self._cid = self._get_key(self._bytes[2:3], self._CID[self._gid])
+        """
+        Decoded view of the message.
+        The dict is built once and shared by every call, so it must not be modified.
+        """
+        if self._decoded is None:
+            if self._type is None:
+                self._parse()
             if self._type == 'cmd':
-                self._param1 = self._bytes[3:4]
-                self._param2 = self._bytes[4:5]
-                self._length = int.from_bytes(self._bytes[5:9], 'little')
-                if self._length > 0:
-                    self._payload = self._bytes[self.CMD_HEADER_SIZE:self.CMD_HEADER_SIZE + self._length]
+                self._decoded = {'type': self._type, 'gid': self._gid, 'cid': self._cid,
+                                 'param1': self._param1, 'param2': self._param2, 'payload': self._payload}
             else:
-                self._status = self._bytes[3]
-                self._length = int.from_bytes(self._bytes[4:8], 'little')
-                if self._length > 0:
-                    self._payload = self._bytes[self.RSP_HEADER_SIZE:self.RSP_HEADER_SIZE + self._length]
-        
-        if self._type == 'cmd':
-            return {'type': self._type, 'gid': self._gid, 'cid': self._cid,
-                    'param1': self._param1, 'param2': self._param2, 'payload': self._payload}
-        else:
-            return {'type': self._type, 'gid': self._gid, 'cid': self._cid, 'status': self._status,
-                    'payload': self._payload}
+                self._decoded = {'type': self._type, 'gid': self._gid, 'cid': self._cid, 'status': self._status,
+                                 'payload': self._payload}
+        return self._decoded
     
     def pprint(self):
         self.decode()
@@ -233,12 +307,276 @@ class Message:
             s = '[' + self._type.upper() + '][' + self._gid.upper() + '][' + self._cid.upper() + ']' + \
                 '[' + Command.STATUS(self._status).name + ']'
         
-        s += 'Payload(' + str(self._length) + '): '
-        if self._length > 0:
-            for i in range(self._length):
-                if i % 24 == 0:
-                    s += '\n\t' + ' '.join('%02X' % b for b in self._payload[i:i + 24])
-        return s
+        lines = [s + 'Payload(' + str(self._length) + '): ']
+        for i in range(0, self._length, 24):
+            lines.append('\t' + ' '.join('%02X' % b for b in self._payload[i:i + 24]))
+        return '\n'.join(lines)
+
+
+Message._PREFIX.update(((t, g, c), tv + Message._GID[g] + cv) for t, tv in Message._TYPES.items()
+                       for g, cids in Message._CID.items() for c, cv in cids.items())
+
+
+class FrameDecoder:
+    """
+    Incremental SMCP frame decoder.
+
+    Bytes are accepted in arbitrary chunks and every complete cmd/rsp/evt frame is returned as a
+    :class:`memoryview` on the internal buffer, so no copy is made until the caller needs one.
+    A view is only valid until the next frame is requested; use ``bytes(frame)`` to keep it.
+
+    When the head of the buffer can't be the start of a frame (unknown type, gid or cid, length over
+    ``max_length`` or a BCC mismatch), one byte is discarded and decoding resumes at the next byte that
+    looks like a frame type, so a corrupted frame doesn't take the following frames with it. A corrupted length
+    under ``max_length`` makes the decoder wait for that many bytes, keep it close to the longest frame expected.
+    """
+    
+    MAX_LENGTH = 4096  #: Default longest payload, the responses of SMCP-IV are a few hundred bytes.
+    
+    _TYPES = frozenset(t[0] for t in Message._TYPES.values())
+    _CIDS = {Message._GID[g][0]: frozenset(c[0] for c in cids.values()) for g, cids in Message._CID.items()}
+    
+    def __init__(self, size=1024, max_length=MAX_LENGTH):
+        self._buf = bytearray(size)
+        self._head = 0
+        self._tail = 0
+        self._synced = True
+        self.max_length = max_length
+        self.errors = 0  #: Number of times the decoder had to resynchronise.
+        self.discarded = 0  #: Number of bytes dropped while resynchronising.
+    
+    def __len__(self):
+        return self._tail - self._head
+    
+    def reset(self):
+        """
+        Drop any buffered bytes.
+        """
+        self._head = 0
+        self._tail = 0
+        self._synced = True
+    
+    def feed(self, data):
+        """
+        Add received bytes to the decoder.
+
+        :param data: bytes received from the device.
+        :type data: bytes
+        :return: iterator of complete frames.
+        :rtype: typing.Iterator[memoryview]
+        """
+        self._append(data)
+        return self._frames()
+    
+    def _append(self, data):
+        size = len(data)
+        used = self._tail - self._head
+        if self._tail + size > len(self._buf):
+            if used + size > len(self._buf):
+                # views handed out before keep the old buffer alive, so grow by replacing it.
+                buf = bytearray(max(len(self._buf) * 2, used + size))
+                buf[:used] = self._buf[self._head:self._tail]
+                self._buf = buf
+            elif used > 0:
+                self._buf[:used] = self._buf[self._head:self._tail]
+            self._head = 0
+            self._tail = used
+        self._buf[self._tail:self._tail + size] = data
+        self._tail += size
+    
+    def _skip(self):
+        buf = self._buf
+        start = self._head + 1
+        nxt = self._tail
+        for t in self._TYPES:
+            pos = buf.find(t, start, nxt)
+            if pos >= 0:
+                nxt = pos
+        if self._synced:
+            self._synced = False
+            self.errors += 1
+        self.discarded += nxt - self._head
+        self._head = nxt
+    
+    def _frames(self):
+        buf = self._buf
+        view = memoryview(buf)
+        try:
+            while True:
+                head = self._head
+                avail = self._tail - head
+                if avail <= 0:
+                    self._head = self._tail = 0
+                    return
+                
+                t = buf[head]
+                if t not in self._TYPES:
+                    self._skip()
+                    continue
+                if avail >= 2:
+                    cids = self._CIDS.get(buf[head + 1])
+                    if cids is None or (avail >= 3 and buf[head + 2] not in cids):
+                        self._skip()
+                        continue
+                
+                header_size = Message.CMD_HEADER_SIZE if t == 0x01 else Message.RSP_HEADER_SIZE
+                if avail < header_size + 1:
+                    return
+                length = int.from_bytes(buf[head + header_size - 4:head + header_size], 'little')
+                if length > self.max_length:
+                    self._skip()
+                    continue
+                end = head + header_size + length + 1
+                if end > self._tail:
+                    return
+                
+                frame = view[head:end]
+                if Message._make_bcc(frame) != 0:
+                    frame.release()
+                    self._skip()
+                    continue
+                
+                self._head = end
+                self._synced = True
+                yield frame
+                frame.release()
+        finally:
+            view.release()
+
+
+class FrameTemplate:
+    """
+    Precompiled command frame.
+
+    The header of a gid/cid and its BCC are computed once. Changing the parameters folds the XOR of the old and
+    new values into the BCC, a new payload only costs the BCC of the payload, and the frame is joined from bytes
+    already built, so a command sent repeatedly with a different block number or payload is encoded without
+    building a :class:`Message`.
+    """
+    
+    def __init__(self, gid, cid, param1=0, param2=0, payload=None):
+        self.gid = gid
+        self.cid = cid
+        self._prefix = Message._PREFIX['cmd', gid, cid]
+        self._params = bytes((param1, param2))
+        self._head_bcc = bcc(self._prefix, param1 ^ param2)
+        self._length = b'\x00\x00\x00\x00'
+        self._payload = b''
+        self._payload_bcc = 0
+        self._bytes = None
+        if payload:
+            self.set_payload(payload)
+    
+    def __len__(self):
+        return Message.CMD_HEADER_SIZE + len(self._payload) + 1
+    
+    def set_param1(self, param1: int):
+        old = self._params
+        if old[0] != param1:
+            self._head_bcc ^= old[0] ^ param1
+            self._params = bytes((param1, old[1]))
+            self._bytes = None
+    
+    def set_param2(self, param2: int):
+        old = self._params
+        if old[1] != param2:
+            self._head_bcc ^= old[1] ^ param2
+            self._params = bytes((old[0], param2))
+            self._bytes = None
+    
+    def set_params(self, param1: int, param2: int):
+        old = self._params
+        if old[0] != param1 or old[1] != param2:
+            self._head_bcc ^= old[0] ^ old[1] ^ param1 ^ param2
+            self._params = bytes((param1, param2))
+            self._bytes = None
+    
+    def set_payload(self, payload):
+        """
+        Replace the payload, only its BCC is computed.
+        """
+        payload = bytes(payload) if payload else b''
+        if payload == self._payload:
+            return
+        size = len(payload)
+        self._length = size.to_bytes(4, 'little')
+        self._payload = payload
+        self._payload_bcc = bcc(payload, (size ^ (size >> 8) ^ (size >> 16) ^ (size >> 24)) & 0xFF)
+        self._bytes = None
+    
+    def frame(self) -> bytes:
+        """
+        The encoded frame, built again only after a change.
+
+        :rtype: bytes
+        """
+        b = self._bytes
+        if b is None:
+            b = self._bytes = b''.join((self._prefix, self._params, self._length, self._payload,
+                                        bytes((self._head_bcc ^ self._payload_bcc,))))
+        return b
+    
+    def snapshot(self):
+        """
+        The encoded frame to send, without building a :class:`Message`.
+
+        :rtype: Frame
+        """
+        return Frame(self.gid, self.cid, self.frame())
+    
+    def message(self) -> Message:
+        """
+        Snapshot of the template as an encoded :class:`Message`.
+        """
+        smp = Message.command(self.gid, self.cid, self._params[0:1], self._params[1:2], self._payload or None)
+        smp._bytes = self.frame()
+        return smp
+
+
+class Frame:
+    """
+    An encoded command frame from :func:`FrameTemplate.snapshot`, sent as it is in place of a :class:`Message`.
+    """
+    __slots__ = ('gid', 'cid', '_bytes')
+    
+    def __init__(self, gid, cid, b):
+        self.gid = gid
+        self.cid = cid
+        self._bytes = b
+    
+    def encode(self) -> bytes:
+        return self._bytes
+
+
+class _Request:
+    """
+    A command written or waiting for its turn, resolved with its response by the receive thread.
+    """
+    __slots__ = ('message', 'gid', 'cid', 'priority', 'queued', 'written', 'deadline', 'span_written', 'span_done',
+                 'future')
+    
+    def __init__(self, message, timeout, priority):
+        self.message = message
+        self.gid = message.gid
+        self.cid = message.cid
+        self.priority = priority
+        self.queued = perf_counter()
+        self.written = None  # perf_counter() when the frame was written.
+        self.deadline = self.queued + timeout  # the time waiting for its turn counts.
+        self.span_written = None
+        self.span_done = None
+        self.future = Future()
+
+
+def _operation(func):
+    # the command method is written as a generator that yields (message, timeout) and gets the response back,
+    # so the same code runs blocking, from Command.submit() and from AsyncCommand.
+    @functools.wraps(func)
+    def method(self, *args, **kwargs):
+        return self._run(func(self, *args, **kwargs))
+    
+    method.operation = func
+    return method
 
 
 class Command:
@@ -247,9 +585,10 @@ class Command:
 
     """
     
-    TIME_OUT = 20
-    
-    _DEVICES = dict()
+    TIME_OUT = 20  #: Response timeout(s) of the commands without one in :attr:`timeouts`.
+    RECONNECT_INTERVAL = 0.5  #: Time(s) between two attempts to open the SMCP-IV again after it was lost.
+    FRAME_MAX_LENGTH = FrameDecoder.MAX_LENGTH  #: Longest payload of a frame received, longer ones are dropped.
+    FWDN_FRAME_MAX_LENGTH = 0x10000  #: Longest payload of a frame received during a firmware download.
     
     class STATUS(IntEnum):
         SUCCESS = 0x00  #: Success.
@@ -332,11 +671,12 @@ class Command:
         MIFARE_ULC = 0x23  #: Mifare Ultralight C
     
     class NfcDiscovery:
-        _d = dict(app_type=None, tech=None, type=None, colbit=False, uid=None)
         _b = None
         
         def __init__(self, b):
             self._b = b
+            # one dict per event, the callback may still hold the previous one when this is decoded.
+            self._d = dict(app_type=None, tech=None, type=None, colbit=False, uid=None)
         
         def decode(self):
             self._d['app_type'] = self._b[0]
@@ -347,126 +687,498 @@ class Command:
             
             return self._d
     
-    def __init__(self) -> None:
+    def __init__(self, inventory: Inventory = None, dispatcher: Dispatcher = None, tracer: Tracer = None,
+                 metrics: Metrics = None, spans: SpanTracer = None, timeouts: Timeouts = None,
+                 retry: RetryPolicy = None, reconnect=False, scheduler: Scheduler = None, io=None) -> None:
+        """
+        :param inventory: Inventory used to find the SMCP-IV again after it resets.
+            If None, the devices are enumerated while waiting.
+        :type inventory: Inventory
+        :param dispatcher: Runs the callbacks set by :func:`set_callbacks`.
+            If None, they run one at a time on a thread of their own.
+        :type dispatcher: Dispatcher
+        :param tracer: Records the frames sent and received.
+            If None, the last :attr:`Tracer.SIZE` frames are kept with their payload.
+        :type tracer: Tracer
+        :param metrics: Collects latencies and counters. The 'reader' label is set to the serial number by :func:`open`
+            if it isn't set.
+        :type metrics: Metrics
+        :param spans: Records the time spent in every stage of the commands, in the Chrome trace format.
+            If None, spans aren't recorded.
+        :type spans: SpanTracer
+        :param timeouts: Timeouts of the commands called without a timeout.
+            If None, the :attr:`Timeouts.DEFAULTS`, then :attr:`TIME_OUT`.
+        :type timeouts: Timeouts
+        :param retry: Sends again the commands that failed for a transient reason, the results returned as dict
+            have the number of retries in 'retries'. The retries of any command are in :attr:`last_retries` for
+            the thread that called it, and in the retries attribute of the Future of :func:`submit`.
+            If None, commands aren't retried.
+        :type retry: RetryPolicy
+        :param reconnect: If True, the SMCP-IV is opened again as soon as it is back after the transport failed,
+            and the discovery or EMV mode is restored. Commands return TRANSACTION_ERROR meanwhile.
+        :type reconnect: bool
+        :param scheduler: Orders the commands waiting for SMCP-IV by priority, see :func:`priority`.
+            If None, buzzer, led and set_gpio go first and firmware download last.
+        :type scheduler: Scheduler
+        :param io: Shared threads reading the SMCP-IV, see :class:`pysisoulnfc.pool.IoThreads`.
+            If None, the SMCP-IV is read by a receive thread of its own.
+        :type io: IoThreads
+        """
+        self.inventory = inventory
+        self.dispatcher = dispatcher if dispatcher is not None else Dispatcher()
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.spans = spans
+        self.timeouts = timeouts if timeouts is not None else Timeouts()
+        self.retry = retry
+        self.reconnect = reconnect
+        self.io = io
+        self._reconnect_thread = None
+        self._reconnect_stop = threading.Event()
+        self._closing = False  # set by close(), no reconnect thread is started anymore.
         self._s = None
         self.port = None
         self._cid = None
         self._fwdn_callback = None
         self._recv_thread = None
-        self._evt_thread = None
+        self._decoder = None
         self._terminate = True
         
         self._SMP_TYPE_CMD = b'\x01'
         self._SMP_TYPE_RSP = b'\x02'
         self._SMP_TYPE_EVT = b'\x03'
         
-        self._q_rsp = Queue()
-        self._q_evt = Queue()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._inflight = None  # request written and waiting for its response.
+        self.scheduler = scheduler if scheduler is not None else Scheduler()  # requests waiting for their turn.
         
         self.mode = 0
+        self._mode_param = None  # tech of the discovery or param of the EMV mode, restored after a reconnect.
         self._error = False
-        self._wait_rsp = False
         
-        self._callbacks = dict(discovery=None, error=None, debug=None)
+        self._callbacks = dict(discovery=None, error=None, debug=None, reconnect=None)
+        self._templates = threading.local()  # every thread changes templates of its own, without a lock.
+    
+    def _template(self, gid, cid) -> FrameTemplate:
+        templates = getattr(self._templates, 'by_cid', None)
+        if templates is None:
+            templates = self._templates.by_cid = dict()
+        tpl = templates.get(cid)
+        if tpl is None:
+            tpl = templates[cid] = FrameTemplate(gid, cid)
+        return tpl
     
     def _receive_thread(self):
         while not self._terminate:
-            try:
-                buf = self._s.read()
-                if buf is None:
-                    continue
-                
-                if len(buf) > 0:
-                    smp = Message(buf)
-                    try:
-                        if smp.check_complete_bytes():
-                            msg = smp.decode()
-                            if msg['type'] == 'rsp' and self._wait_rsp:
-                                self._q_rsp.put(smp)
-                            elif msg['type'] == 'evt':
-                                self._q_evt.put(smp)
-                    except ValueError:
-                        print("Packet invalid")
-            except IOError as e:
-                print(e)
-                # print('Read Error')
-                self._error = True
-                to_msg = Message('evt', 'system', 'error', Command.STATUS.TRANSACTION_ERROR)
-                self._q_evt.put(to_msg)
-                if self._wait_rsp:
-                    to_msg = Message('rsp', 'system', 'error', Command.STATUS.TRANSACTION_ERROR)
-                    self._q_rsp.put(to_msg)
+            if not self._receive():
                 break
     
-    def _event_thread(self):
-        while not self._terminate:
+    def _receive(self) -> bool:
+        # one read of the SMCP-IV, from the receive thread or the shared I/O threads. False once the transport failed.
+        decoder = self._decoder
+        metrics = self.metrics
+        spans = self.spans
+        try:
+            buf = self._s.read()
+            if buf is not None and len(buf) > 0:
+                read = spans.now() if spans is not None else None
+                metrics.count('bytes_in', len(buf))
+                errors, discarded = decoder.errors, decoder.discarded
+                for frame in decoder.feed(buf):
+                    metrics.count('frames_in')
+                    b = frame.tobytes()
+                    self._trace(RX, b)
+                    smp = Message.from_bytes(b)
+                    t = smp.type
+                    if t == 'rsp':
+                        if spans is not None:
+                            spans.add('rx.decode', read, spans.now())
+                        self._response(smp, read)
+                    elif t == 'evt':
+                        metrics.count('events')
+                        if spans is not None:
+                            spans.add('rx.decode', read, spans.now())
+                        self._dispatch_event(smp)
+                if decoder.errors != errors:
+                    metrics.count('frame_errors', decoder.errors - errors)
+                if decoder.discarded != discarded:
+                    metrics.count('bytes_discarded', decoder.discarded - discarded)
+            
+            # requests made by submit() have nobody waiting on them to time them out.
+            req = self._inflight
+            if req is not None and req.written is not None and perf_counter() >= req.deadline:
+                self._expire(req)
+        except IOError:
+            metrics.count('transport_errors')
+            self._error = True
+            if self.io is not None:
+                self.io.remove(self)
+            to_msg = Message.event('system', 'error', Command.STATUS.TRANSACTION_ERROR)
+            self._trace(LOCAL, to_msg.encode())
+            self._dispatch_event(to_msg)
+            self._fail_all()
+            # started under the lock, close() either sees a running thread to join or stops it from starting.
+            with self._lock:
+                if self.reconnect and not self._terminate and not self._closing:
+                    self._reconnect_stop.clear()
+                    t = threading.Thread(target=self._reconnect, name='reconnect %s' % self.port)
+                    t.daemon = True
+                    t.start()
+                    self._reconnect_thread = t
+            return False
+        return True
+    
+    def _reconnect(self):
+        inventory = self.inventory if self.inventory is not None else Inventory(interval=self.RECONNECT_INTERVAL)
+        stop = self._reconnect_stop
+        try:
+            self._s.close()
+        except (IOError, Error):
+            pass
+        while not stop.is_set():
+            port = inventory.wait_for(self.port, timeout=self.RECONNECT_INTERVAL)
+            if port is None or stop.is_set():
+                continue
+            try:
+                self._connect(port)
+            except (IOError, Error):
+                # still going away, or the inventory hasn't seen it leave yet.
+                if inventory.is_watching():
+                    inventory.refresh()
+                stop.wait(self.RECONNECT_INTERVAL)
+                continue
+            
+            self.metrics.count('reconnects')
+            if self.mode == 1:
+                self.discovery(self._mode_param)
+            elif self.mode == 2:
+                self.emv(1, self._mode_param)
+            reconnect_func = self._callbacks['reconnect']
+            if callable(reconnect_func):
+                self._submit('reconnect', reconnect_func, self.port)
+            return
+    
+    def _trace(self, direction, frame):
+        entry = self.tracer.record(direction, frame)
+        if entry is not None:
+            debug_func = self._callbacks['debug']
+            if callable(debug_func):
+                # formatted on the dispatcher, not on the thread that sends or receives.
+                self.dispatcher.submit('debug', lambda: debug_func(self.tracer.format_entry(entry)))
+    
+    def _submit(self, name, func, *args, key=None, replaces=None):
+        spans = self.spans
+        if spans is not None:
+            func = spans.wrap('callback.' + name, func, spans.now())
+        self.dispatcher.submit(name, func, *args, key=key, replaces=replaces)
+    
+    def _dispatch_event(self, smp):
+        gid, cid, status = smp.gid, smp.cid, smp.status
+        submit = self._submit
+        debug_func = self._callbacks['debug']
+        if gid == 'nfc' and cid == 'discovery':
+            discovered_func = self._callbacks['discovery']
+            if callable(discovered_func):
+                if status == self.STATUS.SUCCESS:
+                    disc = self.NfcDiscovery(smp.payload)
+                    submit('discovery', discovered_func, status, disc.decode(), key=status)
+                elif status == self.STATUS.LOST_REMOTE_DEVICE:
+                    # the discoveries still queued are stale once the card left, a slow callback doesn't
+                    # hold the loss back behind them.
+                    submit('discovery', discovered_func, status, dict(), key=status, replaces=self.STATUS.SUCCESS)
+                else:
+                    submit('discovery', discovered_func, status, dict(), key=status)
+        elif gid == 'system' and cid == 'debug':
+            if callable(debug_func):
+                submit('debug', debug_func, smp.payload.decode('utf-8'))
+        elif gid == 'system' and cid == 'error':
+            error_func = self._callbacks['error']
+            if callable(error_func):
+                submit('error', error_func, status, key=status)
+    
+    def _response(self, smp, read):
+        req = self._inflight
+        if req is None:
+            self.metrics.count('stray_responses')
+            return
+        if smp.gid != req.gid or smp.cid != req.cid:
+            if smp.gid != 'system' or smp.cid != 'error':
+                # the late response of a command that timed out.
+                self.metrics.count('stray_responses')
+                return
+            smp = Message.response(req.gid, req.cid, smp.status)
+        self._start(self._complete(req, smp, True, read))
+    
+    def _request(self, send, timeout=None, priority=None) -> _Request:
+        # one command is on the wire at a time, the others wait for it by priority, then in order.
+        if timeout is None:
+            timeout = self.timeouts.get(send.gid, send.cid, self.TIME_OUT)
+        req = _Request(send, timeout, self.scheduler.priority(send.gid, send.cid, priority))
+        start = None
+        with self._lock:
+            failed = self._error or self._terminate
+            if not failed:
+                if self._inflight is None:
+                    self._inflight = start = req
+                else:
+                    self.scheduler.push(req)
+        if failed:
+            self._resolve(req, Message.response(req.gid, req.cid, Command.STATUS.TRANSACTION_ERROR))
+        elif start is not None:
+            self._start(start)
+        return req
+    
+    def _start(self, req):
+        while req is not None:
+            req = self._write(req)
+    
+    def _write(self, req):
+        # the next request to write if this one failed.
+        if perf_counter() >= req.deadline:
+            # its time ran out while waiting for its turn, it isn't sent late.
+            to_msg = Message.response(req.gid, req.cid, Command.STATUS.TIMED_OUT)
+            self._trace(LOCAL, to_msg.encode())
+            return self._complete(req, to_msg)
+        spans = self.spans
+        try:
+            if spans is not None:
+                start = spans.now()
+            smp_msg = req.message.encode()
+            if spans is not None:
+                encoded = spans.now()
+                spans.add('encode', start, encoded)
+            self._trace(TX, smp_msg)
+            self.metrics.count('bytes_out', len(smp_msg))
+            self.metrics.count('frames_out')
+            expected = self.timeouts.expected(req.gid, req.cid)
+            with self._write_lock:
+                # before the write, a quick response can be decoded before write() returns.
+                req.written = perf_counter()
+                self._s.expect(expected)
+                self._s.write(smp_msg)
+            self.metrics.observe_wait(req.priority.name.lower(), req.written - req.queued)
+            if spans is not None:
+                req.span_written = spans.now()
+                spans.add('device.write', encoded, req.span_written, 'device')
+        except (IOError, Error):
+            to_msg = Message.response(req.gid, req.cid, Command.STATUS.TRANSACTION_ERROR)
+            self._trace(LOCAL, to_msg.encode())
+            return self._complete(req, to_msg)
+        return None
+    
+    def _complete(self, req, r, received=False, read=None):
+        # resolve req if it is still pending, and return the request to write next.
+        nxt = None
+        with self._lock:
+            if self._inflight is req:
+                self._inflight = nxt = self.scheduler.pop()
+            elif not self.scheduler.remove(req):
+                return None
+        self._resolve(req, r, received, read)
+        return nxt
+    
+    def _resolve(self, req, r, received=False, read=None):
+        elapsed = perf_counter() - req.written if req.written is not None else 0.0
+        self.metrics.observe(req.gid, req.cid, r.status, elapsed)
+        if received:
+            self.timeouts.observe(req.gid, req.cid, elapsed)
+        spans = self.spans
+        if spans is not None and req.span_written is not None:
+            now = spans.now()
+            if received:
+                spans.add('firmware', req.span_written, max(req.span_written, read), 'reader')
+            else:
+                spans.add('wait', req.span_written, now, 'reader')
+            req.span_done = now
+        req.future.set_result(r)
+    
+    def _expire(self, req):
+        if req.future.done():
+            return
+        to_msg = Message.response(req.gid, req.cid, Command.STATUS.TIMED_OUT)
+        self._trace(LOCAL, to_msg.encode())
+        port = self._s
+        if self._inflight is req and port is not None:
+            # the response is lost, the port waits as when idle until the next command is written.
+            port.reset_pending()
+        self._start(self._complete(req, to_msg))
+    
+    def _fail_all(self):
+        with self._lock:
+            reqs = self.scheduler.clear()
+            if self._inflight is not None:
+                reqs.insert(0, self._inflight)
+            self._inflight = None
+        for req in reqs:
+            self._resolve(req, Message.response(req.gid, req.cid, Command.STATUS.TRANSACTION_ERROR))
+    
+    def _wait(self, req) -> Message:
+        future = req.future
+        while True:
             try:
-                smp = self._q_evt.get(timeout=0.1)
-                msg = smp.decode()
-                debug_func = self._callbacks['debug']
-                if callable(debug_func):
-                    debug_func(smp.pprint())
-                if msg['gid'] == 'nfc' and msg['cid'] == 'discovery':
-                    discovered_func = self._callbacks['discovery']
-                    if callable(discovered_func):
-                        if msg['status'] == self.STATUS.SUCCESS:
-                            disc = self.NfcDiscovery(msg['payload'])
-                            discovered_func(msg['status'], disc.decode())
-                        else:
-                            discovered_func(msg['status'], dict())
-                elif msg['gid'] == 'system' and msg['cid'] == 'debug':
-                    debug_func = self._callbacks['debug']
-                    if callable(debug_func):
-                        debug_func(msg['payload'].decode('utf-8'))
-                elif msg['gid'] == 'system' and msg['cid'] == 'error':
-                    error_func = self._callbacks['error']
-                    if callable(error_func):
-                        error_func(msg['status'])
-            except Empty:
-                pass
-    
-    def _send_receive(self, send):
-        while not self._q_rsp.empty():  # clear queue.
-            self._q_rsp.get()
+                r = future.result(max(0.0, req.deadline - perf_counter()))
+                break
+            except FutureTimeout:
+                # on the wire or still waiting for its turn, a queued request is taken out of the scheduler.
+                self._expire(req)
+        spans = self.spans
+        if spans is not None and req.span_done is not None:
+            spans.add('handoff', req.span_done, spans.now())
+        return r
+    
+    def _attempt(self, send, timeout) -> Message:
+        spans = self.spans
+        if spans is not None:
+            called = spans.now()
+        r = self._wait(self._request(send, timeout))
+        if spans is not None:
+            spans.add(send.gid + '.' + send.cid, called, spans.now(), 'command', dict(status=r.status))
+        return r
+    
+    def _retry_timeout(self, gid, cid, timeout, elapsed, delay):
+        t = timeout if timeout is not None else self.timeouts.get(gid, cid, self.TIME_OUT)
+        return min(t, max(0.001, self.retry.budget - elapsed - delay))
+    
+    def _call(self, send, timeout=None) -> tuple:
+        # blocking, with the retries of the retry policy: (response, retries)
+        start = perf_counter()
+        r = self._attempt(send, timeout)
+        retries = 0
+        retry = self.retry
+        if retry is not None:
+            gid, cid = send.gid, send.cid
+            while not self._error:
+                elapsed = perf_counter() - start
+                delay = retry.backoff(gid, cid, r.status, retries, elapsed)
+                if delay is None:
+                    break
+                sleep(delay)
+                retries += 1
+                self.metrics.count('retries')
+                r = self._attempt(send, self._retry_timeout(gid, cid, timeout, elapsed, delay))
+        return r, retries
+    
+    def _call_async(self, send, timeout=None, priority=None) -> Future:
+        # Future of (response, retries), the backoff runs on a timer instead of blocking.
+        result = Future()
+        retry = self.retry
+        gid, cid = send.gid, send.cid
+        start = perf_counter()
         
-        if self._error:
-            return Message('rsp', 'system', 'error', Command.STATUS.TRANSACTION_ERROR)
+        def attempt(retries, t):
+            self._request(send, t, priority).future.add_done_callback(lambda f: done(f.result(), retries))
         
-        s = send.decode()
-        debug_func = self._callbacks['debug']
-        if callable(debug_func):
-            debug_func(send.pprint())
+        def done(r, retries):
+            delay = None
+            if retry is not None and not self._error:
+                elapsed = perf_counter() - start
+                delay = retry.backoff(gid, cid, r.status, retries, elapsed)
+            if delay is None:
+                result.set_result((r, retries))
+                return
+            self.metrics.count('retries')
+            timer = threading.Timer(delay, attempt, (retries + 1, self._retry_timeout(gid, cid, timeout, elapsed,
+                                                                                        delay)))
+            timer.daemon = True
+            timer.start()
         
+        attempt(0, timeout)
+        return result
+    
+    def _send_receive(self, send, timeout=None) -> Message:
+        return self._call(send, timeout)[0]
+    
+    def _with_retries(self, value, retries):
+        if self.retry is not None and isinstance(value, dict):
+            value['retries'] = retries
+        return value
+    
+    @property
+    def last_retries(self) -> int:
+        """
+        Retries of the last command method called by the current thread, 0 if it wasn't retried or none was called.
+        """
+        return getattr(self._local, 'retries', 0)
+    
+    def _run(self, op):
+        # runs an operation(see _operation) blocking.
+        retries = 0
+        r = None
         try:
-            smp_msg = send.encode()
-            self._s.write(smp_msg)
-            self._wait_rsp = True
-            recv = self._q_rsp.get(timeout=self.TIME_OUT)
-            self._wait_rsp = False
-            r = recv.decode()
-            if callable(debug_func):
-                debug_func(recv.pprint())
-            
-            if s['gid'] != r['gid'] or s['cid'] != r['cid']:
-                err_msg = Message('rsp', s['gid'], s['cid'], Command.STATUS.FAILURE)
-                if callable(debug_func):
-                    debug_func(err_msg.pprint())
-                return err_msg
-            return recv
+            while True:
+                send, timeout = op.send(r)
+                r, n = self._call(send, timeout)
+                retries += n
+        except StopIteration as e:
+            return self._with_retries(e.value, retries)
+        finally:
+            self._local.retries = retries
+    
+    def _step(self, op, result, retries, r, priority=None):
+        # runs an operation one command at a time, from the thread that completed the previous one, with the
+        # priority given when it was submitted.
+        try:
+            send, timeout = op.send(r)
+        except StopIteration as e:
+            result.retries = retries
+            result.set_result(self._with_retries(e.value, retries))
+            return
+        except Exception as e:
+            result.retries = retries
+            result.set_exception(e)
+            return
         
-        except Empty:
-            to_msg = Message('rsp', s['gid'], s['cid'], Command.STATUS.TIMED_OUT)
-            if callable(debug_func):
-                debug_func(to_msg.pprint())
-            return to_msg
-        except Error:
-            to_msg = Message('rsp', s['gid'], s['cid'], Command.STATUS.TRANSACTION_ERROR)
-            if callable(debug_func):
-                debug_func(to_msg.pprint())
-            return to_msg
+        def done(f):
+            rsp, n = f.result()
+            self._step(op, result, retries + n, rsp, priority)
+        
+        self._call_async(send, timeout, priority).add_done_callback(done)
+    
+    def submit(self, method, *args, **kwargs) -> Future:
+        """
+        Send a command without waiting for its response.
+
+        Commands from every thread, blocking or submitted, are sent to SMCP-IV one at a time, by priority then in
+        the order they were made, and every response goes to the command it belongs to. The priority of the
+        commands of the method is the one of :func:`priority` around the call to submit.
+
+        :param method: A command method of this object or its name, ex. ``cmd.apdu_tranceive`` or 'apdu_tranceive'.
+        :param args: arguments of the method.
+        :param kwargs: keyword arguments of the method.
+        :return: Future of what the method returns, its retries attribute is the number of retries once it's done.
+            Callbacks added to it run on the receive thread, they must not block.
+        :rtype: concurrent.futures.Future
+        :raise: :class:`ValueError` if the method isn't a command.
+        """
+        if isinstance(method, str):
+            method = getattr(self, method, None)
+        op = getattr(method, 'operation', None)
+        if op is None:
+            raise ValueError('%r is not a command' % (method,))
+        result = Future()
+        # a command on its way can't be called back, the future can't be cancelled.
+        result.set_running_or_notify_cancel()
+        self._step(op(self, *args, **kwargs), result, 0, None, self.scheduler.current())
+        return result
+    
+    def priority(self, priority):
+        """
+        Context manager giving a priority to the commands the current thread makes or submits inside it::
+
+            with cmd.priority(Priority.BULK):
+                for block in range(64):
+                    cmd.mifare_read(block)
+
+        Waiting commands are sent by priority, so a buzzer goes between two reads of the dump.
+
+        :param priority: :class:`pysisoulnfc.scheduler.Priority`
+        """
+        return self.scheduler.using(priority)
     
     @staticmethod
-    def get_ports(serial=None) -> list:
+    def get_ports(serial=None, spi=False) -> list:
         """
         Retrieve serial numbers of SMCP-IV
 
@@ -474,13 +1186,16 @@ class Command:
             If you specify a serial number, it will find and return the SMCP-IV for that serial number.\n
             Default value is None.
         :type serial: str
+        :param spi: If True, SMCP-IV connected through an FTDI adapter are found on SPI instead of I2C.
+        :type spi: bool
         :return: list of serial numbers of SMCP-IV.
         :rtype: list
 
-        .. seealso:: :func:`open`
+        .. seealso:: :func:`open`, :class:`pysisoulnfc.inventory.Inventory` to keep the list without enumerating
+            the devices on every call.
         """
         
-        return Device.get_ports(serial)
+        return Device.get_ports(serial, spi)
     
     def is_connected(self) -> bool:
         """
@@ -489,11 +1204,12 @@ class Command:
         :return: True or False
         :rtype: bool
         """
-        return not self._terminate
+        return not self._terminate and not self._error
     
     def set_callbacks(self, discovery: Callable[[int, dict], None] = None,
                       error: Callable[[int, bytes], None] = None,
-                      debug: Callable[[int, str], None] = None) -> None:
+                      debug: Callable[[int, str], None] = None,
+                      reconnect: Callable[[str], None] = None) -> None:
         
         """
         Register event callback functions.
@@ -503,13 +1219,19 @@ class Command:
         :type discovery: Callable
         :param error: Callback function for error event.
         :type error: Callable
-        :param debug: Callback function for debug messages sent from SMCP-IV.
+        :param debug: Callback function for debug messages sent from SMCP-IV.\n
+            It is also called with every frame recorded by :attr:`tracer`, formatted on the dispatcher thread.
+            To keep the trace without formatting every frame, leave it None and read :attr:`tracer` when needed.
         :type debug: Callable
+        :param reconnect: Callback function called with the serial number when the SMCP-IV was opened again
+            after the transport failed, see the reconnect parameter of :class:`Command`.
+        :type reconnect: Callable
         :return: None
         """
         self._callbacks['discovery'] = discovery
         self._callbacks['error'] = error
         self._callbacks['debug'] = debug
+        self._callbacks['reconnect'] = reconnect
     
     def open(self, port: Device) -> None:
         """
@@ -526,16 +1248,33 @@ class Command:
         if port is None:
             raise self.Error('Port is None')
         
+        self._closing = False
+        self.dispatcher.start()
+        self._connect(port)
+        
+        metrics = self.metrics
+        metrics.labels.setdefault('reader', port.serial)
+        metrics.add_gauge('event_queue_depth', lambda: {k: v['depth'] for k, v in self.dispatcher.stats().items()},
+                          'channel')
+        metrics.add_gauge('events_dropped', lambda: {k: v['dropped'] for k, v in self.dispatcher.stats().items()},
+                          'channel')
+        metrics.add_gauge('queue_depth', self.scheduler.depth, 'priority')
+    
+    def _connect(self, port: Device) -> None:
         self._s = port
+        port.spans = self.spans
         self._s.open()
         self._error = False
         self.port = port.serial
         self._terminate = False
-        self._evt_thread = threading.Thread(target=self._event_thread)
-        self._evt_thread.daemon = True
-        self._evt_thread.start()
+        if callable(getattr(port, 'stats', None)):
+            self.metrics.add_gauge('device', port.stats, 'stat')
         
-        self._recv_thread = threading.Thread(target=self._receive_thread)
+        self._decoder = FrameDecoder(max_length=self.FRAME_MAX_LENGTH)
+        if self.io is not None:
+            self.io.add(self)
+            return
+        self._recv_thread = threading.Thread(target=self._receive_thread, name='receive %s' % port.serial)
         self._recv_thread.daemon = True
         self._recv_thread.start()
     
@@ -545,6 +1284,13 @@ class Command:
 
         :return: None
         """
+        with self._lock:
+            self._closing = True
+            self._reconnect_stop.set()
+            t = self._reconnect_thread
+        if t is not None and t is not threading.current_thread():
+            t.join()
+        self._reconnect_thread = None
         if self._s is not None:
             if not self._error:
                 if self.mode == 1:
@@ -553,43 +1299,56 @@ class Command:
                     self.emv(2)
             self.mode = 0
             self._terminate = True
-            if self._recv_thread is not None:
+            if self.io is not None:
+                self.io.remove(self)
+            elif self._recv_thread is not None:
                 self._recv_thread.join()
-            if self._evt_thread is not None:
-                self._evt_thread.join()
+            self._fail_all()
+            self.dispatcher.close()
             self._s.close()
             self._s = None
     
-    def do_download(self, stream, fwdn_callback):
-        data = stream.read()
-        page = 0
-        while len(data) > 128:
+    @_operation
+    def do_download(self, stream, fwdn_callback, timeout=None) -> bool:
+        """
+        Send the firmware to the boot loader, page by page. :func:`firmware_download` enters the boot loader first.
+
+        :return: True if every page was accepted and SMCP-IV is going to reset.
+        :rtype: bool
+        """
+        decoder = self._decoder
+        if decoder is not None:
+            decoder.max_length = self.FWDN_FRAME_MAX_LENGTH
+        try:
+            data = stream.read()
+            page = 0
+            while len(data) > 128:
+                b_page = page.to_bytes(2, 'little')
+                smp = Message.command('system', 'download', b_page[0:1], b_page[1:2], data[0:128])
+                r = yield smp, timeout
+                if r.status != self.STATUS.SUCCESS:
+                    return False
+                data = data[128:]
+                if fwdn_callback is not None:
+                    fwdn_callback(128)
+                page += 1
+            
             b_page = page.to_bytes(2, 'little')
-            smp = Message('cmd', 'system', 'download', b_page[0:1], b_page[1:2], data[0:128])
-            smp = self._send_receive(smp)
-            r = smp.decode()
-            if r['status'] != self.STATUS.SUCCESS:
+            smp = Message.command('system', 'download', b_page[0:1], b_page[1:2], data)
+            r = yield smp, timeout
+            if r.status != self.STATUS.SUCCESS:
+                return False
+            smp = Message.command('system', 'download', b'\xFF', b'\xFF')
+            r = yield smp, timeout
+            if r.status != self.STATUS.GOING_TO_RESET:
                 return False
-            data = data[128:]
             if fwdn_callback is not None:
-                fwdn_callback(128)
-            page += 1
-        
-        b_page = page.to_bytes(2, 'little')
-        smp = Message('cmd', 'system', 'download', b_page[0:1], b_page[1:2], data)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if r['status'] != self.STATUS.SUCCESS:
-            return False
-        smp = Message('cmd', 'system', 'download', b'\xFF', b'\xFF')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if r['status'] != self.STATUS.GOING_TO_RESET:
-            return False
-        if fwdn_callback is not None:
-            fwdn_callback(len(data))
-        
-        return True
+                fwdn_callback(len(data))
+            
+            return True
+        finally:
+            if decoder is not None:
+                decoder.max_length = self.FRAME_MAX_LENGTH
     
     def firmware_download(self, stream, fwdn_callback) -> bool:
         """
@@ -606,32 +1365,35 @@ class Command:
 
         :raise: :class:`IOError`
         """
-        smp = Message('cmd', 'system', 'download')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if r['status'] == self.STATUS.GOING_TO_RESET:
+        smp = Message.command('system', 'download')
+        r = self._send_receive(smp)
+        if r.status == self.STATUS.GOING_TO_RESET:
             self.mode = 0
-            self.close()
-            sleep(1.0)
-            retry = 100
-            while retry > 0:
-                ports = self.get_ports(self.port)
-                if len(ports) > 0:
-                    break
-                sleep(0.1)
-                retry -= 1
-            if retry == 0:
+            if not self._reopen():
                 return False
-            try:
-                self.open(ports[0])
-            except IOError as e:
-                print(e)
-                return False
-            
             return self.do_download(stream, fwdn_callback)
         return False
     
-    def buzzer(self, hz, ms) -> STATUS:
+    def _reopen(self) -> bool:
+        # close, wait for the SMCP-IV to come back in its boot loader after the reset and open it again.
+        self.close()
+        sleep(1.0)
+        inventory = self.inventory if self.inventory is not None else Inventory(interval=0.1)
+        if inventory.is_watching():
+            # the watcher may not have seen the reset yet.
+            inventory.refresh()
+        port = inventory.wait_for(self.port, timeout=10.0)
+        if port is None:
+            return False
+        try:
+            self.open(port)
+        except IOError as e:
+            print(e)
+            return False
+        return True
+    
+    @_operation
+    def buzzer(self, hz, ms, timeout=None) -> STATUS:
         """
         buzzer control in SMCP-IV.
 
@@ -639,6 +1401,8 @@ class Command:
         :type hz: int
         :param ms: The time the buzzer rings for milliseconds (100 ~ 65535)
         :type ms: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
         """
         if hz < 1 or hz > 4:
@@ -646,18 +1410,20 @@ class Command:
         if ms < 100 or ms > 65535:
             return self.STATUS.INVALID_PARAM
         
-        smp = Message('cmd', 'system', 'buzzer', int(0).to_bytes(1, 'little'), hz.to_bytes(1, 'little'),
+        smp = Message.command('system', 'buzzer', int(0).to_bytes(1, 'little'), hz.to_bytes(1, 'little'),
                       ms.to_bytes(2, 'little'))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        r = yield smp, timeout
+        return r.status
     
-    def led(self, blue, red) -> STATUS:
+    @_operation
+    def led(self, blue, red, timeout=None) -> STATUS:
         """
         led control in SMCP-IV.
 
         :param blue: Blue led control. 1: on, 0: off
         :param red: Red led control. 1: on, 0: off
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
         """
         if blue != 1 or blue != 0:
@@ -665,21 +1431,23 @@ class Command:
         if red != 1 or red != 0:
             return self.STATUS.INVALID_PARAM
         
-        smp = Message('cmd', 'system', 'led', blue.to_bytes(1, 'little'), red.to_bytes(1, 'little'))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
-    
-    def set_gpio(self, i_num, b_level) -> STATUS:
-        smp = Message('cmd', 'system', 'set_gpio', i_num.to_bytes(1, 'little'), b_level.to_bytes(1, 'little'))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
-    
-    def get_dev_info(self) -> Dict[str, Union[int, Any]]:
+        smp = Message.command('system', 'led', blue.to_bytes(1, 'little'), red.to_bytes(1, 'little'))
+        r = yield smp, timeout
+        return r.status
+    
+    @_operation
+    def set_gpio(self, i_num, b_level, timeout=None) -> STATUS:
+        smp = Message.command('system', 'set_gpio', i_num.to_bytes(1, 'little'), b_level.to_bytes(1, 'little'))
+        r = yield smp, timeout
+        return r.status
+    
+    @_operation
+    def get_dev_info(self, timeout=None) -> Dict[str, Union[int, Any]]:
         """
         Get version information of SMCP-IV.
 
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`\n
             If status is :class:`STATUS.SUCCESS`, it has the values defined below:
             \t name: The name of SMCP-IV. This value is always SMCP-IV.\n
@@ -690,29 +1458,29 @@ class Command:
             \t time: This is the time the SMCP-IV firmware was built.
         :rtype: dict
         """
-        smp = Message('cmd', 'system', 'info')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['name'] = r['payload'][0:9].decode(encoding='ascii').replace('\x00', '')
-            ret['major'] = int.from_bytes(r['payload'][9:10], 'little')
-            ret['minor'] = int.from_bytes(r['payload'][10:11], 'little')
-            ret['build'] = int.from_bytes(r['payload'][11:15], 'little')
-            ret['date'] = r['payload'][15:27].decode(encoding='ascii').replace('\x00', '')
-            ret['time'] = r['payload'][27:36].decode(encoding='ascii').replace('\x00', '')
+        smp = Message.command('system', 'info')
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['name'] = r.payload[0:9].decode(encoding='ascii').replace('\x00', '')
+            ret['major'] = int.from_bytes(r.payload[9:10], 'little')
+            ret['minor'] = int.from_bytes(r.payload[10:11], 'little')
+            ret['build'] = int.from_bytes(r.payload[11:15], 'little')
+            ret['date'] = r.payload[15:27].decode(encoding='ascii').replace('\x00', '')
+            ret['time'] = r.payload[27:36].decode(encoding='ascii').replace('\x00', '')
         return ret
     
-    def set_serial(self, str_serial) -> bool:
-        smp = Message('cmd', 'system', 'set_serial', b'\x00', b'\x00', bytes(str_serial.encode('ascii')))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if r['status'] != self.STATUS.GOING_TO_RESET:
+    @_operation
+    def set_serial(self, str_serial, timeout=None) -> bool:
+        smp = Message.command('system', 'set_serial', b'\x00', b'\x00', bytes(str_serial.encode('ascii')))
+        r = yield smp, timeout
+        if r.status != self.STATUS.GOING_TO_RESET:
             self.mode = 0
             return False
         return True
     
-    def conf_reactive(self, is_set=True) -> STATUS:
+    @_operation
+    def conf_reactive(self, is_set=True, timeout=None) -> STATUS:
         """
         Set Reactivate.
 
@@ -721,15 +1489,17 @@ class Command:
             If False, the SMCP-IV does not reactivate after the remote device is first activated.\n
             In this case, you do not know if the remote device has disappeared.
         :type is_set: bool
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
         """
-        smp = Message('cmd', 'nfc', 'conf_reactive', is_set.to_bytes(1, 'little'), b'\x00')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'conf_reactive', is_set.to_bytes(1, 'little'), b'\x00')
+        r = yield smp, timeout
+        return r.status
     
+    @_operation
     def discovery(self, tech=(NfcTech.ISO14443A | NfcTech.ISO14443B | NfcTech.ISO18092 | NfcTech.ISO15693),
-                  start=True) -> STATUS:
+                  start=True, timeout=None) -> STATUS:
         """
         Starts or ends a remote device search.
 
@@ -738,23 +1508,28 @@ class Command:
         :type tech: NfcTech
         :param start: If True, start the discover. Or False to stop the discover.
         :type start: bool
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
         """
-        smp = Message('cmd', 'nfc', 'discovery', tech.to_bytes(1, 'little'), start.to_bytes(1, 'little'))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if start and r['status'] == self.STATUS.SUCCESS:
+        smp = Message.command('nfc', 'discovery', tech.to_bytes(1, 'little'), start.to_bytes(1, 'little'))
+        r = yield smp, timeout
+        if start and r.status == self.STATUS.SUCCESS:
             self.mode = 1
-        elif not start and r['status'] == self.STATUS.SUCCESS:
+            self._mode_param = tech
+        elif not start and r.status == self.STATUS.SUCCESS:
             self.mode = 0
-        return r['status']
+        return r.status
     
-    def read(self, block) -> Dict[str, Optional[Any]]:
+    @_operation
+    def read(self, block, timeout=None) -> Dict[str, Optional[Any]]:
         """
         Reads one block of the card.
 
         :param block: The block number of card.
         :type block: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`\n
             If status is :class:`STATUS.SUCCESS`, it has the values defined below:
             \t data(bytes): Data read from the card.
@@ -764,15 +1539,17 @@ class Command:
         .. note:: This command corresponds to Type 1, Type 2 (except Mifare Classic), and Type 3 cards.
         """
         b = block.to_bytes(2, 'little')
-        smp = Message('cmd', 'nfc', 'read', b[0:1], b[1:2])
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['data'] = r['payload']
+        tpl = self._template('nfc', 'read')
+        tpl.set_params(b[0], b[1])
+        smp = tpl.snapshot()
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['data'] = r.payload
         return ret
     
-    def write(self, block, data) -> STATUS:
+    @_operation
+    def write(self, block, data, timeout=None) -> STATUS:
         """
         Writes one block of the card.
 
@@ -780,21 +1557,25 @@ class Command:
         :type block: int
         :param data: Data to write the card.
         :type data: bytes
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
 
         .. seealso:: :func:`read` :func:`ndef_write` :func:`mifare_write`
         .. note:: This command corresponds to Type 1, Type 2 (except Mifare Classic), and Type 3 cards.
         """
         b = block.to_bytes(2, 'little')
-        smp = Message('cmd', 'nfc', 'write', b[0:1], b[1:2], data)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'write', b[0:1], b[1:2], data)
+        r = yield smp, timeout
+        return r.status
     
-    def ndef_read(self) -> Dict[str, Optional[Any]]:
+    @_operation
+    def ndef_read(self, timeout=None) -> Dict[str, Optional[Any]]:
         """
         Reads NDEF data from the card.
 
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`\n
             If status is :class:`STATUS.SUCCESS`, it has the values defined below:
             \t ndef(bytes): NDEF data read from the card.
@@ -803,63 +1584,66 @@ class Command:
         .. seealso:: :func:`ndef_write` :func:`read` :func:`mifare_read`
         .. note:: This command only corresponds to the Nfc Forum Tag type.
         """
-        smp = Message('cmd', 'nfc', 'ndef_read')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['ndef'] = r['payload']
+        smp = Message.command('nfc', 'ndef_read')
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['ndef'] = r.payload
         return ret
     
-    def ndef_write(self, ndef) -> STATUS:
+    @_operation
+    def ndef_write(self, ndef, timeout=None) -> STATUS:
         """
         Writes NDEF data to the card.
 
         :param ndef: NDEF data to write the card
         :type ndef: bytes
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: :class:`STATUS`
 
         .. seealso:: :func:`ndef_read` :func:`write` :func:`mifare_write`
         .. note:: This command only corresponds to the Nfc Forum Tag type.
         """
-        smp = Message('cmd', 'nfc', 'ndef_write')
-        smp.set_payload(ndef)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'ndef_write', payload=ndef)
+        r = yield smp, timeout
+        return r.status
     
-    def apdu_tranceive(self, capdu) -> Dict[str, Optional[Any]]:
+    @_operation
+    def apdu_tranceive(self, capdu, timeout=None) -> Dict[str, Optional[Any]]:
         """
         Exchange APDUs.
 
         :param capdu: The APDU to transfer to the card.
         :type capdu: bytes
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`\n
             If status is :class:`STATUS.SUCCESS`, it has the values defined below:
             \t data(bytes): APDU received from card
 
         .. note:: This command only corresponds to the application cards.
         """
-        smp = Message('cmd', 'nfc', 'apdu_transfer')
-        smp.set_payload(capdu)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['data'] = r['payload']
+        tpl = self._template('nfc', 'apdu_transfer')
+        tpl.set_payload(capdu)
+        smp = tpl.snapshot()
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['data'] = r.payload
         return ret
     
-    def raw(self, txdata) -> Dict[str, Optional[Any]]:
-        smp = Message('cmd', 'nfc', 'raw')
-        smp.set_payload(txdata)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['data'] = r['payload']
+    @_operation
+    def raw(self, txdata, timeout=None) -> Dict[str, Optional[Any]]:
+        smp = Message.command('nfc', 'raw', payload=txdata)
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['data'] = r.payload
         return ret
     
-    def mifare_auth(self, blk_no, key_type, key) -> STATUS:
+    @_operation
+    def mifare_auth(self, blk_no, key_type, key, timeout=None) -> STATUS:
         """
         Attempt MiFare card authentication.
 
@@ -869,6 +1653,8 @@ class Command:
         :type key_type: int
         :param key: The key of the block to be authenticated.
         :type key: bytes
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_read` :func:`mifare_write` :func:`mifare_increment` :func:`mifare_decrement`
@@ -883,17 +1669,19 @@ class Command:
         
         b = blk_no.to_bytes(1, 'little')
         key_ab = key_type.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_auth', b, key_ab, key)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_auth', b, key_ab, key)
+        r = yield smp, timeout
+        return r.status
     
-    def mifare_read(self, blk_no) -> Dict[STATUS, Optional[bytes]]:
+    @_operation
+    def mifare_read(self, blk_no, timeout=None) -> Dict[STATUS, Optional[bytes]]:
         """
         The data read from Mifare card.
 
         :param blk_no: The block number of Mifare card.
         :type blk_no: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`\n
             If status is :class:`STATUS.SUCCESS`, it has the values defined below:
             \t data(bytes): The data read from card
@@ -903,16 +1691,17 @@ class Command:
         .. note:: This command only corresponds to the Mifare Classic.\n
             :func:`mifare_auth` must precede this command.
         """
-        b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_read', b, b'\x00')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        ret = dict(status=r['status'])
-        if r['status'] == self.STATUS.SUCCESS:
-            ret['data'] = r['payload']
+        tpl = self._template('nfc', 'mfc_read')
+        tpl.set_param1(blk_no.to_bytes(1, 'little')[0])
+        smp = tpl.snapshot()
+        r = yield smp, timeout
+        ret = dict(status=r.status)
+        if r.status == self.STATUS.SUCCESS:
+            ret['data'] = r.payload
         return ret
     
-    def mifare_write(self, blk_no, data) -> STATUS:
+    @_operation
+    def mifare_write(self, blk_no, data, timeout=None) -> STATUS:
         """
         The data writes to Mifare card.
 
@@ -920,6 +1709,8 @@ class Command:
         :type blk_no: int
         :param data: Data to write the card.
         :type data: bytes
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_auth` :func:`mifare_read` :func:`mifare_increment` :func:`mifare_decrement`
@@ -928,12 +1719,12 @@ class Command:
             :func:`mifare_auth` must precede this command.
         """
         b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_write', b, b'\x00', data)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_write', b, b'\x00', data)
+        r = yield smp, timeout
+        return r.status
     
-    def mifare_increment(self, blk_no, value) -> STATUS:
+    @_operation
+    def mifare_increment(self, blk_no, value, timeout=None) -> STATUS:
         """
         Increase the value of the block in Mifare.
 
@@ -941,6 +1732,8 @@ class Command:
         :type blk_no: int
         :param value: The value to be increased
         :type value: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_auth` :func:`mifare_read` :func:`mifare_write` :func:`mifare_decrement`
@@ -949,12 +1742,12 @@ class Command:
             :func:`mifare_auth` must precede this command.
         """
         b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_inc', b, b'\x00', value.to_bytes(4, 'little', signed=True))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_inc', b, b'\x00', value.to_bytes(4, 'little', signed=True))
+        r = yield smp, timeout
+        return r.status
     
-    def mifare_decrement(self, blk_no, value) -> STATUS:
+    @_operation
+    def mifare_decrement(self, blk_no, value, timeout=None) -> STATUS:
         """
         Decrease the value of the block in Mifare.
 
@@ -962,6 +1755,8 @@ class Command:
         :type blk_no: int
         :param value: The value to be decreased
         :type value: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_auth` :func:`mifare_read` :func:`mifare_write` :func:`mifare_increment`
@@ -971,17 +1766,19 @@ class Command:
         """
         
         b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_dec', b, b'\x00', value.to_bytes(4, 'little', signed=True))
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_dec', b, b'\x00', value.to_bytes(4, 'little', signed=True))
+        r = yield smp, timeout
+        return r.status
     
-    def mifare_restore(self, blk_no) -> STATUS:
+    @_operation
+    def mifare_restore(self, blk_no, timeout=None) -> STATUS:
         """
         Restore the value of the block in Mifare.
 
         :param blk_no: The block number of Mifare card.
         :type blk_no: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_auth` :func:`mifare_read` :func:`mifare_write` :func:`mifare_increment`
@@ -991,17 +1788,19 @@ class Command:
         """
         
         b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_restore', b, b'\x00')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_restore', b, b'\x00')
+        r = yield smp, timeout
+        return r.status
     
-    def mifare_transfer(self, blk_no) -> STATUS:
+    @_operation
+    def mifare_transfer(self, blk_no, timeout=None) -> STATUS:
         """
         Save the value of the block in Mifare.
 
         :param blk_no: The block number of Mifare card.
         :type blk_no: int
+        :param timeout: Time(s) to wait for the response. If None, the timeout given by :attr:`timeouts`.
+        :type timeout: float
         :return: status: :class:`STATUS`
 
         .. seealso:: :func:`mifare_auth` :func:`mifare_read` :func:`mifare_write` :func:`mifare_increment`
@@ -1011,20 +1810,20 @@ class Command:
         """
         
         b = blk_no.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'mfc_transfer', b, b'\x00')
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        return r['status']
+        smp = Message.command('nfc', 'mfc_transfer', b, b'\x00')
+        r = yield smp, timeout
+        return r.status
     
-    def emv(self, mode, param=0):
+    @_operation
+    def emv(self, mode, param=0, timeout=None):
         m = mode.to_bytes(1, 'little')
         p = param.to_bytes(1, 'little')
-        smp = Message('cmd', 'nfc', 'emv', m, p)
-        smp = self._send_receive(smp)
-        r = smp.decode()
-        if mode == 1 and r['status'] == self.STATUS.SUCCESS:
+        smp = Message.command('nfc', 'emv', m, p)
+        r = yield smp, timeout
+        if mode == 1 and r.status == self.STATUS.SUCCESS:
             self.mode = 2
-        elif mode == 2 and r['status'] == self.STATUS.SUCCESS:
+            self._mode_param = param
+        elif mode == 2 and r.status == self.STATUS.SUCCESS:
             self.mode = 0
         
-        return r['status']
+        return r.status
@@ -0,0 +1,332 @@
+"""
+Many SMCP-IV in one process.
+
+:class:`ReaderPool` opens every attached SMCP-IV at once, follows the readers that join and leave, and sends the
+events of all of them to one set of callbacks with the serial number of the reader::
+
+    pool = ReaderPool()
+    pool.set_callbacks(discovery=lambda serial, status, card: ...)
+    pool.open()
+    pool.submit_all('discovery')
+    pool.submit('SN0001', 'buzzer', 1, 100).result()
+
+The readers are read by a few :class:`IoThreads` shared by the pool and their callbacks run on one
+:class:`Dispatcher`, so a pool of 16 readers runs on a handful of threads instead of two per reader.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pysisoulnfc.device import Device, Error
+from pysisoulnfc.dispatch import Dispatcher
+from pysisoulnfc.inventory import Inventory
+from pysisoulnfc.metrics import prometheus_text
+from pysisoulnfc.nfc import Command
+
+
+def _set_poll(port: Device, poll: float) -> None:
+    # a shared thread reads its readers in turn, a read mustn't block much longer than poll.
+    if callable(getattr(port, 'set_read_timeout', None)):
+        port.set_read_timeout(1, max(1, int(poll * 1000)), adaptive=False)
+    elif hasattr(port, 'irq_timeout'):
+        port.irq_timeout = poll
+    elif hasattr(port, 'read_timeout'):
+        port.read_timeout = poll
+
+
+class _Group:
+    # the readers of one I/O thread. The lock is held while one of them is read, so a reader removed is never
+    # read again once remove() returned.
+    
+    def __init__(self, name):
+        self.name = name
+        self.readers = list()
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = None
+    
+    def run(self):
+        while True:
+            with self.lock:
+                while len(self.readers) == 0 and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                readers = list(self.readers)
+            for command in readers:
+                with self.lock:
+                    if command in self.readers:
+                        command._receive()
+
+
+class IoThreads:
+    """
+    Threads reading the SMCP-IV of many :class:`Command`, given as their io parameter.
+
+    Every reader is added to the thread with the fewest readers, which reads them in turn. The read timeouts of
+    the ports are cut to poll, a response waits at most about poll times the other readers of its thread.
+    """
+    THREADS = 4  #: Number of threads.
+    POLL = 0.002  #: Longest time(s) a read of an idle reader blocks.
+    
+    def __init__(self, threads=THREADS, poll=POLL):
+        """
+        :param threads: Number of threads, started when a reader is added to them.
+        :type threads: int
+        :param poll: Longest time(s) a read of an idle reader blocks.
+        :type poll: float
+        """
+        if threads < 1:
+            raise ValueError('Size is invalid')
+        if poll <= 0:
+            raise ValueError('Poll is invalid')
+        self.poll = poll
+        self._groups = [_Group('io %d' % i) for i in range(threads)]
+        self._members = dict()  # Command -> _Group
+        self._lock = threading.Lock()
+    
+    def add(self, command: Command) -> None:
+        """
+        Start reading the SMCP-IV of command, called by :func:`Command.open`.
+        """
+        _set_poll(command._s, self.poll)
+        with self._lock:
+            group = min(self._groups, key=lambda g: len(g.readers))
+            self._members[command] = group
+        with group.lock:
+            group.closed = False
+            group.readers.append(command)
+            if group.thread is None:
+                group.thread = threading.Thread(target=group.run, name=group.name)
+                group.thread.daemon = True
+                group.thread.start()
+            group.cond.notify()
+    
+    def remove(self, command: Command) -> None:
+        """
+        Stop reading the SMCP-IV of command, called by :func:`Command.close`. Once it returns the SMCP-IV isn't
+        read anymore, unless it's called from the thread reading it.
+        """
+        with self._lock:
+            group = self._members.pop(command, None)
+        if group is None:
+            return
+        with group.lock:
+            if command in group.readers:
+                group.readers.remove(command)
+    
+    def close(self) -> None:
+        """
+        Stop the threads, the readers still added aren't read anymore.
+        """
+        for group in self._groups:
+            with group.lock:
+                group.closed = True
+                group.cond.notify_all()
+                t, group.thread = group.thread, None
+            if t is not None and t is not threading.current_thread():
+                t.join()
+    
+    def stats(self) -> dict:
+        """
+        :return: {thread name: number of readers}
+        :rtype: dict
+        """
+        return {g.name: len(g.readers) for g in self._groups}
+
+
+class ReaderPool:
+    """
+    The SMCP-IV attached to the host, by serial number.
+    """
+    
+    def __init__(self, inventory: Inventory = None, io: IoThreads = None, dispatcher: Dispatcher = None,
+                 watch=True, **kwargs):
+        """
+        :param inventory: Finds the readers. If None, the pool has one of its own.
+        :type inventory: Inventory
+        :param io: Threads reading the readers. If None, :attr:`IoThreads.THREADS` threads.
+        :type io: IoThreads
+        :param dispatcher: Runs the callbacks set by :func:`set_callbacks`.
+            If None, they run one at a time on a thread of their own.
+        :type dispatcher: Dispatcher
+        :param watch: If True, :func:`open` starts watching the inventory, readers attached later are opened and
+            readers detached are closed.
+        :type watch: bool
+        :param kwargs: parameters of :class:`Command` given to every reader, ex. timeouts or retry.
+            A reader that comes back is opened again by the pool, reconnect isn't used.
+        """
+        self.inventory = inventory if inventory is not None else Inventory()
+        self.io = io if io is not None else IoThreads()
+        self.dispatcher = dispatcher if dispatcher is not None else Dispatcher()
+        self.watch = watch
+        self._kwargs = kwargs
+        self._readers = dict()  # serial -> Command
+        self._opening = set()
+        self._lock = threading.Lock()
+        self._watching = None  # True if the pool started the watcher of the inventory.
+        self._callbacks = dict(discovery=None, error=None, arrival=None, removal=None)
+    
+    def __len__(self):
+        return len(self._readers)
+    
+    def __contains__(self, serial):
+        return serial in self._readers
+    
+    def serials(self) -> list:
+        """
+        :return: serial numbers of the open readers.
+        :rtype: list
+        """
+        with self._lock:
+            return sorted(self._readers)
+    
+    def get(self, serial: str) -> Command:
+        """
+        :param serial: serial number of SMCP-IV.
+        :return: the reader, or None if it isn't open.
+        :rtype: Command
+        """
+        return self._readers.get(serial)
+    
+    def set_callbacks(self, discovery=None, error=None, arrival=None, removal=None) -> None:
+        """
+        Register callbacks for the events of every reader, called with the serial number of the reader first.
+
+        :param discovery: Called with (serial, status, card) when a card is found or lost, see
+            :func:`Command.set_callbacks`.
+        :param error: Called with (serial, status) for an error event, or TRANSACTION_ERROR when the transport
+            of the reader failed.
+        :param arrival: Called with the serial of a reader opened.
+        :param removal: Called with the serial of a reader closed because it was detached.
+        :return: None
+        """
+        self._callbacks['discovery'] = discovery
+        self._callbacks['error'] = error
+        self._callbacks['arrival'] = arrival
+        self._callbacks['removal'] = removal
+    
+    def _submit(self, name, *args):
+        replaces = None
+        if name == 'discovery' and args[1] == Command.STATUS.LOST_REMOTE_DEVICE:
+            replaces = (args[0], Command.STATUS.SUCCESS)  # see Command._dispatch_event.
+        self.dispatcher.submit(name, self._callbacks[name], *args, key=args[:2], replaces=replaces)
+    
+    def _claim(self, serial) -> bool:
+        with self._lock:
+            if serial in self._readers or serial in self._opening:
+                return False
+            self._opening.add(serial)
+            return True
+    
+    def _open(self, port: Device) -> Command:
+        # on a thread of open() or on the inventory thread.
+        serial = port.serial
+        try:
+            kwargs = dict(self._kwargs)
+            kwargs.update(dispatcher=Dispatcher(Dispatcher.INLINE), io=self.io, reconnect=False)
+            cmd = Command(**kwargs)
+            cmd.set_callbacks(discovery=lambda status, card: self._submit('discovery', serial, status, card),
+                              error=lambda status: self._submit('error', serial, status))
+            cmd.open(port)
+        except (IOError, Error):
+            with self._lock:
+                self._opening.discard(serial)
+            return None
+        with self._lock:
+            self._opening.discard(serial)
+            self._readers[serial] = cmd
+        self._submit('arrival', serial)
+        return cmd
+    
+    def _arrival(self, port: Device) -> None:
+        if self._claim(port.serial):
+            self._open(port)
+    
+    def _removal(self, port: Device) -> None:
+        with self._lock:
+            cmd = self._readers.pop(port.serial, None)
+        if cmd is not None:
+            cmd.close()
+            self._submit('removal', port.serial)
+    
+    def open(self, ports: list = None) -> list:
+        """
+        Open the readers in parallel.
+
+        :param ports: ports to open. If None, every port of the inventory.
+        :type ports: list
+        :return: serial numbers of the readers opened, a reader that failed to open is left out.
+        :rtype: list
+        """
+        self.dispatcher.start()
+        if self.watch and ports is None and self._watching is None:
+            # the first scan reports every reader as arrived, it's done before listening so they open in parallel.
+            # A reader found by the watcher until the listener is added is in the ports read after it.
+            self._watching = not self.inventory.is_watching()
+            self.inventory.start()
+            self.inventory.add_listener(self._arrival, self._removal)
+        if ports is None:
+            ports = self.inventory.ports()
+        ports = [port for port in ports if self._claim(port.serial)]
+        if len(ports) == 0:
+            return list()
+        # the HID handshake of every reader waits for its answer, open them at once.
+        with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+            opened = list(executor.map(self._open, ports))
+        return [cmd.port for cmd in opened if cmd is not None]
+    
+    def close(self) -> None:
+        """
+        Close every reader and stop the threads of the pool.
+
+        :return: None
+        """
+        if self._watching is not None:
+            self.inventory.remove_listener(self._arrival, self._removal)
+            if self._watching:
+                self.inventory.stop()
+            self._watching = None
+        with self._lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+        if len(readers) > 0:
+            with ThreadPoolExecutor(max_workers=len(readers)) as executor:
+                list(executor.map(lambda cmd: cmd.close(), readers))
+        self.io.close()
+        self.dispatcher.close()
+    
+    def submit(self, serial: str, method, *args, **kwargs):
+        """
+        Send a command to a reader, see :func:`Command.submit`.
+
+        :param serial: serial number of the reader.
+        :param method: name of the command method, ex. 'apdu_tranceive'.
+        :return: Future of what the method returns.
+        :rtype: concurrent.futures.Future
+        :raise: :class:`ValueError` if the reader isn't open.
+        """
+        cmd = self._readers.get(serial)
+        if cmd is None:
+            raise ValueError('Reader %s is not open' % serial)
+        return cmd.submit(method, *args, **kwargs)
+    
+    def submit_all(self, method, *args, **kwargs) -> dict:
+        """
+        Send a command to every reader.
+
+        :return: {serial: Future}
+        :rtype: dict
+        """
+        with self._lock:
+            readers = list(self._readers.items())
+        return {serial: cmd.submit(method, *args, **kwargs) for serial, cmd in readers}
+    
+    def prometheus(self) -> str:
+        """
+        :return: metrics of every reader in the Prometheus text format.
+        :rtype: str
+        """
+        with self._lock:
+            readers = list(self._readers.values())
+        return prometheus_text([cmd.metrics for cmd in readers])
@@ -0,0 +1,70 @@
+"""
+Retry of the commands that failed for a transient reason.
+
+:class:`RetryPolicy` is given to :class:`pysisoulnfc.nfc.Command`::
+
+    cmd = Command(retry=RetryPolicy(retries=3, budget=1.0))
+
+A command is sent again when
+
+- SMCP-IV rejected the frame(TRANSFER_BCC, TRANSFER_PACKET): it wasn't run, so any command is retried.
+- the response timed out or the transfer failed(TIMED_OUT, TRANSACTION_ERROR): the command may have been run,
+  so only the idempotent ones are retried. Value operations, writes and APDUs are not.
+
+Retries wait a random time up to an exponential backoff, and stop when the time budget of the call is spent.
+"""
+import random
+
+_TIMED_OUT = 0x16
+_TRANSFER_BCC = 0x31
+_TRANSFER_PACKET = 0x32
+_TRANSACTION_ERROR = 0x33
+
+
+class RetryPolicy:
+    #: Statuses of a frame rejected by SMCP-IV before running the command.
+    REJECTED = frozenset((_TRANSFER_BCC, _TRANSFER_PACKET))
+    #: Statuses after which the command may or may not have been run.
+    UNCERTAIN = frozenset((_TIMED_OUT, _TRANSACTION_ERROR))
+    #: Commands that can be run twice with the same result.
+    IDEMPOTENT = frozenset((('system', 'info'), ('system', 'led'), ('system', 'set_gpio'),
+                            ('nfc', 'conf_reactive'), ('nfc', 'get_tag_info'), ('nfc', 'read'), ('nfc', 'ndef_read'),
+                            ('nfc', 'mfc_auth'), ('nfc', 'mfc_read')))
+    
+    def __init__(self, retries=3, base=0.01, cap=0.2, budget=2.0, idempotent=IDEMPOTENT, seed=None):
+        """
+        :param retries: most retries of one call.
+        :param base: backoff(s) of the first retry, doubled on every retry.
+        :param cap: longest backoff(s).
+        :param budget: time(s) from the first attempt after which no retry is started. The timeout of a retry is
+            cut to what is left of it.
+        :param idempotent: (gid, cid) of the commands retried after TIMED_OUT or TRANSACTION_ERROR.
+        :param seed: seed of the jitter.
+        """
+        if retries < 0 or base < 0 or cap < base or budget <= 0:
+            raise ValueError('Retry policy is invalid')
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self.idempotent = frozenset(idempotent)
+        self._random = random.Random(seed)
+    
+    def retryable(self, gid: str, cid: str, status: int) -> bool:
+        if status in self.REJECTED:
+            return True
+        return status in self.UNCERTAIN and (gid, cid) in self.idempotent
+    
+    def backoff(self, gid: str, cid: str, status: int, retries: int, elapsed: float) -> float:
+        """
+        :param retries: retries already made.
+        :param elapsed: time(s) since the first attempt.
+        :return: time(s) to wait before the next attempt, or None if there is none.
+        :rtype: float
+        """
+        if retries >= self.retries or not self.retryable(gid, cid, status):
+            return None
+        delay = self._random.uniform(0, min(self.cap, self.base * (2 ** retries)))
+        if elapsed + delay >= self.budget:
+            return None
+        return delay
@@ -0,0 +1,120 @@
+"""
+Order in which the commands waiting for a reader are sent.
+
+SMCP-IV runs one command at a time. :class:`Scheduler` keeps the commands waiting for their turn in one queue per
+:class:`Priority` and always sends the most urgent one next, so a beep after an access decision goes between two
+pages of a firmware download or two blocks of a card dump instead of after them. Every command is a step of its
+own, bulk work yields to urgent commands between any two of its commands.
+
+The priority of a command is given by :attr:`Scheduler.PRIORITIES`, or for every command made by a thread inside
+``with cmd.priority(Priority.BULK):``.
+"""
+import threading
+from collections import deque
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  #: Feedback to a user: buzzer, led, gpio.
+    NORMAL = 1  #: Everything else.
+    BULK = 2  #: Background work that can wait: firmware download, card dumps.
+
+
+class _Using:
+    def __init__(self, local, priority):
+        self._local = local
+        self._priority = priority
+        self._saved = None
+    
+    def __enter__(self):
+        self._saved = getattr(self._local, 'priority', None)
+        self._local.priority = self._priority
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._local.priority = self._saved
+        return False
+
+
+class Scheduler:
+    #: Priority of the commands by (gid, cid), the others are :attr:`Priority.NORMAL`.
+    PRIORITIES = {('system', 'buzzer'): Priority.INTERACTIVE, ('system', 'led'): Priority.INTERACTIVE,
+                  ('system', 'set_gpio'): Priority.INTERACTIVE, ('system', 'download'): Priority.BULK}
+    
+    def __init__(self, priorities: dict = None):
+        """
+        :param priorities: {(gid, cid): :class:`Priority`} added to :attr:`PRIORITIES`.
+        :type priorities: dict
+        """
+        self.priorities = dict(self.PRIORITIES)
+        if priorities is not None:
+            self.priorities.update(priorities)
+        self._queues = tuple(deque() for p in Priority)
+        self._local = threading.local()
+    
+    def using(self, priority):
+        """
+        Context manager giving a priority to every command made by the current thread inside it.
+
+        :param priority: :class:`Priority`
+        """
+        return _Using(self._local, Priority(priority))
+    
+    def current(self):
+        """
+        :return: priority given to the current thread by :func:`using`, or None.
+        """
+        return getattr(self._local, 'priority', None)
+    
+    def priority(self, gid: str, cid: str, priority=None) -> Priority:
+        """
+        :param priority: priority given when the command was submitted, see :func:`current`.
+        :return: priority of a command made now by the current thread.
+        :rtype: Priority
+        """
+        if priority is None:
+            priority = self.current()
+        if priority is not None:
+            return priority
+        return self.priorities.get((gid, cid), Priority.NORMAL)
+    
+    # the queues are only used under the lock of the Command.
+    
+    def __len__(self):
+        return sum(len(q) for q in self._queues)
+    
+    def push(self, req) -> None:
+        self._queues[req.priority].append(req)
+    
+    def pop(self):
+        """
+        :return: the oldest of the most urgent requests, or None.
+        """
+        for q in self._queues:
+            if len(q) > 0:
+                return q.popleft()
+        return None
+    
+    def remove(self, req) -> bool:
+        q = self._queues[req.priority]
+        if req in q:
+            q.remove(req)
+            return True
+        return False
+    
+    def clear(self) -> list:
+        """
+        :return: the requests removed, most urgent first.
+        """
+        reqs = list()
+        for q in self._queues:
+            reqs.extend(q)
+            q.clear()
+        return reqs
+    
+    def depth(self) -> dict:
+        """
+        :return: {priority name: number of requests waiting}
+        :rtype: dict
+        """
+        return {p.name.lower(): len(self._queues[p]) for p in Priority}
@@ -0,0 +1,477 @@
+"""
+SMCP-IV emulated in software, for tests and load tests without a reader.
+
+:class:`SimulatedDevice` is a :class:`Device` that answers the ``system`` and ``nfc`` commands the way the
+firmware does, with virtual tags that are placed in and removed from the field.
+Latency, jitter and transport errors can be configured, and the 64 byte HID reports can be emulated.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from pysisoulnfc.device import Device, Error
+from pysisoulnfc.nfc import Command, FrameDecoder, Message
+from pysisoulnfc.speedups import hid_fragment, hid_report_count, HidReassembler
+
+STATUS = Command.STATUS
+
+_HID_CID = b'\x11\x22\x33\x44'
+
+
+class VirtualTag:
+    """
+    A tag for :class:`SimulatedDevice`.
+
+    Blocks that were never written read as zeros. With Mifare Classic, every sector must be authenticated
+    with the key in :attr:`keys` (any key if the sector has none), and value blocks use the Mifare format.
+    """
+    
+    def __init__(self, uid=b'\x04\x11\x22\x33\x44\x55\x66', tech=Command.NfcTech.ISO14443A,
+                 tag_type=Command.NfcTagType.TYPE2, app_type=Command.NfcTagAppType2.MIFARE_UL,
+                 block_size=4, ndef=None, apdu=None):
+        """
+        :param uid: UID of the tag.
+        :type uid: bytes
+        :param tech: :class:`Command.NfcTech`
+        :param tag_type: :class:`Command.NfcTagType`
+        :param app_type: application type reported by the discovery event.
+        :param block_size: size of a block read by ``nfc read``, 16 for Mifare Classic.
+        :type block_size: int
+        :param ndef: NDEF message of the tag, None if the tag isn't formatted.
+        :type ndef: bytes
+        :param apdu: Called with a C-APDU, returns the R-APDU. Answers 6D00 if None.
+        :type apdu: Callable[[bytes], bytes]
+        """
+        self.uid = bytes(uid)
+        self.tech = int(tech)
+        self.tag_type = int(tag_type)
+        self.app_type = int(app_type)
+        self.block_size = block_size
+        self.ndef = ndef
+        self.apdu = apdu
+        self.blocks = dict()  # block number -> bytes
+        self.keys = dict()  # Mifare sector -> (key type, key)
+    
+    @classmethod
+    def mifare_classic(cls, uid=b'\x01\x02\x03\x04', **kwargs):
+        return cls(uid, Command.NfcTech.ISO14443A, Command.NfcTagType.TYPE2,
+                   Command.NfcTagAppTypeMiFareClassic.MIFARE_1K, block_size=16, **kwargs)
+    
+    @classmethod
+    def iso_dep(cls, uid=b'\x08\x01\x02\x03', apdu=None, **kwargs):
+        return cls(uid, Command.NfcTech.ISO14443A, Command.NfcTagType.TYPE4, 0, apdu=apdu, **kwargs)
+    
+    def discovery_payload(self) -> bytes:
+        return bytes((self.app_type, self.tech, self.tag_type, 0, len(self.uid))) + self.uid
+    
+    def read_block(self, block: int) -> bytes:
+        return self.blocks.get(block, bytes(self.block_size))
+    
+    def value(self, block: int) -> int:
+        """
+        :return: the value of a Mifare value block, or None if the block isn't a value block.
+        :rtype: int
+        """
+        data = self.read_block(block)
+        v = data[0:4]
+        if v != data[8:12] or bytes(b ^ 0xFF for b in v) != data[4:8]:
+            return None
+        return int.from_bytes(v, 'little', signed=True)
+    
+    def set_value(self, block: int, value: int) -> None:
+        """
+        Write a Mifare value block.
+        """
+        v = value.to_bytes(4, 'little', signed=True)
+        inv = bytes(b ^ 0xFF for b in v)
+        self.blocks[block] = v + inv + v + bytes((block, block ^ 0xFF, block, block ^ 0xFF))
+    
+    def transceive(self, capdu: bytes) -> bytes:
+        if callable(self.apdu):
+            return self.apdu(capdu)
+        return b'\x6D\x00'
+
+
+class SimulatedDevice(Device):
+    """
+    Emulated SMCP-IV.
+
+    Responses and events are returned by :func:`read` once their latency has passed, in the order they were
+    made. Errors are injected at random with the ``*_rate`` probabilities, or for the next responses with
+    :func:`inject`.
+    """
+    NAME = 'SMCP-IV'
+    VERSION = (1, 0, 0)  #: (major, minor, build) reported by ``system info``.
+    LATENCY = 0.0005  #: Default time(s) from a command to its response.
+    READ_TIMEOUT = 0.01  #: Longest time(s) :func:`read` blocks before it returns None.
+    
+    BCC = 'bcc'  #: The response has a wrong BCC.
+    TIMEOUT = 'timeout'  #: No response.
+    IO = 'io'  #: :func:`read` raises :class:`IOError`.
+    
+    def __init__(self, serial='SIM00001', latency=LATENCY, jitter=0.0, bcc_error_rate=0.0, timeout_rate=0.0,
+                 io_error_rate=0.0, hid=False, seed=None, read_timeout=READ_TIMEOUT):
+        """
+        :param serial: serial number.
+        :param latency: time(s) from a command to its response.
+        :type latency: float
+        :param jitter: random time(s) from 0 to jitter added to the latency.
+        :type jitter: float
+        :param bcc_error_rate: probability of a response with a wrong BCC.
+        :param timeout_rate: probability of a command without response.
+        :param io_error_rate: probability of a transport error after a command.
+        :param hid: If True, frames are split into and rebuilt from 64 byte HID reports, as with :class:`DeviceHid`.
+        :type hid: bool
+        :param seed: seed of the random generator, for repeatable runs.
+        :param read_timeout: Longest time(s) :func:`read` blocks before it returns None.
+        :type read_timeout: float
+        """
+        self.serial = serial
+        self.latency = latency
+        self.jitter = jitter
+        self.bcc_error_rate = bcc_error_rate
+        self.timeout_rate = timeout_rate
+        self.io_error_rate = io_error_rate
+        self.hid = hid
+        self.read_timeout = read_timeout
+        self._random = random.Random(seed)
+        
+        self._cond = threading.Condition()
+        self._out = deque()  # (due time, frame or an exception)
+        self._last_due = 0.0
+        self._injected = deque()
+        self._decoder = FrameDecoder(max_length=0x10000)  # commands of the host, long apdus included.
+        self._reports = bytearray(64 * 8)
+        self._opened = False
+        
+        self._tag = None
+        self._discovery = 0  # tech mask while discovering
+        self._emv = False
+        self._auth = None  # authenticated Mifare sector
+        self._value = None  # Mifare transfer buffer
+        self._events = list()  # events sent after the response of the command being handled
+        
+        self.commands = 0
+        self.errors = 0
+    
+    # field
+    
+    def place(self, tag: VirtualTag) -> None:
+        """
+        Put a tag in the field. A discovery event is sent if discovery is running.
+
+        :return: None
+        """
+        with self._cond:
+            self._tag = tag
+            self._auth = None
+            if self._discovery & tag.tech:
+                self._queue(Message.event('nfc', 'discovery', STATUS.SUCCESS, tag.discovery_payload()).encode())
+    
+    def remove(self) -> None:
+        """
+        Take the tag out of the field. A lost event is sent if discovery is running.
+
+        :return: None
+        """
+        with self._cond:
+            tag, self._tag = self._tag, None
+            self._auth = None
+            if tag is not None and self._discovery & tag.tech:
+                self._queue(Message.event('nfc', 'discovery', STATUS.LOST_REMOTE_DEVICE).encode())
+    
+    @property
+    def tag(self) -> VirtualTag:
+        return self._tag
+    
+    def inject(self, kind: str, count=1) -> None:
+        """
+        Make the next count responses fail.
+
+        :param kind: :attr:`BCC`, :attr:`TIMEOUT` or :attr:`IO`
+        :return: None
+        """
+        if kind not in (self.BCC, self.TIMEOUT, self.IO):
+            raise ValueError('Kind is invalid')
+        with self._cond:
+            self._injected.extend([kind] * count)
+    
+    # Device
+    
+    def open(self):
+        with self._cond:
+            self._out.clear()
+            self._decoder.reset()
+            self._discovery = 0
+            self._emv = False
+            self._opened = True
+    
+    def close(self):
+        with self._cond:
+            self._opened = False
+            self._out.clear()
+            self._cond.notify_all()
+    
+    def write(self, data: bytes):
+        if not self._opened:
+            raise Error('Device is not opened')
+        if self.hid:
+            data = self._hid_loop(data)
+        with self._cond:
+            for frame in self._decoder.feed(data):
+                cmd = Message.from_bytes(frame.tobytes())
+                if cmd.type != 'cmd':
+                    continue
+                self.commands += 1
+                self._respond(self._handle(cmd))
+                for evt in self._events:
+                    self._queue(evt.encode())
+                del self._events[:]
+    
+    def read(self):
+        deadline = time.perf_counter() + self.read_timeout
+        with self._cond:
+            while True:
+                if not self._opened:
+                    return None
+                now = time.perf_counter()
+                if len(self._out) > 0 and self._out[0][0] <= now:
+                    frame = self._out.popleft()[1]
+                    break
+                wait = deadline - now
+                if len(self._out) > 0:
+                    wait = min(wait, self._out[0][0] - now)
+                if wait <= 0:
+                    return None
+                self._cond.wait(wait)
+        
+        if isinstance(frame, Exception):
+            raise frame
+        if self.hid:
+            frame = self._hid_loop(frame)
+        return frame
+    
+    # internals, called with the lock held.
+    
+    def _hid_loop(self, data) -> bytes:
+        # the cost of DeviceHid: split into reports, then rebuild the message from them.
+        size = hid_report_count(len(data)) * 64
+        if size > len(self._reports):
+            self._reports = bytearray(size)
+        hid_fragment(self._reports, _HID_CID, data)
+        reassembler = HidReassembler(_HID_CID)
+        with memoryview(self._reports) as reports:
+            for pos in range(0, size, 64):
+                buf = reassembler.feed(reports[pos:pos + 64])
+                if buf is not None:
+                    return bytes(buf)
+        raise Error('HID report lost')
+    
+    def _queue(self, item):
+        due = time.perf_counter() + self.latency
+        if self.jitter > 0:
+            due += self._random.uniform(0, self.jitter)
+        # a serial link doesn't reorder, a frame is never due before the previous one.
+        due = max(due, self._last_due)
+        self._last_due = due
+        self._out.append((due, item))
+        self._cond.notify_all()
+    
+    def _fault(self):
+        if len(self._injected) > 0:
+            return self._injected.popleft()
+        r = self._random.random
+        if self.io_error_rate > 0 and r() < self.io_error_rate:
+            return self.IO
+        if self.timeout_rate > 0 and r() < self.timeout_rate:
+            return self.TIMEOUT
+        if self.bcc_error_rate > 0 and r() < self.bcc_error_rate:
+            return self.BCC
+        return None
+    
+    def _respond(self, rsp: Message):
+        fault = self._fault()
+        if fault is not None:
+            self.errors += 1
+        if fault == self.TIMEOUT:
+            return
+        if fault == self.IO:
+            self._queue(IOError('Simulated transport error'))
+            return
+        frame = rsp.encode()
+        if fault == self.BCC:
+            frame = frame[:-1] + bytes((frame[-1] ^ 0xFF,))
+        self._queue(frame)
+    
+    def _handle(self, cmd: Message) -> Message:
+        gid, cid = cmd.gid, cmd.cid
+        if gid is None or cid is None:
+            return Message.response('system', 'error', STATUS.UNSUPPORTED_COMMAND)
+        handler = getattr(self, '_' + gid + '_' + cid, None)
+        if handler is None:
+            return Message.response(gid, cid, STATUS.UNSUPPORTED_COMMAND)
+        status, payload = handler(cmd.param1[0], cmd.param2[0], cmd.payload or b'')
+        return Message.response(gid, cid, status, payload)
+    
+    def _system_info(self, p1, p2, payload):
+        major, minor, build = self.VERSION
+        return STATUS.SUCCESS, (self.NAME.encode('ascii').ljust(9, b'\x00') + bytes((major, minor)) +
+                                build.to_bytes(4, 'little') + b'Jan 01 2020'.ljust(12, b'\x00') +
+                                b'00:00:00'.ljust(9, b'\x00'))
+    
+    def _system_buzzer(self, p1, p2, payload):
+        return STATUS.SUCCESS, None
+    
+    def _system_led(self, p1, p2, payload):
+        return STATUS.SUCCESS, None
+    
+    def _system_set_gpio(self, p1, p2, payload):
+        return STATUS.SUCCESS, None
+    
+    def _nfc_conf_reactive(self, p1, p2, payload):
+        return STATUS.SUCCESS, None
+    
+    def _nfc_discovery(self, p1, p2, payload):
+        if p2:
+            if self._discovery:
+                return STATUS.REJECT_COMMAND, None
+            self._discovery = p1
+            tag = self._tag
+            if tag is not None and p1 & tag.tech:
+                self._events.append(Message.event('nfc', 'discovery', STATUS.SUCCESS, tag.discovery_payload()))
+        else:
+            self._discovery = 0
+        return STATUS.SUCCESS, None
+    
+    def _nfc_emv(self, p1, p2, payload):
+        if p1 == 1:
+            self._emv = True
+        elif p1 == 2:
+            self._emv = False
+        else:
+            return STATUS.INVALID_PARAM, None
+        return STATUS.SUCCESS, None
+    
+    def _present(self):
+        # the tag the command goes to, or None if there is nothing in the field.
+        tag = self._tag
+        if tag is None or not (self._discovery & tag.tech):
+            return None
+        return tag
+    
+    def _nfc_read(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        return STATUS.SUCCESS, tag.read_block(p1 | (p2 << 8))
+    
+    def _nfc_write(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        if len(payload) != tag.block_size:
+            return STATUS.INVALID_PARAM, None
+        tag.blocks[p1 | (p2 << 8)] = bytes(payload)
+        return STATUS.SUCCESS, None
+    
+    def _nfc_ndef_read(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        if tag.ndef is None:
+            return STATUS.NDEF_READ_FAIL, None
+        return STATUS.SUCCESS, tag.ndef
+    
+    def _nfc_ndef_write(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        if tag.ndef is None:
+            return STATUS.NDEF_WRITE_FAIL, None
+        tag.ndef = bytes(payload)
+        return STATUS.SUCCESS, None
+    
+    def _nfc_apdu_transfer(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        if tag.tag_type != Command.NfcTagType.TYPE4:
+            return STATUS.UNSUPPORTED_FUNCTION, None
+        return STATUS.SUCCESS, tag.transceive(bytes(payload))
+    
+    def _nfc_raw(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        return STATUS.SUCCESS, tag.transceive(bytes(payload))
+    
+    # Mifare Classic
+    
+    def _mifare(self, block):
+        # (tag, status) of a Mifare command on block.
+        tag = self._present()
+        if tag is None:
+            return None, STATUS.LOST_REMOTE_DEVICE
+        if tag.block_size != 16:
+            return None, STATUS.UNSUPPORTED_FUNCTION
+        if self._auth != block // 4:
+            return None, STATUS.NOT_AUTH
+        return tag, STATUS.SUCCESS
+    
+    def _nfc_mfc_auth(self, p1, p2, payload):
+        tag = self._present()
+        if tag is None:
+            return STATUS.LOST_REMOTE_DEVICE, None
+        if tag.block_size != 16:
+            return STATUS.UNSUPPORTED_FUNCTION, None
+        key = tag.keys.get(p1 // 4)
+        if key is not None and key != (p2, bytes(payload)):
+            self._auth = None
+            return STATUS.FROM_REMOTE_DEVICE, None
+        self._auth = p1 // 4
+        return STATUS.SUCCESS, None
+    
+    def _nfc_mfc_read(self, p1, p2, payload):
+        tag, status = self._mifare(p1)
+        if tag is None:
+            return status, None
+        return STATUS.SUCCESS, tag.read_block(p1)
+    
+    def _nfc_mfc_write(self, p1, p2, payload):
+        tag, status = self._mifare(p1)
+        if tag is None:
+            return status, None
+        if len(payload) != 16:
+            return STATUS.INVALID_PARAM, None
+        tag.blocks[p1] = bytes(payload)
+        return STATUS.SUCCESS, None
+    
+    def _mfc_value_op(self, p1, delta):
+        tag, status = self._mifare(p1)
+        if tag is None:
+            return status, None
+        value = tag.value(p1)
+        if value is None:
+            return STATUS.FROM_REMOTE_DEVICE, None
+        self._value = value + delta
+        return STATUS.SUCCESS, None
+    
+    def _nfc_mfc_inc(self, p1, p2, payload):
+        return self._mfc_value_op(p1, int.from_bytes(payload[0:4], 'little', signed=True))
+    
+    def _nfc_mfc_dec(self, p1, p2, payload):
+        return self._mfc_value_op(p1, -int.from_bytes(payload[0:4], 'little', signed=True))
+    
+    def _nfc_mfc_restore(self, p1, p2, payload):
+        return self._mfc_value_op(p1, 0)
+    
+    def _nfc_mfc_transfer(self, p1, p2, payload):
+        tag, status = self._mifare(p1)
+        if tag is None:
+            return status, None
+        if self._value is None:
+            return STATUS.FROM_REMOTE_DEVICE, None
+        tag.set_value(p1, self._value)
+        self._value = None
+        return STATUS.SUCCESS, None
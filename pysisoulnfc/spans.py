@@ -0,0 +1,156 @@
+"""
+Timing of the stages of every command, exported in the Chrome trace format.
+
+:class:`SpanTracer` is opt-in, given to :class:`pysisoulnfc.nfc.Command`::
+
+    spans = SpanTracer()
+    cmd = Command(spans=spans)
+    ...
+    spans.dump('trace.json')
+
+The file opens in chrome://tracing or https://ui.perfetto.dev. Spans recorded for a command:
+
+- ``gid.cid`` (command): the whole call, on the calling thread.
+- ``encode`` (host): :func:`Message.encode`.
+- ``device.write`` (device): :func:`Device.write`, with ``hid.fragment`` and ``hid.write`` for :class:`DeviceHid`.
+- ``firmware`` (reader): from the end of the write until the receive thread read the response, the time spent
+  by SMCP-IV and the transfer back to the host.
+- ``rx.decode`` (host): frame decoding on the receive thread.
+- ``handoff`` (host): from the receive thread to the calling thread.
+- ``wait`` (reader): the wait for a response that didn't come from the device, a time out or a transport error.
+
+Events add ``rx.decode``, ``event.queue``(time spent in the :class:`Dispatcher` queue) and ``callback.<name>``.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+try:
+    from time import perf_counter_ns
+except ImportError:  # Python < 3.7
+    def perf_counter_ns() -> int:
+        return int(time.perf_counter() * 1000000000)
+
+
+class SpanTracer:
+    SIZE = 65536  #: Number of spans kept.
+    
+    def __init__(self, size=SIZE, name='pysisoulnfc'):
+        """
+        :param size: Number of spans kept, older spans are overwritten.
+        :type size: int
+        :param name: process name shown by the trace viewers.
+        :type name: str
+        """
+        if size < 1:
+            raise ValueError('Size is invalid')
+        self.name = name
+        self._ring = deque(maxlen=size)
+        self._threads = dict()  # ident -> thread name
+        self._lock = threading.Lock()
+    
+    #: Current time(ns), the clock of every span.
+    now = staticmethod(perf_counter_ns)
+    
+    def add(self, name: str, start: int, end: int, cat='host', args: dict = None) -> None:
+        """
+        Record a span of the current thread.
+
+        :param name: span name.
+        :param start: start time(ns) from :func:`now`.
+        :param end: end time(ns) from :func:`now`.
+        :param cat: category: command, host, device or reader.
+        :param args: values shown with the span.
+        :return: None
+        """
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            with self._lock:
+                self._threads[tid] = threading.current_thread().name
+        self._ring.append((name, cat, start, end, tid, args))
+    
+    def span(self, name: str, cat='host', args: dict = None):
+        """
+        Context manager recording a span around its block::
+
+            with spans.span('dump', args=dict(blocks=64)):
+                ...
+        """
+        return _Span(self, name, cat, args)
+    
+    def wrap(self, name: str, func, queued: int = None):
+        """
+        :param name: span name of the call.
+        :param func: function to time.
+        :param queued: time(ns) when the call was queued, an ``event.queue`` span is recorded up to the call.
+        :return: function recording a span each time it's called.
+        """
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            if queued is not None:
+                self.add('event.queue', queued, start, 'host')
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, start, perf_counter_ns(), 'host')
+        return timed
+    
+    def spans(self) -> list:
+        """
+        :return: spans (name, category, start ns, end ns, thread ident, args) from the oldest.
+        :rtype: list
+        """
+        return list(self._ring)
+    
+    def clear(self) -> None:
+        self._ring.clear()
+    
+    def chrome_trace(self) -> dict:
+        """
+        :return: the spans as a Chrome trace object, times in microseconds.
+        :rtype: dict
+        """
+        events = [dict(name='process_name', ph='M', pid=1, tid=0, args=dict(name=self.name))]
+        with self._lock:
+            threads = dict(self._threads)
+        for tid, name in sorted(threads.items()):
+            events.append(dict(name='thread_name', ph='M', pid=1, tid=tid, args=dict(name=name)))
+        for name, cat, start, end, tid, args in self.spans():
+            e = dict(name=name, cat=cat, ph='X', pid=1, tid=tid, ts=start / 1000.0, dur=(end - start) / 1000.0)
+            if args:
+                e['args'] = args
+            events.append(e)
+        return dict(traceEvents=events, displayTimeUnit='ns')
+    
+    def dump(self, file) -> None:
+        """
+        Write the spans as Chrome trace JSON.
+
+        :param file: file name or text stream.
+        :return: None
+        """
+        if isinstance(file, str):
+            with open(file, 'w') as f:
+                json.dump(self.chrome_trace(), f)
+        else:
+            json.dump(self.chrome_trace(), file)
+
+
+class _Span:
+    __slots__ = ('_tracer', '_name', '_cat', '_args', '_start')
+    
+    def __init__(self, tracer, name, cat, args):
+        self._tracer = tracer
+        self._name = name
+        self._cat = cat
+        self._args = args
+        self._start = 0
+    
+    def __enter__(self):
+        self._start = perf_counter_ns()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._tracer.add(self._name, self._start, perf_counter_ns(), self._cat, self._args)
+        return False
@@ -0,0 +1,184 @@
+"""
+Byte level helpers used on every transaction: BCC, SMCP header pack/unpack and the 64 byte HID reports.
+
+The compiled :mod:`pysisoulnfc._speedups` extension is used when it was built at install time,
+otherwise the pure Python implementations below are used. :data:`IMPLEMENTATION` tells which one is
+active. Set the ``PYSISOULNFC_PURE_PYTHON`` environment variable to force the pure Python version.
+"""
+import os
+
+_HID_CMD = 0xD0
+_HID_SEQ_MAX = 0x7F
+
+
+def bcc(data, initial=0) -> int:
+    """
+    XOR of all bytes.
+
+    :param data: bytes-like object.
+    :param initial: value to continue from.
+    :type initial: int
+    :rtype: int
+    """
+    size = len(data)
+    if size < 128:
+        for i in data:
+            initial ^= i
+        return initial
+    
+    # fold the buffer in halves as one big integer, every step is done in C.
+    v = int.from_bytes(data, 'little')
+    bits = size * 8
+    while bits > 64:
+        half = ((bits >> 3) + 1) >> 1 << 3
+        v = (v >> half) ^ (v & ((1 << half) - 1))
+        bits = half
+    v ^= v >> 32
+    v ^= v >> 16
+    v ^= v >> 8
+    return (v ^ initial) & 0xFF
+
+
+def pack_header(t: int, gid: int, cid: int, length: int, param1: int = 0, param2: int = 0) -> bytes:
+    """
+    SMCP frame header.
+    Command (t == 1) headers carry param1 and param2, response and event headers carry param1 as status.
+
+    :rtype: bytes
+    """
+    if t == 0x01:
+        return bytes((t, gid, cid, param1, param2)) + length.to_bytes(4, 'little')
+    return bytes((t, gid, cid, param1)) + length.to_bytes(4, 'little')
+
+
+def unpack_header(b) -> tuple:
+    """
+    Parse a SMCP frame header.
+
+    :return: (type, gid, cid, param1 or status, param2 or None, payload length, header size)
+    :rtype: tuple
+    :raise: :class:`ValueError` if b is shorter than the header.
+    """
+    if len(b) < 8 or (b[0] == 0x01 and len(b) < 9):
+        raise ValueError('Header is too short')
+    if b[0] == 0x01:
+        return b[0], b[1], b[2], b[3], b[4], int.from_bytes(b[5:9], 'little'), 9
+    return b[0], b[1], b[2], b[3], None, int.from_bytes(b[4:8], 'little'), 8
+
+
+def hid_report_count(length: int, report_size: int = 64) -> int:
+    """
+    Number of HID reports needed for a message of length bytes.
+    """
+    first = report_size - 7
+    if length <= first:
+        return 1
+    rest = report_size - 5
+    return 1 + (length - first + rest - 1) // rest
+
+
+def hid_fragment(out, cid, data, report_size: int = 64, prefix: int = 0) -> int:
+    """
+    Split a message into HID reports.
+
+    Every report is ``prefix`` zero bytes (the report id on Windows), the 4 byte channel id and either
+    0xD0 and the big endian length for the first report or the sequence number for the following ones,
+    then the data. Reports are written back to back into out and padded with zeros.
+
+    :param out: writable buffer of at least ``hid_report_count(len(data)) * (prefix + report_size)`` bytes.
+    :param cid: channel id (4 bytes).
+    :param data: message.
+    :return: number of reports written.
+    :rtype: int
+    """
+    length = len(data)
+    count = hid_report_count(length, report_size)
+    stride = prefix + report_size
+    view = memoryview(out)
+    view[:count * stride] = bytes(count * stride)
+    
+    pos = prefix
+    view[pos:pos + 4] = cid
+    view[pos + 4] = _HID_CMD
+    view[pos + 5] = (length >> 8) & 0xFF
+    view[pos + 6] = length & 0xFF
+    n = min(length, report_size - 7)
+    view[pos + 7:pos + 7 + n] = data[:n]
+    sent = n
+    seq = 0
+    while sent < length:
+        pos += stride
+        view[pos:pos + 4] = cid
+        view[pos + 4] = seq
+        n = min(length - sent, report_size - 5)
+        view[pos + 5:pos + 5 + n] = data[sent:sent + n]
+        sent += n
+        seq = (seq + 1) & _HID_SEQ_MAX
+    return count
+
+
+class HidReassembler:
+    """
+    Rebuild a message from the HID reports read from the device.
+    The message is collected in a bytearray sized from the length in the first report,
+    which is handed over as it is once complete.
+    """
+    
+    def __init__(self, cid):
+        self._cid = bytes(cid)
+        self._cids = (self._cid, list(self._cid))  # hidapi reads a report as a list of ints.
+        self._buf = None
+        self._pos = 0
+        self._seq = 0
+    
+    def reset(self):
+        self._buf = None
+        self._pos = 0
+        self._seq = 0
+    
+    def feed(self, report):
+        """
+        :param report: one HID report without report id, a list of ints or a bytes-like object.
+            It's copied into the message as it is, without converting it to bytes first.
+        :return: the complete message, or None while more reports are expected.
+        :rtype: bytearray
+        :raise: :class:`ValueError` if the report doesn't belong to the channel, doesn't start a message
+            or is out of sequence. A message out of sequence is dropped.
+        """
+        if len(report) < 5 or report[:4] not in self._cids:
+            raise ValueError('cid invalid')
+        
+        buf = self._buf
+        if buf is None:
+            if len(report) < 7 or report[4] != _HID_CMD:
+                raise ValueError('command invalid')
+            buf = self._buf = bytearray((report[5] << 8) | report[6])
+            start = 7
+        else:
+            if report[4] != self._seq:
+                self.reset()
+                raise ValueError('sequence invalid')
+            self._seq = (self._seq + 1) & _HID_SEQ_MAX
+            start = 5
+        
+        pos = self._pos
+        end = pos + len(report) - start
+        if end < len(buf):
+            buf[pos:end] = report[start:]
+            self._pos = end
+            return None
+        
+        buf[pos:] = report[start:start + len(buf) - pos]
+        self.reset()
+        return buf
+
+
+IMPLEMENTATION = 'python'  #: 'cython' when the compiled extension is in use, otherwise 'python'.
+
+if not os.environ.get('PYSISOULNFC_PURE_PYTHON'):
+    try:
+        from pysisoulnfc._speedups import (bcc, pack_header, unpack_header, hid_report_count, hid_fragment,
+                                           HidReassembler)
+        IMPLEMENTATION = 'cython'
+    except ImportError:
+        pass
@@ -0,0 +1,120 @@
+"""
+Response timeouts of the commands.
+
+:class:`Timeouts` gives every command the time to wait for its response: a per-gid or per-gid/cid value if one is
+set, else :attr:`Command.TIME_OUT`. In adaptive mode the timeout of each command follows the latency observed for
+it, a multiple of a high percentile, so a command that answers in milliseconds fails in milliseconds when a card
+leaves the field instead of waiting for the configured value.
+"""
+import threading
+from collections import deque
+
+
+class Timeouts:
+    #: Default timeouts(s) of commands answered by SMCP-IV without waiting for a card.
+    DEFAULTS = {('system', 'info'): 2.0, ('system', 'led'): 2.0, ('system', 'set_gpio'): 2.0,
+                ('nfc', 'conf_reactive'): 2.0}
+    
+    def __init__(self, timeouts: dict = None, adaptive=False, percentile=99.0, factor=3.0, minimum=0.05,
+                 window=1000, min_samples=20):
+        """
+        :param timeouts: {gid or (gid, cid): timeout(s)} added to :attr:`DEFAULTS`, ex. {'nfc': 2.0}.
+        :type timeouts: dict
+        :param adaptive: If True, a command that answered min_samples times waits at most factor times the
+            percentile of its latency, never less than minimum nor more than the timeout it would have without it.
+        :type adaptive: bool
+        :param percentile: percentile of the latency used by the adaptive mode.
+        :param factor: multiple of the percentile used by the adaptive mode.
+        :param minimum: shortest adaptive timeout(s).
+        :param window: number of latest responses of each command the percentile is taken from.
+        :param min_samples: responses needed before the adaptive timeout is used.
+        """
+        self._timeouts = dict(self.DEFAULTS)
+        if timeouts is not None:
+            self._timeouts.update(timeouts)
+        self.adaptive = adaptive
+        self.percentile = percentile
+        self.factor = factor
+        self.minimum = minimum
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = dict()  # (gid, cid) -> deque of latencies(s)
+        self._new = dict()  # (gid, cid) -> samples since the adaptive timeout was computed
+        self._adapted = dict()  # (gid, cid) -> adaptive timeout(s)
+        self._expected = dict()  # (gid, cid) -> percentile of the latency(s)
+    
+    def set(self, target, timeout) -> None:
+        """
+        :param target: gid name(ex. 'nfc') or (gid, cid) names(ex. ('nfc', 'apdu_transfer')).
+        :param timeout: timeout(s), None to remove it.
+        :return: None
+        """
+        if timeout is None:
+            self._timeouts.pop(target, None)
+        elif timeout <= 0:
+            raise ValueError('Timeout is invalid')
+        else:
+            self._timeouts[target] = timeout
+    
+    def get(self, gid: str, cid: str, default: float) -> float:
+        """
+        :param default: timeout(s) if none is set for gid/cid, usually :attr:`Command.TIME_OUT`.
+        :return: timeout(s) of the command.
+        :rtype: float
+        """
+        t = self._timeouts
+        timeout = t.get((gid, cid))
+        if timeout is None:
+            timeout = t.get(gid, default)
+        if self.adaptive:
+            adapted = self._adapted.get((gid, cid))
+            if adapted is not None and adapted < timeout:
+                return adapted
+        return timeout
+    
+    def expected(self, gid: str, cid: str) -> float:
+        """
+        :return: percentile of the latency(s) observed for the command, None until the adaptive mode has one.
+        :rtype: float
+        """
+        return self._expected.get((gid, cid))
+    
+    def observe(self, gid: str, cid: str, seconds: float) -> None:
+        """
+        Record the time a response took, only used in adaptive mode.
+        """
+        if not self.adaptive:
+            return
+        key = (gid, cid)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or samples.maxlen != self.window:
+                samples = self._samples[key] = deque(samples or (), maxlen=self.window)
+            samples.append(seconds)
+            n = self._new.get(key, 0) + 1
+            # sorting the window on every response would cost more than the command, do it every 16.
+            if len(samples) >= self.min_samples and (n >= 16 or key not in self._adapted):
+                values = sorted(samples)
+                k = max(0, min(len(values) - 1, int(self.percentile / 100.0 * len(values) + 0.999999) - 1))
+                self._expected[key] = values[k]
+                self._adapted[key] = max(self.minimum, values[k] * self.factor)
+                n = 0
+            self._new[key] = n
+    
+    def reset(self) -> None:
+        """
+        Forget the observed latencies.
+        """
+        with self._lock:
+            self._samples.clear()
+            self._new.clear()
+            self._adapted.clear()
+            self._expected.clear()
+    
+    def adapted(self) -> dict:
+        """
+        :return: {'gid.cid': adaptive timeout(s)}
+        :rtype: dict
+        """
+        return {'%s.%s' % k: v for k, v in list(self._adapted.items())}
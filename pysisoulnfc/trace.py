@@ -0,0 +1,176 @@
+"""
+Protocol trace of the frames sent to and received from SMCP-IV.
+
+:class:`Tracer` keeps the raw frames with a timestamp and a direction in a ring buffer of fixed size.
+Recording is an append of a tuple, frames are only decoded and formatted when the trace is read.
+"""
+import itertools
+import sys
+import time
+from collections import deque
+from enum import IntEnum
+
+from pysisoulnfc.speedups import unpack_header
+
+
+class TraceLevel(IntEnum):
+    OFF = 0  #: Nothing is recorded.
+    ERROR = 1  #: Only responses and events with an error status.
+    HEADER = 2  #: Every frame, without the payload.
+    FULL = 3  #: Every frame.
+
+
+TX = 'tx'  #: Frame sent to SMCP-IV.
+RX = 'rx'  #: Frame received from SMCP-IV.
+LOCAL = 'local'  #: Response made by the library, for example on a time out.
+
+# statuses that aren't recorded at TraceLevel.ERROR: SUCCESS, OK, LOST_REMOTE_DEVICE and GOING_TO_RESET.
+_NOT_ERRORS = frozenset((0x00, 0x01, 0x51, 0x80))
+
+
+class Tracer:
+    SIZE = 256  #: Number of frames kept.
+    
+    def __init__(self, size=SIZE, level=TraceLevel.FULL):
+        """
+        :param size: Number of frames kept, older frames are overwritten.
+        :type size: int
+        :param level: :class:`TraceLevel`
+        """
+        if size < 1:
+            raise ValueError('Size is invalid')
+        self._ring = deque(maxlen=size)
+        self._seq = itertools.count()
+        self._level = int(level)
+        self._filter = None
+        # perf_counter() is only good for intervals, this turns it into wall clock time when formatting.
+        self._epoch = time.time() - time.perf_counter()
+    
+    @property
+    def level(self) -> TraceLevel:
+        return TraceLevel(self._level)
+    
+    def set_level(self, level) -> None:
+        """
+        :param level: :class:`TraceLevel`
+        :return: None
+        """
+        self._level = int(TraceLevel(level))
+    
+    def set_filter(self, *targets) -> None:
+        """
+        Only record the frames of the given groups or commands. Without targets every frame is recorded.
+
+        :param targets: gid name(ex. 'nfc') or (gid, cid) names(ex. ('nfc', 'read')).
+        :return: None
+        :raise: :class:`KeyError` if a name is unknown.
+        """
+        if len(targets) == 0:
+            self._filter = None
+            return
+        from pysisoulnfc.nfc import Message
+        f = set()
+        for target in targets:
+            if isinstance(target, str):
+                f.add(Message._GID[target][0])
+            else:
+                gid, cid = target
+                f.add((Message._GID[gid][0], Message._CID[gid][cid][0]))
+        self._filter = frozenset(f)
+    
+    def record(self, direction: str, frame) -> tuple:
+        """
+        Record a frame. The frame is kept as it is and must not be modified afterwards.
+
+        :param direction: :data:`TX`, :data:`RX` or :data:`LOCAL`.
+        :param frame: complete frame.
+        :type frame: bytes
+        :return: the entry (sequence number, time, direction, frame), or None if the frame wasn't recorded.
+        :rtype: tuple
+        """
+        level = self._level
+        if level == 0:
+            return None
+        f = self._filter
+        if f is not None and frame[1] not in f and (frame[1], frame[2]) not in f:
+            return None
+        if level == 1:
+            if frame[0] == 0x01 or frame[3] in _NOT_ERRORS:
+                return None
+        elif level == 2:
+            frame = frame[:9 if frame[0] == 0x01 else 8]
+        entry = (next(self._seq), time.perf_counter(), direction, frame)
+        self._ring.append(entry)
+        return entry
+    
+    def entries(self, since=None) -> list:
+        """
+        :param since: only the entries after this sequence number.
+        :type since: int
+        :return: entries (sequence number, time, direction, frame) from the oldest.
+        :rtype: list
+        """
+        entries = list(self._ring)
+        if since is not None:
+            entries = [e for e in entries if e[0] > since]
+        return entries
+    
+    def clear(self) -> None:
+        self._ring.clear()
+    
+    def format_entry(self, entry) -> str:
+        """
+        :param entry: entry returned by :func:`entries` or :func:`record`.
+        :return: the entry as one or more lines of text.
+        :rtype: str
+        """
+        from pysisoulnfc.nfc import Command, Message
+        seq, t, direction, frame = entry
+        smp = Message.from_bytes(bytes(frame))
+        try:
+            name = '[' + smp.type.upper() + '][' + smp.gid.upper() + '][' + smp.cid.upper() + ']'
+        except (AttributeError, ValueError):
+            return '%s %-5s %s' % (self._timestamp(t), direction, bytes(frame).hex().upper())
+        
+        if smp.type == 'cmd':
+            name += '[' + smp.param1.hex().upper() + '][' + smp.param2.hex().upper() + ']'
+        else:
+            try:
+                name += '[' + Command.STATUS(smp.status).name + ']'
+            except ValueError:
+                name += '[%02X]' % smp.status
+        lines = ['%s %-5s %s' % (self._timestamp(t), direction, name)]
+        
+        payload = smp.payload or b''
+        length = unpack_header(frame)[5]
+        if len(payload) < length:
+            lines.append('Payload(%d): not recorded' % length)
+        else:
+            lines.append('Payload(%d): ' % length)
+            for i in range(0, length, 24):
+                lines.append('\t' + ' '.join('%02X' % b for b in payload[i:i + 24]))
+        return '\n'.join(lines)
+    
+    def _timestamp(self, t) -> str:
+        wall = self._epoch + t
+        return time.strftime('%H:%M:%S', time.localtime(wall)) + '.%06d' % int((wall % 1) * 1000000)
+    
+    def format(self, since=None) -> list:
+        """
+        :param since: only the entries after this sequence number.
+        :return: formatted entries from the oldest.
+        :rtype: list
+        """
+        return [self.format_entry(e) for e in self.entries(since)]
+    
+    def dump(self, file=None, since=None) -> None:
+        """
+        Write the trace as text.
+
+        :param file: text stream, sys.stdout by default.
+        :param since: only the entries after this sequence number.
+        :return: None
+        """
+        file = sys.stdout if file is None else file
+        for s in self.format(since):
+            file.write(s + '\n')
@@ -1,16 +1,44 @@
-from setuptools import setup
+from setuptools import setup, Extension
+from setuptools.command.build_ext import build_ext
+
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize([Extension('pysisoulnfc._speedups', ['pysisoulnfc/_speedups.pyx'])])
+except ImportError:
+    ext_modules = []
+
+
+class OptionalBuildExt(build_ext):
+    """
+    pysisoulnfc._speedups is optional, the pure Python fallback is used if it can't be built.
+    """
+    
+    def run(self):
+        try:
+            build_ext.run(self)
+        except Exception as e:
+            print('WARNING: pysisoulnfc._speedups is not built: ' + str(e))
+    
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except Exception as e:
+            print('WARNING: pysisoulnfc._speedups is not built: ' + str(e))
+
 
 setup(
     name='SisoulNfc',
     version='0.6.0',
     packages=['pysisoulnfc'],
+    ext_modules=ext_modules,
+    cmdclass={'build_ext': OptionalBuildExt},
     url='http://sisoul.co.kr',
     license='Commercial',
     author='Kim Youngseon',
     author_email='sean.kim@sisoul.co.kr',
     description='Sisoul NFC SDK for SMCP-IV',
     python_requires='>=3.5',
-    install_requires=['Cython', 'hidapi', 'pyftdi', 'multipledispatch'],
+    install_requires=['Cython', 'hidapi', 'pyftdi'],
     keywords=['nfc'],
     zip_safe=False,
     classifiers=[
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import threading
+import unittest
+
+from pysisoulnfc.aio import AsyncCommand, Event, EventStream
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.scheduler import Priority
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class _BootLoader(SimulatedDevice):
+    # accepts the pages of a firmware download.
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = list()
+    
+    def _system_download(self, p1, p2, payload):
+        if (p1, p2) == (0xFF, 0xFF):
+            return STATUS.GOING_TO_RESET, None
+        self.pages.append((p1 | p2 << 8, payload))
+        return STATUS.SUCCESS, None
+
+
+class AsyncCommandTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.dev = SimulatedDevice(latency=0.0005, seed=1)
+    
+    def run_async(self, coro):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, 5.0))
+    
+    def test_commands(self):
+        async def main():
+            cmd = AsyncCommand()
+            await cmd.open(self.dev)
+            try:
+                self.assertTrue(cmd.is_connected())
+                self.assertEqual((await cmd.get_dev_info())['name'], 'SMCP-IV')
+                # the writer thread was started by the first command.
+                threads = threading.active_count()
+                self.assertEqual(await cmd.discovery(), STATUS.SUCCESS)
+                self.dev.place(VirtualTag.iso_dep(apdu=lambda c: c + b'\x90\x00'))
+                with cmd.priority(Priority.BULK):
+                    calls = [cmd.apdu_tranceive(bytes((i,))) for i in range(50)]
+                # nothing blocks for the outstanding calls.
+                self.assertEqual(threading.active_count(), threads)
+                results = await asyncio.gather(*calls)
+                self.assertEqual([r['data'] for r in results], [bytes((i,)) + b'\x90\x00' for i in range(50)])
+                self.assertEqual(await cmd.buzzer(0, 100), STATUS.INVALID_PARAM)
+            finally:
+                await cmd.close()
+            self.assertFalse(cmd.is_connected())
+            self.assertEqual((await cmd.get_dev_info())['status'], STATUS.TRANSACTION_ERROR)
+        
+        self.run_async(main())
+    
+    def test_writer(self):
+        writes = list()
+        write = self.dev.write
+        
+        def recorded(data):
+            writes.append(threading.current_thread() is threading.main_thread())
+            return write(data)
+        
+        self.dev.write = recorded
+        
+        async def main():
+            cmd = AsyncCommand()
+            await cmd.open(self.dev)
+            try:
+                with cmd.priority(Priority.INTERACTIVE):
+                    calls = [cmd.get_dev_info() for i in range(3)]
+                results = await asyncio.gather(*calls)
+                await cmd.buzzer(1, 100)
+                return [r['status'] for r in results], cmd.metrics.snapshot()['queue_wait']
+            finally:
+                await cmd.close()
+        
+        statuses, wait = self.run_async(main())
+        self.assertEqual(statuses, [STATUS.SUCCESS] * 3)
+        # no write blocked the loop, and the priority of the caller went with the commands.
+        self.assertNotIn(True, writes)
+        self.assertEqual(wait['interactive']['count'], 4)
+    
+    def test_events(self):
+        async def main():
+            cmd = AsyncCommand()
+            await cmd.open(self.dev)
+            events = cmd.events()
+            await cmd.discovery()
+            self.dev.place(VirtualTag.mifare_classic())
+            found = await events.__anext__()
+            self.dev.remove()
+            lost = await events.__anext__()
+            await cmd.close()
+            rest = list()
+            async for e in events:
+                rest.append(e)
+            return found, lost, rest
+        
+        found, lost, rest = self.run_async(main())
+        self.assertEqual((found.reader, found.name, found.status), ('SIM00001', 'discovery', STATUS.SUCCESS))
+        self.assertEqual(found.data['uid'], b'\x01\x02\x03\x04')
+        self.assertEqual(lost, Event('SIM00001', 'discovery', STATUS.LOST_REMOTE_DEVICE, dict()))
+        self.assertEqual(rest, [])
+    
+    def test_stream(self):
+        async def main():
+            stream = EventStream(maxsize=2)
+            for i in range(3):
+                stream.put(Event('SIM00001', 'error', i, None))
+            stream.end()
+            stream.put(Event('SIM00001', 'error', 3, None))
+            statuses = list()
+            async for e in stream:
+                statuses.append(e.status)
+            return statuses, stream.dropped
+        
+        self.assertEqual(self.run_async(main()), ([1, 2], 1))
+    
+    def test_cancel(self):
+        async def main():
+            cmd = AsyncCommand()
+            await cmd.open(self.dev)
+            self.dev.latency = 0.02
+            call = cmd.get_dev_info()
+            call.cancel()
+            # the cancelled command still takes its turn, the next one gets its own response.
+            info = await cmd.get_dev_info()
+            await cmd.close()
+            return info
+        
+        self.assertEqual(self.run_async(main())['status'], STATUS.SUCCESS)
+    
+    def test_download(self):
+        firmware = bytes(range(256)) * 2 + b'\x01\x02'
+        sync = _BootLoader(latency=0.0005)
+        nfc = Command()
+        nfc.open(sync)
+        self.addCleanup(nfc.close)
+        sizes = list()
+        self.assertTrue(nfc.do_download(io.BytesIO(firmware), sizes.append))
+        self.assertEqual(nfc._decoder.max_length, Command.FRAME_MAX_LENGTH)
+        
+        async def main():
+            cmd = AsyncCommand()
+            await cmd.open(self.dev)
+            try:
+                called = list()
+                ok = await cmd.do_download(io.BytesIO(firmware), lambda size: called.append(
+                    (size, threading.current_thread() is threading.main_thread())))
+                # the callbacks were handed to the loop before the result.
+                await asyncio.sleep(0)
+                return ok, called
+            finally:
+                await cmd.close()
+        
+        self.dev = _BootLoader(latency=0.0005)
+        ok, called = self.run_async(main())
+        self.assertTrue(ok)
+        self.assertEqual(self.dev.pages, sync.pages)
+        self.assertEqual([(p, len(d)) for p, d in sync.pages], [(0, 128), (1, 128), (2, 128), (3, 128), (4, 2)])
+        self.assertEqual(called, [(size, True) for size in sizes])
+
+
+if __name__ == '__main__':
+    unittest.main()
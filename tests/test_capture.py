@@ -0,0 +1,145 @@
+import io
+import time
+import unittest
+
+from pysisoulnfc.capture import (CaptureWriter, RecordingDevice, ReplayDevice, read_capture, OPEN, CLOSE, WRITE,
+                                 READ, ERROR, WRITE_ERROR, TRANSPORT_OTHER)
+from pysisoulnfc.device import Device
+from pysisoulnfc.nfc import Command, Message
+
+
+class _EchoDevice(Device):
+    serial = 'ECHO'
+    
+    def __init__(self):
+        self._data = None
+    
+    def open(self):
+        pass
+    
+    def close(self):
+        pass
+    
+    def write(self, data: bytes):
+        self._data = data
+    
+    def read(self):
+        data, self._data = self._data, None
+        return data
+
+
+def _buzzer():
+    cmd = Message.command('system', 'buzzer', b'\x00', b'\x01', (100).to_bytes(2, 'little')).encode()
+    rsp = Message.response('system', 'buzzer', Command.STATUS.SUCCESS).encode()
+    return cmd, rsp
+
+
+class CaptureTests(unittest.TestCase):
+    
+    def test_record(self):
+        f = io.BytesIO()
+        dev = RecordingDevice(_EchoDevice(), f)
+        dev.open()
+        dev.write(b'\x01\x02')
+        self.assertEqual(dev.read(), b'\x01\x02')
+        self.assertIsNone(dev.read())
+        dev.close()
+        
+        f.seek(0)
+        serial, start, records = read_capture(f)
+        self.assertEqual(serial, 'ECHO')
+        self.assertEqual([r.direction for r in records], [OPEN, WRITE, READ, CLOSE])
+        self.assertEqual(records[2].data, b'\x01\x02')
+        self.assertEqual(records[2].transport, TRANSPORT_OTHER)
+        self.assertTrue(records[0].time <= records[3].time)
+    
+    def test_not_a_capture(self):
+        with self.assertRaises(ValueError):
+            read_capture(io.BytesIO(b'\x00' * 32))
+    
+    def test_replay_gated_by_write(self):
+        cmd, rsp = _buzzer()
+        f = io.BytesIO()
+        w = CaptureWriter(f, 'SN')
+        w.write(WRITE, TRANSPORT_OTHER, cmd)
+        w.write(READ, TRANSPORT_OTHER, rsp)
+        w.write(ERROR, TRANSPORT_OTHER, b'gone')
+        f.seek(0)
+        
+        dev = ReplayDevice(f, read_timeout=0.01)
+        dev.open()
+        self.assertEqual(dev.serial, 'SN')
+        self.assertIsNone(dev.read())
+        dev.write(cmd)
+        self.assertEqual(dev.read(), rsp)
+        with self.assertRaises(IOError):
+            dev.read()
+        self.assertTrue(dev.finished)
+        self.assertEqual(dev.mismatches, 0)
+    
+    def test_write_error(self):
+        cmd, rsp = _buzzer()
+        
+        class _Broken(_EchoDevice):
+            def write(self, data: bytes):
+                raise IOError('unplugged')
+        
+        f = io.BytesIO()
+        dev = RecordingDevice(_Broken(), f)
+        dev.open()
+        self.assertRaises(IOError, dev.write, cmd)
+        dev.writer.write(WRITE, TRANSPORT_OTHER, cmd)
+        dev.writer.write(READ, TRANSPORT_OTHER, rsp)
+        f.seek(0)
+        self.assertEqual([r.direction for r in read_capture(f)[2]], [OPEN, WRITE, WRITE_ERROR, WRITE, READ])
+        
+        # raised by the write that failed, not by the next read.
+        f.seek(0)
+        dev = ReplayDevice(f, read_timeout=0.01)
+        dev.open()
+        with self.assertRaises(IOError) as cm:
+            dev.write(cmd)
+        self.assertEqual(str(cm.exception), 'unplugged')
+        self.assertIsNone(dev.read())
+        dev.write(cmd)
+        self.assertEqual(dev.read(), rsp)
+        self.assertTrue(dev.finished)
+    
+    def test_replay_realtime(self):
+        f = io.BytesIO()
+        w = CaptureWriter(f)
+        w.write(WRITE, TRANSPORT_OTHER, b'\x01')
+        time.sleep(0.05)
+        w.write(READ, TRANSPORT_OTHER, b'\x02')
+        f.seek(0)
+        
+        dev = ReplayDevice(f, realtime=True, speed=0.5, read_timeout=1.0)
+        dev.open()
+        start = time.perf_counter()
+        dev.write(b'\x01')
+        self.assertEqual(dev.read(), b'\x02')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+    
+    def test_command(self):
+        cmd, rsp = _buzzer()
+        f = io.BytesIO()
+        w = CaptureWriter(f, 'SN')
+        w.write(OPEN, TRANSPORT_OTHER)
+        for i in range(50):
+            w.write(WRITE, TRANSPORT_OTHER, cmd)
+            w.write(READ, TRANSPORT_OTHER, rsp)
+        f.seek(0)
+        
+        nfc = Command()
+        dev = ReplayDevice(f)
+        nfc.open(dev)
+        try:
+            for i in range(50):
+                self.assertEqual(nfc.buzzer(1, 100), Command.STATUS.SUCCESS)
+        finally:
+            nfc.close()
+        self.assertTrue(dev.finished)
+
+
+if __name__ == '__main__':
+    unittest.main()
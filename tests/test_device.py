@@ -0,0 +1,283 @@
+import threading
+import time
+import unittest
+from collections import deque
+from unittest import mock
+
+from pyftdi.spi import SpiIOError
+
+from pysisoulnfc import i2cprobe
+from pysisoulnfc.device import Device, DeviceHid, DeviceI2C, DeviceSPI, Error, IrqWait
+from pysisoulnfc.nfc import Command, Message
+from pysisoulnfc.simulator import SimulatedDevice
+
+CID = b'\x11\x22\x33\x44'
+
+
+class _FakeHid:
+    """
+    Stand-in for hid.device: answers the channel init, then plays the reports queued and records the read timeouts.
+    """
+    
+    def __init__(self):
+        self.reports = deque()
+        self.timeouts = list()
+    
+    def open(self, vid, pid, serial):
+        pass
+    
+    def close(self):
+        pass
+    
+    def write(self, buf):
+        buf = bytes(buf)
+        if buf[4] == 0x86:
+            self.reports.append(list(bytes(15) + CID))
+        return len(buf)
+    
+    def read(self, size, timeout=0):
+        self.timeouts.append(timeout)
+        return self.reports.popleft() if self.reports else []
+    
+    def respond(self, data):
+        self.reports.append(list(CID + bytes((0xD0, 0, len(data))) + data + bytes(57 - len(data))))
+
+
+class IrqWaitTests(unittest.TestCase):
+    
+    def test_asserted(self):
+        w = IrqWait()
+        self.assertTrue(w.wait(lambda: True, 0.1))
+        self.assertEqual(w.stats()['polls'], 1)
+        self.assertEqual(w.stats()['wakeups'], 0)
+    
+    def test_timeout(self):
+        w = IrqWait(spin=5, max_sleep=0.01)
+        start = time.monotonic()
+        self.assertFalse(w.wait(lambda: False, 0.05))
+        self.assertLess(time.monotonic() - start, 0.5)
+        stats = w.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreater(stats['wakeups'], 0)
+        self.assertLess(stats['wakeups'], stats['polls'])
+    
+    def test_backoff(self):
+        w = IrqWait(spin=0, min_sleep=0.001, max_sleep=0.004)
+        line = threading.Event()
+        threading.Timer(0.05, line.set).start()
+        self.assertTrue(w.wait(line.is_set, 1.0))
+        # without backoff 50ms of 1ms sleeps would take about 50 wakeups.
+        self.assertLess(w.stats()['wakeups'], 30)
+    
+    def test_cap(self):
+        w = IrqWait(min_sleep=0.0001, max_sleep=0.002, idle_sleep=0.02, fraction=0.1)
+        self.assertEqual(w.cap(False), 0.02)
+        self.assertEqual(w.cap(True), 0.002)
+        self.assertAlmostEqual(w.cap(True, 0.05), 0.005)
+        self.assertEqual(w.cap(True, 0.0001), 0.0001)
+        self.assertEqual(w.cap(True, 10.0), 0.02)
+    
+    def test_expected(self):
+        for expected, cap in ((None, 0.002), (0.05, 0.005), (0.005, 0.0005)):
+            polls = iter(range(12))
+            w = IrqWait(spin=0, min_sleep=0.0001, max_sleep=0.002, fraction=0.1)
+            with mock.patch.object(time, 'sleep') as sleep:
+                self.assertTrue(w.wait(lambda: next(polls) == 11, None, True, expected))
+            sleeps = [c[0][0] for c in sleep.call_args_list]
+            self.assertEqual(len(sleeps), 11)
+            self.assertAlmostEqual(max(sleeps), cap)
+
+
+
+class _FakeI2cPort:
+    """
+    Stand-in for pyftdi I2cPort: every read continues the frame ready on the bus, zeros past its end.
+    """
+    
+    def __init__(self):
+        self.sizes = list()
+        self._frame = b''
+        self._pos = 0
+    
+    def ready(self, frame):
+        self._frame = frame
+        self._pos = 0
+    
+    def write(self, out):
+        pass
+    
+    def read(self, readlen):
+        self.sizes.append(readlen)
+        r = self._frame[self._pos:self._pos + readlen]
+        self._pos += readlen
+        return r + bytes(readlen - len(r))
+
+
+def _frame(size):
+    return Message.response('system', 'info', 0, bytes(range(size))).encode()
+
+
+class DeviceI2CTests(unittest.TestCase):
+    
+    def device(self, **kwargs):
+        dev = DeviceI2C('FT1', **kwargs)
+        dev._device = port = _FakeI2cPort()
+        dev._gpio = mock.Mock()
+        dev._gpio.read.return_value = 1 << DeviceI2C._IRQ
+        return dev, port
+    
+    def read(self, dev, port, frame):
+        port.sizes.clear()
+        port.ready(frame)
+        self.assertEqual(dev.read(), frame)
+        return port.sizes
+    
+    def test_header_first(self):
+        dev, port = self.device()
+        self.assertEqual(self.read(dev, port, _frame(11)), [8, 12])
+        self.assertEqual(self.read(dev, port, _frame(0)), [8, 1])
+    
+    def test_speculative(self):
+        dev, port = self.device(read_size=64)
+        self.assertEqual(self.read(dev, port, _frame(11)), [64])
+        self.assertEqual(self.read(dev, port, _frame(55)), [64])
+        # the rest of a longer frame in a second read.
+        self.assertEqual(self.read(dev, port, _frame(100)), [64, 45])
+        stats = dev.stats()
+        self.assertEqual((stats['reads'], stats['second_reads']), (3, 1))
+    
+    def test_adaptive(self):
+        dev, port = self.device(adaptive=True)
+        self.assertEqual(dev._first_read_size(), DeviceI2C._MIN_READ)
+        self.assertEqual(self.read(dev, port, _frame(11)), [9, 11])
+        # the largest recent frame, up to 64 bytes.
+        self.assertEqual(self.read(dev, port, _frame(11)), [20])
+        self.assertEqual(self.read(dev, port, _frame(3)), [20])
+        self.assertEqual(self.read(dev, port, _frame(100)), [20, 89])
+        self.assertEqual(dev._first_read_size(), 64)
+        dev, port = self.device(adaptive=True, read_size=32)
+        self.read(dev, port, _frame(100))
+        self.assertEqual(dev._first_read_size(), 32)
+        self.assertRaises(ValueError, DeviceI2C, 'FT1', read_size=4)
+    
+    def test_irq(self):
+        dev, port = self.device(irq_timeout=0.01)
+        dev._gpio.read.return_value = 0
+        self.assertIsNone(dev.read())
+        self.assertEqual(port.sizes, [])
+    
+    def test_probe_open_fails(self):
+        with mock.patch.object(DeviceI2C, 'open', side_effect=IOError('no adapter')), \
+                mock.patch.object(DeviceI2C, 'close') as close:
+            result = i2cprobe.probe_frequency('FT1(I2C)', 400000, count=2)
+        self.assertEqual((result['ok'], result['rtt']), (0, None))
+        close.assert_called_once_with()
+
+
+class DeviceSPITests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dev = DeviceSPI('FT1', irq_timeout=0.01, frequency=10000000, mode=3)
+        self.dev._spi = spi = mock.Mock()
+        self.port = spi.get_port.return_value
+        self.gpio = spi.get_gpio.return_value
+        self.gpio.read.return_value = 1 << DeviceSPI._IRQ
+    
+    def test_open(self):
+        self.assertEqual(self.dev.serial, 'FT1(SPI)')
+        self.dev.open()
+        self.dev._spi.configure.assert_called_once_with('ftdi://::FT1/1', frequency=10000000)
+        self.dev._spi.get_port.assert_called_once_with(0, freq=10000000, mode=3)
+        self.gpio.set_direction.assert_called_once_with(1 << DeviceSPI._IRQ, 0)
+        self.dev._spi.configure.side_effect = ValueError('no adapter')
+        self.assertRaises(IOError, self.dev.open)
+    
+    def test_write(self):
+        self.dev.open()
+        frame = Message.command('system', 'info').encode()
+        self.dev.write(frame)
+        self.port.write.assert_called_once_with(frame)
+        self.port.write.side_effect = SpiIOError('bus')
+        self.assertRaises(Error, self.dev.write, frame)
+    
+    def test_read(self):
+        self.dev.open()
+        frame = _frame(20)
+        self.port.read.side_effect = [frame[:8], frame[8:]]
+        self.assertEqual(self.dev.read(), frame)
+        # the header and the rest in one chip-select cycle.
+        self.assertEqual(self.port.read.call_args_list, [mock.call(8, stop=False), mock.call(21, start=False)])
+        
+        self.port.read.reset_mock()
+        self.gpio.read.return_value = 0
+        self.assertIsNone(self.dev.read())
+        self.port.read.assert_not_called()
+    
+    def test_get_ports(self):
+        found = [(0x403, 0x6014, 'FT1', 1, 'FT232H'), (0x403, 0x6014, 'FT2', 1, 'FT232H')]
+        with mock.patch('pysisoulnfc.device.Ftdi') as ftdi, mock.patch.object(DeviceHid, 'get_ports', return_value=[]):
+            ftdi.find_all.return_value = found
+            ports = Device.get_ports(spi=True)
+            self.assertEqual([(type(p), p.serial) for p in ports], [(DeviceSPI, 'FT1(SPI)'), (DeviceSPI, 'FT2(SPI)')])
+            self.assertEqual([p.serial for p in Device.get_ports()], ['FT1(I2C)', 'FT2(I2C)'])
+            ports = Device.get_ports('FT2(SPI)')
+            self.assertEqual([(type(p), p.serial) for p in ports], [(DeviceSPI, 'FT2(SPI)')])
+
+
+class DeviceHidTests(unittest.TestCase):
+    
+    def device(self, **kwargs):
+        dev = DeviceHid('fake', 0, 0, **kwargs)
+        dev._device = fake = _FakeHid()
+        dev.open()
+        fake.timeouts.clear()
+        return dev, fake
+    
+    def reads(self, dev, count):
+        for i in range(count):
+            self.assertIsNone(dev.read())
+    
+    def test_set_read_timeout(self):
+        dev, fake = self.device()
+        self.assertRaises(ValueError, dev.set_read_timeout, 0, 100)
+        self.assertRaises(ValueError, dev.set_read_timeout, 50, 20)
+        dev.set_read_timeout(5, 100, adaptive=False)
+        self.reads(dev, 3)
+        self.assertEqual(fake.timeouts, [5, 100, 100])
+    
+    def test_adaptive(self):
+        dev, fake = self.device(read_timeout=10, idle_timeout=100)
+        self.reads(dev, 6)
+        self.assertEqual(fake.timeouts, [10, 20, 40, 80, 100, 100])
+        
+        # a response is expected, the timeout stays short until it arrives.
+        fake.timeouts.clear()
+        dev.write(b'\x01\x02')
+        self.reads(dev, 3)
+        fake.respond(b'\x03\x04')
+        self.assertEqual(dev.read(), b'\x03\x04')
+        self.reads(dev, 3)
+        self.assertEqual(fake.timeouts, [10, 10, 10, 10, 10, 20, 40])
+    
+    def test_lost_response(self):
+        dev, fake = self.device(read_timeout=10, idle_timeout=100)
+        dev.write(b'\x01\x02')
+        self.reads(dev, 2)
+        dev.reset_pending()
+        self.reads(dev, 4)
+        self.assertEqual(fake.timeouts, [10, 10, 10, 20, 40, 80])
+    
+    def test_reset_on_timeout(self):
+        dev = SimulatedDevice(latency=0.001)
+        nfc = Command()
+        nfc.open(dev)
+        self.addCleanup(nfc.close)
+        with mock.patch.object(dev, 'reset_pending', wraps=dev.reset_pending) as reset:
+            self.assertEqual(nfc.buzzer(1, 100), Command.STATUS.SUCCESS)
+            dev.inject(SimulatedDevice.TIMEOUT)
+            self.assertEqual(nfc.buzzer(1, 100, timeout=0.05), Command.STATUS.TIMED_OUT)
+            self.assertEqual(reset.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import threading
+import time
+import unittest
+
+from pysisoulnfc.dispatch import Dispatcher
+from pysisoulnfc.nfc import Command, Message
+
+
+class DispatcherTests(unittest.TestCase):
+    
+    def test_inline(self):
+        d = Dispatcher(Dispatcher.INLINE)
+        d.start()
+        calls = []
+        self.assertTrue(d.submit('a', calls.append, 1))
+        self.assertEqual(calls, [1])
+        self.assertFalse(d.submit('a', None))
+        d.close()
+    
+    def test_slow_channel_does_not_block_others(self):
+        d = Dispatcher(Dispatcher.POOL, workers=2)
+        d.start()
+        release = threading.Event()
+        done = threading.Event()
+        d.submit('discovery', release.wait, 2.0)
+        d.submit('error', done.set)
+        self.assertTrue(done.wait(1.0))
+        self.assertFalse(release.is_set())
+        release.set()
+        d.close()
+    
+    def test_ordered(self):
+        d = Dispatcher(Dispatcher.POOL, workers=4)
+        d.start()
+        calls = []
+        for i in range(20):
+            d.submit('a', calls.append, i)
+        d.close(drain=True)
+        self.assertEqual(calls, list(range(20)))
+        self.assertEqual(d.stats()['a']['executed'], 20)
+    
+    def test_drop_oldest(self):
+        d = Dispatcher(maxsize=2)
+        d.start()
+        release = threading.Event()
+        calls = []
+        d.submit('a', release.wait, 2.0)
+        time.sleep(0.05)
+        for i in range(5):
+            d.submit('a', calls.append, i)
+        stats = d.stats()['a']
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['dropped'], 3)
+        release.set()
+        d.close(drain=True)
+        self.assertEqual(calls, [3, 4])
+    
+    def test_coalesce(self):
+        d = Dispatcher(policy=Dispatcher.COALESCE)
+        d.start()
+        release = threading.Event()
+        calls = []
+        d.submit('a', release.wait, 2.0)
+        time.sleep(0.05)
+        d.submit('a', calls.append, 'found 1', key='found')
+        d.submit('a', calls.append, 'lost', key='lost')
+        d.submit('a', calls.append, 'found 2', key='found')
+        self.assertEqual(d.stats()['a']['coalesced'], 1)
+        release.set()
+        d.close(drain=True)
+        self.assertEqual(calls, ['lost', 'found 2'])
+    
+    def test_close_is_prompt(self):
+        d = Dispatcher(Dispatcher.POOL, workers=4)
+        d.start()
+        start = time.monotonic()
+        d.close()
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertFalse(d.submit('a', print))
+    
+    def test_error(self):
+        d = Dispatcher(Dispatcher.INLINE)
+        d.start()
+        with self.assertLogs('pysisoulnfc.dispatch', 'ERROR') as logs:
+            d.submit('a', int, 'x')
+        self.assertEqual(d.stats()['a']['errors'], 1)
+        self.assertIn('ValueError', logs.output[0])  # with its traceback.
+    
+    def test_replaces(self):
+        d = Dispatcher(Dispatcher.THREAD)
+        d.start()
+        release = threading.Event()
+        calls = []
+        d.submit('a', lambda: (release.wait(2.0), calls.append('first')))
+        for i in range(3):
+            d.submit('a', calls.append, 'stale', key='found')
+        d.submit('a', calls.append, 'other', key='error')
+        d.submit('a', calls.append, 'lost', key='lost', replaces='found')
+        release.set()
+        d.close(drain=True)
+        self.assertEqual(calls, ['first', 'other', 'lost'])
+        self.assertEqual(d.stats()['a']['coalesced'], 3)
+    
+    def test_queued_discovery_events(self):
+        # the first event is still with the callback while the second is decoded.
+        nfc = Command()
+        nfc.dispatcher.start()
+        release = threading.Event()
+        cards = []
+        nfc.set_callbacks(discovery=lambda status, card: (release.wait(2.0), cards.append(card)))
+        for uid in (b'\x01\x02\x03\x04', b'\x05\x06\x07\x08'):
+            payload = b'\x12\x01\x00\x00\x04' + uid
+            nfc._dispatch_event(Message.event('nfc', 'discovery', Command.STATUS.SUCCESS, payload))
+        release.set()
+        nfc.dispatcher.close(drain=True)
+        self.assertEqual([card['uid'] for card in cards], [b'\x01\x02\x03\x04', b'\x05\x06\x07\x08'])
+    
+    def test_slow_discovery_callback(self):
+        # the callback is still busy with the first card when the next ones come and leave.
+        nfc = Command()
+        nfc.dispatcher.start()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def discovery(status, card):
+            calls.append((status, card.get('uid')))
+            started.set()
+            release.wait(2.0)
+        
+        nfc.set_callbacks(discovery=discovery)
+        for uid in (b'\x01\x02\x03\x04', b'\x05\x06\x07\x08', b'\x09\x0A\x0B\x0C'):
+            payload = b'\x12\x01\x00\x00\x04' + uid
+            nfc._dispatch_event(Message.event('nfc', 'discovery', Command.STATUS.SUCCESS, payload))
+            self.assertTrue(started.wait(1.0))
+        nfc._dispatch_event(Message.event('nfc', 'discovery', Command.STATUS.LOST_REMOTE_DEVICE))
+        release.set()
+        nfc.dispatcher.close(drain=True)
+        # the loss runs right after the call in progress, the discoveries queued before it are dropped.
+        self.assertEqual(calls, [(Command.STATUS.SUCCESS, b'\x01\x02\x03\x04'),
+                                 (Command.STATUS.LOST_REMOTE_DEVICE, None)])
+        self.assertEqual(nfc.dispatcher.stats()['discovery']['coalesced'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
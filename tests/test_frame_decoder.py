@@ -0,0 +1,64 @@
+import unittest
+
+from pysisoulnfc.nfc import FrameDecoder, Message
+
+
+class FrameDecoderTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.rsp = Message('rsp', 'nfc', 'read', 0, b'\x01\x02\x03\x04').encode()
+        self.evt = Message('evt', 'nfc', 'discovery', 0x51).encode()
+    
+    def _decode(self, decoder, *chunks):
+        frames = []
+        for c in chunks:
+            frames += [bytes(f) for f in decoder.feed(c)]
+        return frames
+    
+    def test_whole_frame(self):
+        decoder = FrameDecoder()
+        self.assertEqual(self._decode(decoder, self.rsp), [self.rsp])
+        self.assertEqual(len(decoder), 0)
+    
+    def test_split_frame(self):
+        decoder = FrameDecoder()
+        chunks = [self.rsp[i:i + 1] for i in range(len(self.rsp))]
+        self.assertEqual(self._decode(decoder, *chunks), [self.rsp])
+    
+    def test_two_frames_in_one_chunk(self):
+        decoder = FrameDecoder()
+        self.assertEqual(self._decode(decoder, self.rsp + self.evt), [self.rsp, self.evt])
+    
+    def test_leading_garbage(self):
+        decoder = FrameDecoder()
+        self.assertEqual(self._decode(decoder, b'\x00\xFF\x02\x42' + self.evt), [self.evt])
+        self.assertGreater(decoder.errors, 0)
+    
+    def test_bad_bcc_resync(self):
+        decoder = FrameDecoder()
+        bad = self.rsp[:-1] + bytes([self.rsp[-1] ^ 0x01])
+        self.assertEqual(self._decode(decoder, bad + self.evt), [self.evt])
+        self.assertEqual(decoder.errors, 1)
+    
+    def test_grows_for_large_frame(self):
+        decoder = FrameDecoder(size=16)
+        big = Message('rsp', 'nfc', 'apdu_transfer', 0, bytes(range(256)) * 4).encode()
+        self.assertEqual(self._decode(decoder, big[:100], big[100:], self.evt), [big, self.evt])
+    
+    def test_length_limit(self):
+        decoder = FrameDecoder(max_length=2)
+        self.assertEqual(self._decode(decoder, self.rsp + self.evt), [self.evt])
+    
+    def test_corrupted_length(self):
+        decoder = FrameDecoder()
+        bad = bytearray(self.rsp)
+        bad[Message.RSP_HEADER_SIZE - 3] ^= 0x40  # 16 KB more than the payload.
+        self.assertEqual(self._decode(decoder, bytes(bad) + self.evt, self.rsp), [self.evt, self.rsp])
+        self.assertEqual(decoder.errors, 1)
+        # the limit of a firmware download let it wait for the phantom payload.
+        decoder = FrameDecoder(max_length=0x10000)
+        self.assertEqual(self._decode(decoder, bytes(bad) + self.evt, self.rsp), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import threading
+import unittest
+from unittest import mock
+
+from pysisoulnfc.device import Device
+from pysisoulnfc.inventory import Inventory
+
+
+class _Port(Device):
+    
+    def __init__(self, serial, pid=0x00A1):
+        self.serial = serial
+        self._pid = pid
+    
+    def open(self):
+        pass
+    
+    def close(self):
+        pass
+    
+    def write(self, data: bytes):
+        pass
+    
+    def read(self):
+        pass
+
+
+class InventoryTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.attached = []
+        self.scans = 0
+        
+        def get_ports(serial=None, spi=False):
+            self.scans += 1
+            return [_Port(*p) for p in self.attached]
+        
+        patcher = mock.patch.object(Device, 'get_ports', side_effect=get_ports)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_arrival_removal(self):
+        inv = Inventory()
+        arrived = []
+        removed = []
+        inv.add_listener(lambda p: arrived.append(p.serial), lambda p: removed.append(p.serial))
+        
+        self.attached = [('A',), ('B',)]
+        inv.refresh()
+        port_a = inv.get('A')
+        self.assertEqual(sorted(arrived), ['A', 'B'])
+        
+        self.attached = [('A',)]
+        inv.refresh()
+        self.assertEqual(removed, ['B'])
+        self.assertIs(inv.get('A'), port_a)
+        self.assertIsNone(inv.get('B'))
+        self.assertEqual(len(inv.get_ports()), 1)
+    
+    def test_pid_change(self):
+        inv = Inventory()
+        self.attached = [('A', 0x00A2)]
+        inv.refresh()
+        self.attached = [('A', 0x00A1)]
+        arrived, removed = inv.refresh()
+        self.assertEqual(len(arrived), 1)
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(inv.get('A')._pid, 0x00A1)
+    
+    def test_cached_while_watching(self):
+        self.attached = [('A',)]
+        with Inventory(interval=10) as inv:
+            scans = self.scans
+            for i in range(10):
+                self.assertIsNotNone(inv.get('A'))
+            self.assertEqual(self.scans, scans)
+        self.assertFalse(inv.is_watching())
+    
+    def test_wait_for(self):
+        inv = Inventory(interval=0.01)
+        self.assertIsNone(inv.wait_for('A', timeout=0.05))
+        threading.Timer(0.05, lambda: self.attached.append(('A',))).start()
+        self.assertEqual(inv.wait_for('A', timeout=2.0).serial, 'A')
+    
+    def test_wait_for_watching(self):
+        with Inventory(interval=0.01) as inv:
+            threading.Timer(0.05, lambda: self.attached.append(('A',))).start()
+            self.assertEqual(inv.wait_for('A', timeout=2.0).serial, 'A')
+    
+    def test_listener_fails(self):
+        seen = threading.Event()
+        
+        def arrival(port):
+            if port.serial == 'A':
+                raise ValueError('listener failed')
+            seen.set()
+        
+        with Inventory(interval=0.01) as inv:
+            inv.add_listener(arrival, None)
+            with self.assertLogs('pysisoulnfc.inventory', 'ERROR') as logs:
+                self.attached.append(('A',))
+                inv.wait_for('A', timeout=2.0)
+                self.attached.append(('B',))
+                # the watcher keeps scanning after a listener failed.
+                self.assertTrue(seen.wait(2.0))
+        self.assertIn('listener failed', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from pysisoulnfc import loadtest
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+
+class LoadTestTests(unittest.TestCase):
+    
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('apdu=4,ndef'), dict(apdu=4.0, ndef=1.0))
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('format')
+    
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile(values, 100), 100)
+        self.assertIsNone(loadtest.percentile([], 50))
+    
+    def test_run(self):
+        commands = []
+        for i in range(2):
+            dev = SimulatedDevice('SIM%d' % i, latency=0.0)
+            dev.place(VirtualTag.mifare_classic(ndef=b'\xD1\x01\x01T'))
+            cmd = Command()
+            cmd.open(dev)
+            cmd.discovery()
+            commands.append(cmd)
+        try:
+            result = loadtest.run(commands, dict(mifare=1, ndef=1, info=1), concurrency=4, count=200, seed=1)
+        finally:
+            for cmd in commands:
+                cmd.close()
+        total = result['total']
+        self.assertEqual(total['count'], 200)
+        self.assertEqual(total['errors'], 0)
+        self.assertEqual(total['timeouts'], 0)
+        self.assertEqual(sum(op['count'] for op in result['operations'].values()), 200)
+        self.assertLessEqual(total['p50'], total['p99'])
+        self.assertLessEqual(total['p99'], total['max'])
+
+
+if __name__ == '__main__':
+    unittest.main()
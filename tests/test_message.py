@@ -0,0 +1,99 @@
+import unittest
+
+from pysisoulnfc.nfc import Message, FrameTemplate
+
+
+class MessageTests(unittest.TestCase):
+    
+    def test_encode_command(self):
+        smp = Message.command('nfc', 'mfc_read', b'\x04', b'\x00')
+        self.assertEqual(smp.encode(), b'\x01\xE9\x32\x04\x00\x00\x00\x00\x00\xDE')
+    
+    def test_encode_payload(self):
+        smp = Message.command('system', 'buzzer', b'\x00', b'\x01', b'\xE8\x03')
+        b = smp.encode()
+        self.assertEqual(b[5:9], b'\x02\x00\x00\x00')
+        self.assertEqual(b[9:11], b'\xE8\x03')
+        self.assertTrue(Message.from_bytes(b).check_complete_bytes())
+    
+    def test_positional_forms(self):
+        self.assertEqual(Message('cmd', 'nfc', 'read', b'\x01', b'\x00').encode(),
+                         Message.command('nfc', 'read', b'\x01', b'\x00').encode())
+        self.assertEqual(Message('rsp', 'nfc', 'read', 0x16).encode(),
+                         Message.response('nfc', 'read', 0x16).encode())
+    
+    def test_field_by_field(self):
+        smp = Message()
+        self.assertIsNone(smp.type)
+        smp.set_type('cmd')
+        smp.set_gid('system')
+        smp.set_cid('buzzer')
+        smp.set_param1(b'\x00')
+        smp.set_param2(b'\x01')
+        smp.set_payload(b'\xE8\x03')
+        self.assertEqual(smp.encode(), Message.command('system', 'buzzer', b'\x00', b'\x01', b'\xE8\x03').encode())
+        
+        rsp = Message()
+        rsp.set_type('rsp')
+        rsp.set_gid('nfc')
+        rsp.set_cid('read')
+        rsp.set_status(0)
+        self.assertEqual(rsp.encode(), Message.response('nfc', 'read', 0).encode())
+    
+    def test_decode_response(self):
+        b = Message.response('nfc', 'apdu_transfer', 0, b'\x90\x00').encode()
+        smp = Message.from_bytes(b)
+        self.assertEqual(smp.type, 'rsp')
+        self.assertEqual(smp.gid, 'nfc')
+        self.assertEqual(smp.cid, 'apdu_transfer')
+        self.assertEqual(smp.status, 0)
+        self.assertEqual(smp.payload, b'\x90\x00')
+        self.assertIs(smp.decode(), smp.decode())
+    
+    def test_set_payload_after_decode(self):
+        smp = Message.command('nfc', 'ndef_write')
+        smp.decode()
+        smp.set_payload(b'\x01')
+        self.assertEqual(smp.decode()['payload'], b'\x01')
+        self.assertEqual(smp.encode()[9:10], b'\x01')
+    
+    def test_invalid_bytes(self):
+        with self.assertRaises(ValueError):
+            Message.from_bytes(b'\x07' * 10).check_complete_bytes()
+        b = bytearray(Message.response('nfc', 'read', 0).encode())
+        b[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            Message.from_bytes(bytes(b)).check_complete_bytes()
+
+
+
+class FrameTemplateTests(unittest.TestCase):
+    
+    def test_params(self):
+        tpl = FrameTemplate('nfc', 'mfc_read')
+        for blk in (0, 4, 63, 4):
+            tpl.set_param1(blk)
+            self.assertEqual(bytes(tpl.frame()), Message.command('nfc', 'mfc_read', bytes((blk,)), b'\x00').encode())
+    
+    def test_payload(self):
+        tpl = FrameTemplate('nfc', 'apdu_transfer')
+        for capdu in (b'\x00\xB0\x00\x00\x03', b'\x00\xA4\x04\x00', b'\x00\xB0\x00\x01\x03', bytes(300), b''):
+            tpl.set_payload(capdu)
+            expected = Message.command('nfc', 'apdu_transfer', payload=capdu).encode()
+            self.assertEqual(bytes(tpl.frame()), expected)
+            smp = tpl.message()
+            self.assertEqual(smp.encode(), expected)
+            self.assertEqual(smp.cid, 'apdu_transfer')
+    
+    def test_snapshot(self):
+        tpl = FrameTemplate('nfc', 'read')
+        tpl.set_params(1, 2)
+        first = tpl.snapshot()
+        tpl.set_param2(3)
+        self.assertEqual(first.encode(), Message.command('nfc', 'read', b'\x01', b'\x02').encode())
+        self.assertEqual(tpl.snapshot().encode(), Message.command('nfc', 'read', b'\x01', b'\x03').encode())
+        self.assertEqual((first.gid, first.cid), ('nfc', 'read'))
+
+
+if __name__ == '__main__':
+    unittest.main()
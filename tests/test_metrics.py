@@ -0,0 +1,80 @@
+import unittest
+
+from pysisoulnfc.metrics import Histogram, Metrics, prometheus_text
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice
+
+
+class HistogramTests(unittest.TestCase):
+    
+    def test_buckets(self):
+        h = Histogram()
+        for v in range(1, 10001):
+            h.record(v)
+        self.assertEqual(h.count, 10000)
+        self.assertEqual((h.min, h.max), (1, 10000))
+        for p in (50, 90, 99):
+            expected = p * 100
+            self.assertLessEqual(abs(h.percentile(p) - expected), expected * 0.07)
+        self.assertEqual(h.percentile(100), 10000)
+        self.assertEqual(h.count_le(31), 31)
+    
+    def test_small(self):
+        h = Histogram()
+        self.assertIsNone(h.percentile(50))
+        h.record(0)
+        h.record(5)
+        self.assertEqual(h.percentile(50), 0)
+        self.assertEqual(h.percentile(99), 5)
+
+
+class MetricsTests(unittest.TestCase):
+    
+    def test_snapshot(self):
+        m = Metrics(dict(reader='A'))
+        m.observe('nfc', 'read', 0, 0.002)
+        m.observe('nfc', 'read', 0x16, 0.5)
+        m.count('frame_errors')
+        m.add_gauge('event_queue_depth', lambda: dict(discovery=2), 'channel')
+        s = m.snapshot()
+        self.assertEqual(s['latency']['nfc.read']['count'], 2)
+        self.assertEqual(s['latency']['nfc.read']['max'], 500000)
+        self.assertEqual(s['status']['nfc.read'], dict(SUCCESS=1, TIMED_OUT=1))
+        self.assertEqual(s['counters'], dict(frame_errors=1))
+        self.assertEqual(s['gauges']['event_queue_depth'], dict(discovery=2))
+    
+    def test_prometheus(self):
+        m = Metrics(dict(reader='A'))
+        m.observe('nfc', 'read', 0, 0.002)
+        m.count('bytes_out', 10)
+        m.add_gauge('event_queue_depth', lambda: dict(discovery=2), 'channel')
+        text = prometheus_text([m, Metrics(dict(reader='B'))])
+        self.assertIn('# TYPE sisoulnfc_command_latency_seconds histogram', text)
+        self.assertIn('sisoulnfc_command_latency_seconds_bucket{reader="A",gid="nfc",cid="read",le="0.001"} 0', text)
+        self.assertIn('sisoulnfc_command_latency_seconds_bucket{reader="A",gid="nfc",cid="read",le="0.0025"} 1',
+                      text)
+        self.assertIn('sisoulnfc_command_latency_seconds_count{reader="A",gid="nfc",cid="read"} 1', text)
+        self.assertIn('sisoulnfc_command_status_total{reader="A",gid="nfc",cid="read",status="SUCCESS"} 1', text)
+        self.assertIn('sisoulnfc_bytes_out_total{reader="A"} 10', text)
+        self.assertIn('sisoulnfc_event_queue_depth{reader="A",channel="discovery"} 2', text)
+    
+    def test_command(self):
+        nfc = Command()
+        nfc.TIME_OUT = 0.1
+        dev = SimulatedDevice('SIM1', latency=0.0)
+        nfc.open(dev)
+        try:
+            nfc.buzzer(1, 100)
+            dev.inject(SimulatedDevice.TIMEOUT)
+            nfc.buzzer(1, 100)
+        finally:
+            nfc.close()
+        s = nfc.metrics.snapshot()
+        self.assertEqual(s['status']['system.buzzer'], dict(SUCCESS=1, TIMED_OUT=1))
+        self.assertEqual(s['counters']['frames_out'], 2)
+        self.assertEqual(s['counters']['frames_in'], 1)
+        self.assertEqual(nfc.metrics.labels['reader'], 'SIM1')
+
+
+if __name__ == '__main__':
+    unittest.main()
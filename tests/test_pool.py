@@ -0,0 +1,101 @@
+import queue
+import threading
+import unittest
+from unittest import mock
+
+from pysisoulnfc.device import Device
+from pysisoulnfc.inventory import Inventory
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.pool import IoThreads, ReaderPool
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class ReaderPoolTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.present = [SimulatedDevice('SIM%05d' % i, latency=0.0005) for i in range(3)]
+        patcher = mock.patch.object(Device, 'get_ports', side_effect=lambda serial=None, spi=False: self.present)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.events = queue.Queue()
+    
+    def pool(self, **kwargs):
+        pool = ReaderPool(Inventory(interval=0.02), **kwargs)
+        pool.set_callbacks(discovery=lambda serial, status, card: self.events.put((serial, 'discovery', status)),
+                           error=lambda serial, status: self.events.put((serial, 'error', status)),
+                           arrival=lambda serial: self.events.put((serial, 'arrival')),
+                           removal=lambda serial: self.events.put((serial, 'removal')))
+        self.addCleanup(pool.close)
+        return pool
+    
+    def event(self):
+        return self.events.get(timeout=2.0)
+    
+    def test_pool(self):
+        threads = threading.active_count()
+        pool = self.pool()
+        self.assertEqual(sorted(pool.open()), ['SIM00000', 'SIM00001', 'SIM00002'])
+        self.assertEqual(sorted(self.event() for i in range(3)),
+                         [('SIM00000', 'arrival'), ('SIM00001', 'arrival'), ('SIM00002', 'arrival')])
+        # 3 I/O threads, the dispatcher and the inventory watcher.
+        self.assertEqual(threading.active_count(), threads + 5)
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith('receive')])
+        
+        futures = pool.submit_all('discovery')
+        self.assertEqual({serial: f.result(1.0) for serial, f in futures.items()},
+                         dict.fromkeys(pool.serials(), STATUS.SUCCESS))
+        self.present[1].place(VirtualTag.iso_dep(apdu=lambda c: c + b'\x90\x00'))
+        self.assertEqual(self.event(), ('SIM00001', 'discovery', STATUS.SUCCESS))
+        r = pool.submit('SIM00001', 'apdu_tranceive', b'\x01').result(1.0)
+        self.assertEqual(r['data'], b'\x01\x90\x00')
+        self.assertEqual(pool.get('SIM00000').apdu_tranceive(b'\x01')['status'], STATUS.LOST_REMOTE_DEVICE)
+        self.assertRaises(ValueError, pool.submit, 'SIM00009', 'buzzer', 1, 100)
+        self.assertIn('reader="SIM00002"', pool.prometheus())
+    
+    def test_join_leave(self):
+        pool = self.pool()
+        pool.open()
+        for i in range(3):
+            self.event()
+        gone = self.present.pop(0)
+        self.present.append(SimulatedDevice('SIM00003', latency=0.0005))
+        self.assertEqual(sorted(self.event() for i in range(2)), [('SIM00000', 'removal'), ('SIM00003', 'arrival')])
+        self.assertEqual(pool.serials(), ['SIM00001', 'SIM00002', 'SIM00003'])
+        self.assertNotIn('SIM00000', pool)
+        self.assertEqual(pool.submit('SIM00003', 'get_dev_info').result(1.0)['status'], STATUS.SUCCESS)
+        
+        # the reader comes back.
+        self.present.append(gone)
+        self.assertEqual(self.event(), ('SIM00000', 'arrival'))
+        self.assertEqual(pool.get('SIM00000').buzzer(1, 100), STATUS.SUCCESS)
+    
+    def test_transport_error(self):
+        pool = self.pool(io=IoThreads(threads=1))
+        pool.open()
+        for i in range(3):
+            self.event()
+        self.assertEqual(pool.io.stats(), {'io 0': 3})
+        self.present[2].inject(SimulatedDevice.IO)
+        self.assertEqual(pool.get('SIM00002').buzzer(1, 100), STATUS.TRANSACTION_ERROR)
+        self.assertEqual(self.event(), ('SIM00002', 'error', STATUS.TRANSACTION_ERROR))
+        self.assertEqual(pool.io.stats(), {'io 0': 2})
+        # the others share the thread and keep working.
+        for serial in ('SIM00000', 'SIM00001'):
+            self.assertEqual(pool.get(serial).get_dev_info()['status'], STATUS.SUCCESS)
+    
+    def test_open_fails(self):
+        pool = self.pool(watch=False)
+        broken = self.present[1]
+        with mock.patch.object(broken, 'open', side_effect=IOError('Busy')):
+            self.assertEqual(sorted(pool.open()), ['SIM00000', 'SIM00002'])
+        self.assertEqual(pool._opening, set())
+        self.assertNotIn('SIM00001', pool)
+        # the reader is left out, not claimed: it opens once it's free.
+        self.assertEqual(pool.open([broken]), ['SIM00001'])
+        self.assertEqual(pool.get('SIM00001').get_dev_info()['status'], STATUS.SUCCESS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import unittest
+from unittest import mock
+
+from pysisoulnfc.device import Device
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class ReconnectTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dev = SimulatedDevice(latency=0.0)
+        self.present = [self.dev]
+        patcher = mock.patch.object(Device, 'get_ports', side_effect=lambda serial=None, spi=False: self.present)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.nfc = Command(reconnect=True)
+        self.nfc.RECONNECT_INTERVAL = 0.01
+        self.found = threading.Event()
+        self.reconnected = threading.Event()
+        self.nfc.set_callbacks(discovery=lambda status, d: self.found.set() if status == STATUS.SUCCESS else None,
+                               reconnect=lambda serial: self.reconnected.set())
+        self.nfc.open(self.dev)
+        self.addCleanup(self.nfc.close)
+    
+    def test_reconnect(self):
+        self.dev.place(VirtualTag())
+        self.assertEqual(self.nfc.discovery(Command.NfcTech.ISO14443A), STATUS.SUCCESS)
+        self.assertTrue(self.found.wait(1.0))
+        self.found.clear()
+        
+        # the reader is unplugged: commands fail at once until it is back.
+        self.present = []
+        self.dev.inject(SimulatedDevice.IO)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TRANSACTION_ERROR)
+        self.assertFalse(self.nfc.is_connected())
+        self.assertEqual(self.nfc.get_dev_info()['status'], STATUS.TRANSACTION_ERROR)
+        
+        self.present = [self.dev]
+        self.assertTrue(self.reconnected.wait(2.0))
+        self.assertTrue(self.nfc.is_connected())
+        # discovery is running again and finds the tag still in the field.
+        self.assertTrue(self.found.wait(1.0))
+        self.assertEqual(self.nfc.mode, 1)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.metrics.snapshot()['counters']['reconnects'], 1)
+    
+    def test_close_while_lost(self):
+        self.present = []
+        self.dev.inject(SimulatedDevice.IO)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TRANSACTION_ERROR)
+        self.nfc.close()
+        self.assertFalse(self.reconnected.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.retry import RetryPolicy
+from pysisoulnfc.simulator import SimulatedDevice
+
+STATUS = Command.STATUS
+
+
+class RetryPolicyTests(unittest.TestCase):
+    
+    def test_retryable(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.retryable('nfc', 'mfc_read', STATUS.TIMED_OUT))
+        self.assertFalse(policy.retryable('nfc', 'mfc_inc', STATUS.TIMED_OUT))
+        self.assertFalse(policy.retryable('nfc', 'apdu_transfer', STATUS.TRANSACTION_ERROR))
+        self.assertTrue(policy.retryable('nfc', 'mfc_inc', STATUS.TRANSFER_BCC))
+        self.assertFalse(policy.retryable('nfc', 'mfc_read', STATUS.NOT_AUTH))
+    
+    def test_backoff(self):
+        policy = RetryPolicy(retries=2, base=0.01, cap=0.015, budget=1.0, seed=1)
+        for retries in range(2):
+            delay = policy.backoff('nfc', 'read', STATUS.TIMED_OUT, retries, 0.0)
+            self.assertTrue(0 <= delay <= 0.015)
+        self.assertIsNone(policy.backoff('nfc', 'read', STATUS.TIMED_OUT, 2, 0.0))
+        self.assertIsNone(policy.backoff('nfc', 'read', STATUS.TIMED_OUT, 0, 1.0))
+        self.assertIsNone(policy.backoff('nfc', 'read', STATUS.SUCCESS, 0, 0.0))
+        self.assertRaises(ValueError, RetryPolicy, cap=0.001, base=0.01)
+
+
+class CommandRetryTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dev = SimulatedDevice(latency=0.0)
+        self.nfc = Command(retry=RetryPolicy(base=0.001, budget=1.0, seed=1))
+        self.nfc.open(self.dev)
+        self.addCleanup(self.nfc.close)
+    
+    def test_idempotent(self):
+        self.dev.inject(SimulatedDevice.TIMEOUT, 2)
+        info = self.nfc.get_dev_info(timeout=0.05)
+        self.assertEqual(info['status'], STATUS.SUCCESS)
+        self.assertEqual(info['retries'], 2)
+        self.assertEqual(self.nfc.metrics.snapshot()['counters']['retries'], 2)
+        self.assertEqual(self.nfc.get_dev_info()['retries'], 0)
+    
+    def test_not_idempotent(self):
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        self.assertEqual(self.nfc.buzzer(1, 100, timeout=0.05), STATUS.TIMED_OUT)
+        self.assertEqual(self.dev.commands, 1)
+        self.assertEqual(self.nfc.last_retries, 0)
+    
+    def test_any_result(self):
+        # set_gpio returns a status, the retries are kept aside.
+        self.dev.inject(SimulatedDevice.TIMEOUT, 2)
+        self.assertEqual(self.nfc.set_gpio(1, 1, timeout=0.05), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.last_retries, 2)
+        self.assertEqual(self.nfc.set_gpio(1, 0), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.last_retries, 0)
+        
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        f = self.nfc.submit(self.nfc.set_gpio, 1, 1, timeout=0.05)
+        self.assertEqual(f.result(1.0), STATUS.SUCCESS)
+        self.assertEqual(f.retries, 1)
+        self.assertEqual(self.nfc.submit('get_dev_info').result(1.0)['retries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.scheduler import Priority, Scheduler
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class _Req:
+    def __init__(self, name, priority):
+        self.name = name
+        self.priority = priority
+
+
+class SchedulerTests(unittest.TestCase):
+    
+    def test_order(self):
+        s = Scheduler()
+        reqs = [_Req('b1', Priority.BULK), _Req('n1', Priority.NORMAL), _Req('b2', Priority.BULK),
+                _Req('i1', Priority.INTERACTIVE), _Req('n2', Priority.NORMAL)]
+        for r in reqs:
+            s.push(r)
+        self.assertEqual(s.depth(), dict(interactive=1, normal=2, bulk=2))
+        self.assertTrue(s.remove(reqs[1]))
+        self.assertFalse(s.remove(reqs[1]))
+        self.assertEqual([s.pop().name for i in range(len(s))], ['i1', 'n2', 'b1', 'b2'])
+        self.assertIsNone(s.pop())
+    
+    def test_priority(self):
+        s = Scheduler(priorities={('nfc', 'read'): Priority.BULK})
+        self.assertEqual(s.priority('system', 'buzzer'), Priority.INTERACTIVE)
+        self.assertEqual(s.priority('system', 'download'), Priority.BULK)
+        self.assertEqual(s.priority('nfc', 'read'), Priority.BULK)
+        self.assertEqual(s.priority('nfc', 'apdu_transfer'), Priority.NORMAL)
+        with s.using(Priority.BULK):
+            self.assertEqual(s.priority('system', 'buzzer'), Priority.BULK)
+            with s.using(Priority.INTERACTIVE):
+                self.assertEqual(s.current(), Priority.INTERACTIVE)
+            self.assertEqual(s.current(), Priority.BULK)
+        self.assertIsNone(s.current())
+        self.assertEqual(s.priority('nfc', 'apdu_transfer', Priority.INTERACTIVE), Priority.INTERACTIVE)
+    
+    def test_interactive_first(self):
+        dev = SimulatedDevice(latency=0.005)
+        dev.place(VirtualTag.iso_dep(apdu=lambda c: c + b'\x90\x00'))
+        nfc = Command()
+        nfc.open(dev)
+        self.addCleanup(nfc.close)
+        nfc.discovery()
+        
+        with nfc.priority(Priority.BULK):
+            bulk = [nfc.submit(nfc.apdu_tranceive, bytes((i,))) for i in range(20)]
+        done = list()
+        buzzer = nfc.submit(nfc.buzzer, 1, 100)
+        buzzer.add_done_callback(lambda f: done.append(sum(1 for b in bulk if b.done())))
+        self.assertEqual(buzzer.result(1.0), STATUS.SUCCESS)
+        for i, f in enumerate(bulk):
+            self.assertEqual(f.result(2.0)['data'], bytes((i,)) + b'\x90\x00')
+        # the buzzer went right after the apdu on the wire when it was submitted.
+        self.assertLessEqual(done[0], 2)
+        
+        wait = nfc.metrics.snapshot()['queue_wait']
+        self.assertEqual(wait['bulk']['count'], 20)
+        self.assertEqual(wait['interactive']['count'], 1)
+        self.assertGreater(wait['bulk']['max'], wait['interactive']['max'])
+        self.assertIn('sisoulnfc_queue_wait_seconds_count{reader="%s",priority="bulk"} 20' % dev.serial,
+                      nfc.metrics.prometheus())
+        self.assertEqual(nfc.metrics.snapshot()['gauges']['queue_depth'], dict(interactive=0, normal=0, bulk=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import unittest
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class SimulatorTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dev = SimulatedDevice(latency=0.0, seed=1)
+        self.nfc = Command()
+        self.nfc.TIME_OUT = 0.2
+        self.found = threading.Event()
+        self.lost = threading.Event()
+        self.uid = None
+        
+        def discovery(status, d):
+            if status == STATUS.SUCCESS:
+                self.uid = d['uid']
+                self.found.set()
+            elif status == STATUS.LOST_REMOTE_DEVICE:
+                self.lost.set()
+        
+        self.nfc.set_callbacks(discovery=discovery)
+        self.nfc.open(self.dev)
+        self.addCleanup(self.nfc.close)
+    
+    def test_info(self):
+        info = self.nfc.get_dev_info()
+        self.assertEqual(info['status'], STATUS.SUCCESS)
+        self.assertEqual(info['name'], 'SMCP-IV')
+        self.assertEqual((info['major'], info['minor'], info['build']), SimulatedDevice.VERSION)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+    
+    def test_discovery(self):
+        self.assertEqual(self.nfc.read(0)['status'], STATUS.LOST_REMOTE_DEVICE)
+        tag = VirtualTag(ndef=b'\xD1\x01\x01T')
+        self.dev.place(tag)
+        self.assertEqual(self.nfc.discovery(), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.discovery(), STATUS.REJECT_COMMAND)
+        self.assertTrue(self.found.wait(1.0))
+        self.assertEqual(self.uid, tag.uid)
+        
+        self.assertEqual(self.nfc.write(4, b'\x01\x02\x03\x04'), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.read(4)['data'], b'\x01\x02\x03\x04')
+        self.assertEqual(self.nfc.ndef_write(b'\xD1\x01\x01U'), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.ndef_read()['ndef'], b'\xD1\x01\x01U')
+        
+        self.dev.remove()
+        self.assertTrue(self.lost.wait(1.0))
+    
+    def test_mifare(self):
+        tag = VirtualTag.mifare_classic()
+        tag.keys[1] = (1, b'\xFF' * 6)
+        tag.set_value(5, 100)
+        self.dev.place(tag)
+        self.nfc.discovery()
+        self.assertEqual(self.nfc.mifare_read(5)['status'], STATUS.NOT_AUTH)
+        self.assertEqual(self.nfc.mifare_auth(5, 1, b'\x00' * 6), STATUS.FROM_REMOTE_DEVICE)
+        self.assertEqual(self.nfc.mifare_auth(5, 1, b'\xFF' * 6), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.mifare_increment(5, 20), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.mifare_transfer(5), STATUS.SUCCESS)
+        self.assertEqual(tag.value(5), 120)
+        self.assertEqual(self.nfc.mifare_decrement(5, 30), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.mifare_transfer(5), STATUS.SUCCESS)
+        self.assertEqual(tag.value(5), 90)
+        self.assertEqual(self.nfc.mifare_write(6, bytes(range(16))), STATUS.SUCCESS)
+        self.assertEqual(self.nfc.mifare_read(6)['data'], bytes(range(16)))
+    
+    def test_apdu(self):
+        self.dev.place(VirtualTag.iso_dep(apdu=lambda c: c[::-1] + b'\x90\x00'))
+        self.nfc.discovery()
+        r = self.nfc.apdu_tranceive(b'\x00\xA4\x04\x00')
+        self.assertEqual(r['status'], STATUS.SUCCESS)
+        self.assertEqual(r['data'], b'\x00\x04\xA4\x00\x90\x00')
+    
+    def test_errors(self):
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TIMED_OUT)
+        self.dev.inject(SimulatedDevice.BCC)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TIMED_OUT)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+        self.dev.inject(SimulatedDevice.IO)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TRANSACTION_ERROR)
+        self.assertEqual(self.dev.errors, 3)
+    
+    def test_hid(self):
+        self.dev.hid = True
+        self.dev.place(VirtualTag.iso_dep(apdu=lambda c: c + b'\x90\x00'))
+        self.nfc.discovery()
+        capdu = bytes(range(256)) * 2
+        self.assertEqual(self.nfc.apdu_tranceive(capdu)['data'], capdu + b'\x90\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
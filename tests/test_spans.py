@@ -0,0 +1,71 @@
+import io
+import json
+import threading
+import unittest
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+from pysisoulnfc.spans import SpanTracer
+
+
+class SpanTracerTests(unittest.TestCase):
+    
+    def test_chrome_trace(self):
+        spans = SpanTracer(size=2, name='test')
+        with spans.span('a', args=dict(n=1)):
+            pass
+        spans.add('b', 1000, 3500, 'device')
+        spans.add('c', 4000, 5000)
+        self.assertEqual([s[0] for s in spans.spans()], ['b', 'c'])
+        
+        f = io.StringIO()
+        spans.dump(f)
+        trace = json.loads(f.getvalue())
+        events = trace['traceEvents']
+        self.assertEqual(events[0]['args'], dict(name='test'))
+        self.assertEqual(events[1]['args'], dict(name=threading.current_thread().name))
+        self.assertEqual(events[2], dict(name='b', cat='device', ph='X', pid=1, tid=threading.get_ident(), ts=1.0,
+                                         dur=2.5))
+    
+    def test_wrap(self):
+        spans = SpanTracer()
+        queued = spans.now()
+        self.assertEqual(spans.wrap('callback.x', lambda a: a + 1, queued)(1), 2)
+        self.assertEqual([s[0] for s in spans.spans()], ['event.queue', 'callback.x'])
+    
+    def test_command(self):
+        spans = SpanTracer()
+        nfc = Command(spans=spans)
+        nfc.TIME_OUT = 0.1
+        dev = SimulatedDevice(latency=0.0)
+        found = threading.Event()
+        nfc.set_callbacks(discovery=lambda status, d: found.set())
+        nfc.open(dev)
+        try:
+            nfc.buzzer(1, 100)
+            names = [s[0] for s in spans.spans()]
+            self.assertEqual(names[-1], 'system.buzzer')
+            for name in ('encode', 'device.write', 'firmware', 'rx.decode', 'handoff'):
+                self.assertIn(name, names)
+            
+            spans.clear()
+            dev.inject(SimulatedDevice.TIMEOUT)
+            nfc.buzzer(1, 100)
+            names = [s[0] for s in spans.spans()]
+            self.assertIn('wait', names)
+            self.assertNotIn('firmware', names)
+            
+            dev.place(VirtualTag())
+            nfc.discovery()
+            self.assertTrue(found.wait(1.0))
+        finally:
+            nfc.close()
+        names = [s[0] for s in spans.spans()]
+        self.assertIn('event.queue', names)
+        self.assertIn('callback.discovery', names)
+        for name, cat, start, end, tid, args in spans.spans():
+            self.assertLessEqual(start, end, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
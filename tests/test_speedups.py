@@ -0,0 +1,133 @@
+import importlib.util
+import os
+import unittest
+from unittest import mock
+
+from pysisoulnfc import speedups
+
+try:
+    from pysisoulnfc import _speedups
+except ImportError:
+    _speedups = None
+
+
+def pure_speedups():
+    # the pure Python helpers, even when the compiled ones replaced them in speedups.
+    with mock.patch.dict(os.environ, PYSISOULNFC_PURE_PYTHON='1'):
+        spec = importlib.util.spec_from_file_location('pysisoulnfc._pure_speedups', speedups.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+def outcome(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return type(e), str(e)
+
+
+def reference_reports(cid, data, prefix=0):
+    reports = []
+    hid_msg = [0xD0, ] + list(len(data).to_bytes(2, 'big')) + list(data)
+    seq = 0
+    while len(hid_msg) > 0:
+        hid_msg = list(cid) + hid_msg
+        if len(hid_msg) > 64:
+            send_msg = hid_msg[:64]
+            hid_msg = [seq, ] + hid_msg[64:]
+            seq = (seq + 1) & 0x7F
+        else:
+            send_msg = hid_msg + [0] * (64 - len(hid_msg))
+            hid_msg = []
+        reports.append(bytes([0] * prefix + send_msg))
+    return reports
+
+
+class SpeedupsTests(unittest.TestCase):
+    
+    def test_implementation(self):
+        self.assertIn(speedups.IMPLEMENTATION, ('cython', 'python'))
+    
+    def test_bcc(self):
+        for size in (0, 1, 9, 127, 128, 129, 1000, 4096):
+            data = os.urandom(size)
+            expected = 0
+            for b in data:
+                expected ^= b
+            self.assertEqual(speedups.bcc(data), expected)
+            self.assertEqual(speedups.bcc(bytearray(data), 0x5A), expected ^ 0x5A)
+    
+    def test_header(self):
+        h = speedups.pack_header(0x01, 0xE9, 0x32, 0x01020304, 0x04, 0x00)
+        self.assertEqual(h, b'\x01\xE9\x32\x04\x00\x04\x03\x02\x01')
+        self.assertEqual(speedups.unpack_header(h), (0x01, 0xE9, 0x32, 0x04, 0x00, 0x01020304, 9))
+        h = speedups.pack_header(0x02, 0xD9, 0x23, 36, 0x00)
+        self.assertEqual(speedups.unpack_header(h + b'\x00'), (0x02, 0xD9, 0x23, 0x00, None, 36, 8))
+        with self.assertRaises(ValueError):
+            speedups.unpack_header(b'\x01\xE9\x32')
+    
+    def test_hid_fragment(self):
+        cid = b'\x11\x22\x33\x44'
+        for size in (0, 57, 58, 116, 117, 4096):
+            data = os.urandom(size)
+            for prefix in (0, 1):
+                expected = reference_reports(cid, data, prefix)
+                out = bytearray(speedups.hid_report_count(size) * (64 + prefix))
+                self.assertEqual(speedups.hid_fragment(out, cid, data, 64, prefix), len(expected))
+                self.assertEqual(bytes(out), b''.join(expected))
+    
+    def test_hid_reassemble(self):
+        cid = b'\x11\x22\x33\x44'
+        data = os.urandom(4096)
+        reassembler = speedups.HidReassembler(cid)
+        reports = reference_reports(cid, data)
+        for r in reports[:-1]:
+            self.assertIsNone(reassembler.feed(list(r)))
+        self.assertEqual(reassembler.feed(list(reports[-1])), data)
+        with self.assertRaises(ValueError):
+            reassembler.feed(b'\x00' * 64)
+        with self.assertRaises(ValueError):
+            reassembler.feed([0] * 64)
+        # reports of other types are copied as they are as well.
+        for kind in (bytes, bytearray, memoryview):
+            for r in reports[:-1]:
+                self.assertIsNone(reassembler.feed(kind(r)))
+            self.assertEqual(reassembler.feed(kind(reports[-1])), data)
+    
+    def test_hid_sequence(self):
+        cid = b'\x11\x22\x33\x44'
+        data = os.urandom(200)
+        reassembler = speedups.HidReassembler(cid)
+        reports = reference_reports(cid, data)
+        reassembler.feed(reports[0])
+        with self.assertRaises(ValueError):
+            reassembler.feed(reports[2])
+        for r in reports[:-1]:
+            self.assertIsNone(reassembler.feed(r))
+        self.assertEqual(reassembler.feed(reports[-1]), data)
+    
+    def test_malformed_reports(self):
+        cid = b'\x11\x22\x33\x44'
+        reports = [b'', cid[:3], cid, cid + b'\xD0', cid + b'\xD0\x00', cid + b'\x00\x00\x01', b'\x00' * 7,
+                   cid + b'\xD0\x00\x01']
+        reports += [list(r) for r in reports]
+        implementations = [pure_speedups()]
+        if _speedups is not None:
+            implementations.append(_speedups)
+        results = [[outcome(m.HidReassembler(cid).feed, r) for r in reports] for m in implementations]
+        for r, result in zip(reports, results[0]):
+            if len(r) < 7 or bytes(r[:5]) != cid + b'\xD0':
+                self.assertEqual(result[0], ValueError, r)
+        # the compiled and the pure Python versions fail the same way, DeviceHid only catches ValueError.
+        for other in results[1:]:
+            self.assertEqual(other, results[0])
+        bccs = [[outcome(m.bcc, data) for data in (b'\x01\x02', [1, 2], bytearray(3), None)] for m in implementations]
+        self.assertEqual(bccs[0][:3], [3, 3, 0])
+        for other in bccs[1:]:
+            self.assertEqual([b if isinstance(b, int) else b[0] for b in other],
+                             [b if isinstance(b, int) else b[0] for b in bccs[0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.retry import RetryPolicy
+from pysisoulnfc.simulator import SimulatedDevice, VirtualTag
+
+STATUS = Command.STATUS
+
+
+class SubmitTests(unittest.TestCase):
+    
+    def open(self, **kwargs):
+        self.dev = SimulatedDevice(latency=0.0005, jitter=0.0005, seed=1)
+        self.dev.place(VirtualTag.iso_dep(apdu=lambda c: c + b'\x90\x00'))
+        self.nfc = Command(**kwargs)
+        self.nfc.open(self.dev)
+        self.addCleanup(self.nfc.close)
+        self.nfc.discovery()
+    
+    def test_submit(self):
+        self.open()
+        futures = [self.nfc.submit(self.nfc.apdu_tranceive, bytes((i,))) for i in range(10)]
+        futures.append(self.nfc.submit('get_dev_info'))
+        for i, f in enumerate(futures[:-1]):
+            self.assertEqual(f.result(1.0), dict(status=STATUS.SUCCESS, data=bytes((i,)) + b'\x90\x00'))
+        self.assertEqual(futures[-1].result(1.0)['name'], 'SMCP-IV')
+        self.assertEqual(self.nfc.submit(self.nfc.buzzer, 0, 100).result(1.0), STATUS.INVALID_PARAM)
+        self.assertRaises(ValueError, self.nfc.submit, 'close')
+    
+    def test_threads(self):
+        self.open()
+        errors = list()
+        
+        def worker(n):
+            for i in range(30):
+                capdu = bytes((n, i))
+                r = self.nfc.apdu_tranceive(capdu)
+                if r.get('data') != capdu + b'\x90\x00':
+                    errors.append((capdu, r))
+                if self.nfc.buzzer(1, 100) != STATUS.SUCCESS:
+                    errors.append((n, i, 'buzzer'))
+        
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+    
+    def test_late_response(self):
+        self.open()
+        self.dev.latency = 0.05
+        self.assertEqual(self.nfc.buzzer(1, 100, timeout=0.01), STATUS.TIMED_OUT)
+        # the buzzer response comes in while waiting for this one, and is dropped.
+        info = self.nfc.get_dev_info(timeout=1.0)
+        self.assertEqual(info['status'], STATUS.SUCCESS)
+        self.assertEqual(self.nfc.metrics.snapshot()['counters']['stray_responses'], 1)
+    
+    def test_submit_timeout(self):
+        self.open()
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        start = time.perf_counter()
+        f = self.nfc.submit(self.nfc.buzzer, 1, 100, timeout=0.02)
+        self.assertEqual(f.result(1.0), STATUS.TIMED_OUT)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+    
+    def test_submit_retry(self):
+        self.open(retry=RetryPolicy(base=0.001, budget=1.0, seed=1))
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        r = self.nfc.submit(self.nfc.get_dev_info, timeout=0.02).result(1.0)
+        self.assertEqual((r['status'], r['retries']), (STATUS.SUCCESS, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
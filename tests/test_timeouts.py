@@ -0,0 +1,88 @@
+import time
+import unittest
+from unittest import mock
+
+from pysisoulnfc.nfc import Command
+from pysisoulnfc.simulator import SimulatedDevice
+from pysisoulnfc.timeouts import Timeouts
+
+STATUS = Command.STATUS
+
+
+class TimeoutsTests(unittest.TestCase):
+    
+    def test_get(self):
+        t = Timeouts({'nfc': 3.0, ('nfc', 'apdu_transfer'): 5.0})
+        self.assertEqual(t.get('nfc', 'apdu_transfer', 20), 5.0)
+        self.assertEqual(t.get('nfc', 'read', 20), 3.0)
+        self.assertEqual(t.get('system', 'info', 20), Timeouts.DEFAULTS['system', 'info'])
+        self.assertEqual(t.get('system', 'buzzer', 20), 20)
+        t.set('nfc', None)
+        self.assertEqual(t.get('nfc', 'read', 20), 20)
+        self.assertRaises(ValueError, t.set, 'nfc', 0)
+    
+    def test_adaptive(self):
+        t = Timeouts(adaptive=True, percentile=90, factor=2.0, minimum=0.01, min_samples=10)
+        for i in range(9):
+            t.observe('nfc', 'read', 0.1)
+        self.assertEqual(t.get('nfc', 'read', 20), 20)
+        t.observe('nfc', 'read', 0.1)
+        self.assertAlmostEqual(t.get('nfc', 'read', 20), 0.2)
+        # never longer than the configured timeout.
+        self.assertEqual(t.get('nfc', 'read', 0.15), 0.15)
+        self.assertEqual(t.adapted(), {'nfc.read': 0.2})
+        self.assertEqual(t.expected('nfc', 'read'), 0.1)
+        self.assertIsNone(t.expected('nfc', 'apdu_transfer'))
+        t.reset()
+        self.assertEqual(t.get('nfc', 'read', 20), 20)
+        self.assertIsNone(t.expected('nfc', 'read'))
+
+
+class CommandTimeoutTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.dev = SimulatedDevice(latency=0.0)
+        self.nfc = Command(timeouts=Timeouts(adaptive=True, minimum=0.05, min_samples=10))
+        self.nfc.open(self.dev)
+        self.addCleanup(self.nfc.close)
+    
+    def test_per_call(self):
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        start = time.perf_counter()
+        self.assertEqual(self.nfc.buzzer(1, 100, timeout=0.05), STATUS.TIMED_OUT)
+        self.assertLess(time.perf_counter() - start, 1.0)
+    
+    def test_queued(self):
+        dev = SimulatedDevice('SIM00002', latency=0.2)
+        nfc = Command()
+        nfc.open(dev)
+        self.addCleanup(nfc.close)
+        slow = nfc.submit(nfc.buzzer, 1, 100)
+        behind = nfc.submit(nfc.buzzer, 1, 100, timeout=0.05)
+        # the timeout counts from the call, not from when the command is written.
+        start = time.perf_counter()
+        self.assertEqual(nfc.get_dev_info(timeout=0.05)['status'], STATUS.TIMED_OUT)
+        self.assertLess(time.perf_counter() - start, 0.15)
+        self.assertEqual(nfc.scheduler.depth()['normal'], 0)
+        self.assertEqual(slow.result(1.0), STATUS.SUCCESS)
+        # its time ran out while the slow one was on the wire, it's never written.
+        self.assertEqual(behind.result(1.0), STATUS.TIMED_OUT)
+        self.assertEqual(nfc.metrics.snapshot()['counters']['frames_out'], 1)
+    
+    def test_adaptive(self):
+        for i in range(10):
+            self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+        self.assertLess(self.nfc.timeouts.get('system', 'buzzer', self.nfc.TIME_OUT), 1.0)
+        # the port is told how long the response should take.
+        with mock.patch.object(self.dev, 'expect') as expect:
+            self.assertEqual(self.nfc.buzzer(1, 100), STATUS.SUCCESS)
+        expect.assert_called_once_with(self.nfc.timeouts.expected('system', 'buzzer'))
+        self.assertIsNotNone(expect.call_args[0][0])
+        self.dev.inject(SimulatedDevice.TIMEOUT)
+        start = time.perf_counter()
+        self.assertEqual(self.nfc.buzzer(1, 100), STATUS.TIMED_OUT)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import io
+import unittest
+
+from pysisoulnfc.nfc import Message
+from pysisoulnfc.trace import Tracer, TraceLevel, TX, RX
+
+
+class TracerTests(unittest.TestCase):
+    
+    def setUp(self):
+        self.cmd = Message.command('nfc', 'read', b'\x04', b'\x00', b'\x01\x02').encode()
+        self.rsp = Message.response('nfc', 'read', 0, bytes(range(30))).encode()
+        self.err = Message.response('nfc', 'read', 0x16).encode()
+        self.info = Message.command('system', 'info').encode()
+    
+    def test_ring(self):
+        t = Tracer(size=4)
+        for i in range(10):
+            t.record(TX, self.cmd)
+        entries = t.entries()
+        self.assertEqual(len(entries), 4)
+        self.assertEqual([e[0] for e in entries], [6, 7, 8, 9])
+        self.assertEqual(len(t.entries(since=8)), 1)
+        self.assertIs(entries[0][3], self.cmd)
+    
+    def test_levels(self):
+        t = Tracer(level=TraceLevel.OFF)
+        self.assertIsNone(t.record(TX, self.cmd))
+        t.set_level(TraceLevel.ERROR)
+        self.assertIsNone(t.record(TX, self.cmd))
+        self.assertIsNone(t.record(RX, self.rsp))
+        self.assertIsNotNone(t.record(RX, self.err))
+        t.set_level(TraceLevel.HEADER)
+        self.assertEqual(len(t.record(RX, self.rsp)[3]), Message.RSP_HEADER_SIZE)
+        self.assertIn('not recorded', t.format_entry(t.entries()[-1]))
+    
+    def test_filter(self):
+        t = Tracer()
+        t.set_filter(('nfc', 'read'))
+        self.assertIsNone(t.record(TX, self.info))
+        self.assertIsNotNone(t.record(TX, self.cmd))
+        t.set_filter('system')
+        self.assertIsNotNone(t.record(TX, self.info))
+        self.assertIsNone(t.record(TX, self.cmd))
+        t.set_filter()
+        self.assertIsNotNone(t.record(TX, self.cmd))
+    
+    def test_format(self):
+        t = Tracer()
+        t.record(TX, self.cmd)
+        t.record(RX, self.rsp)
+        f = io.StringIO()
+        t.dump(f)
+        text = f.getvalue()
+        self.assertIn('tx    [CMD][NFC][READ][04][00]', text)
+        self.assertIn('rx    [RSP][NFC][READ][SUCCESS]', text)
+        self.assertIn('Payload(30): \n\t00 01 02', text)
+
+
+if __name__ == '__main__':
+    unittest.main()